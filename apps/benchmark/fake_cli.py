@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Fake CLIs for the orchestration benchmark (see run-benchmark.py)
+
+This script stands in for 'replicated', 'ionosctl', 'kubectl', 'helm' and 'git' (the tool is
+chosen by the name it is called by, the benchmark puts symlinks on the PATH) and for the test
+scripts of the operator repos ('run-tests', 'auto-retry-tests.py').
+
+Every call sleeps for the latency given by the scenario and answers like the real CLI would.
+Cloud resources are kept in a state file and change their state after the durations given
+by the scenario. All durations are multiplied by the time scale of the benchmark.
+
+Every call is recorded in the invocation log (one JSON object per line).
+
+Env vars (set by run-benchmark.py):
+
+FAKE_CLI_STATE_DIR      folder of the state file and the invocation log
+FAKE_CLI_SCENARIO       scenario file (JSON)
+BENCHMARK_TIME_SCALE    factor for all durations of the scenario
+"""
+
+import fcntl
+import json
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from time import perf_counter, sleep, time
+
+STATE_DIR = os.environ.get("FAKE_CLI_STATE_DIR", "/tmp/fake-cli")
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+INVOCATIONS_FILE = os.path.join(STATE_DIR, "invocations.jsonl")
+TIME_SCALE = float(os.environ.get("BENCHMARK_TIME_SCALE", "1"))
+
+# names of the fake tools
+TOOLS = ["replicated", "ionosctl", "kubectl", "helm", "git"]
+
+# number of leading words of a call which identify the command (in the invocation log)
+COMMAND_WORDS = {"ionosctl": 3}
+
+# IONOS resource types and the state they reach after creation
+IONOS_TARGET_STATES = {"datacenter": "AVAILABLE", "cluster": "ACTIVE", "nodepool": "ACTIVE"}
+
+# workloads deployed by the cluster logging: (namespace, resource)
+WORKLOADS = {
+    ("default", "daemonset/vector-agent"),
+    ("default", "statefulset/vector-aggregator"),
+    ("kube-system", "deployment/eventrouter"),
+}
+
+FAKE_KUBECONFIG = """apiVersion: v1
+kind: Config
+clusters:
+- cluster:
+    server: https://127.0.0.1:6443
+  name: fake
+contexts:
+- context:
+    cluster: fake
+    user: fake
+  name: fake
+current-context: fake
+users:
+- name: fake
+  user:
+    token: fake
+"""
+
+
+def use_state_dir(state_dir):
+    """
+    Switches to another state folder (used by the API stand-in of run-benchmark.py)
+    """
+    global STATE_DIR, STATE_FILE, INVOCATIONS_FILE
+    STATE_DIR = state_dir
+    STATE_FILE = os.path.join(STATE_DIR, "state.json")
+    INVOCATIONS_FILE = os.path.join(STATE_DIR, "invocations.jsonl")
+
+
+def read_scenario():
+    with open(os.environ["FAKE_CLI_SCENARIO"]) as f:
+        return json.load(f)
+
+
+def scaled(seconds):
+    return seconds * TIME_SCALE
+
+
+@contextmanager
+def locked_state():
+    """
+    Context manager which yields the (mutable) state, locked for other processes,
+    and writes it back afterwards
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(f"{STATE_FILE}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(STATE_FILE) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {"replicated": {}, "ionos": {t: {} for t in IONOS_TARGET_STATES}}
+        yield state
+        with open(f"{STATE_FILE}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{STATE_FILE}.tmp", STATE_FILE)
+
+
+def option(args, name, default=None):
+    """
+    Returns the value following the given option in the args
+    """
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return default
+
+
+def iso_timestamp(seconds):
+    return datetime.fromtimestamp(seconds, UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def new_id():
+    return uuid.uuid4().hex[0:8]
+
+
+def record_invocation(tool, args, duration, exit_code):
+    """
+    Appends the invocation to the invocation log
+    (single small appends are atomic, so concurrent calls don't need a lock)
+    """
+    words = []
+    for arg in args[0 : COMMAND_WORDS.get(tool, 2)]:
+        if arg.startswith("-") or "/" in arg:
+            break
+        words.append(arg)
+    entry = {
+        "tool": tool,
+        "command": " ".join([tool, *words]),
+        "start": time() - duration,
+        "duration": duration,
+        "exit_code": exit_code,
+    }
+    with open(INVOCATIONS_FILE, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+# --- replicated ---------------------------------------------------------------------------------
+
+
+def replicated_cluster_json(cluster, scenario):
+    """
+    Returns the cluster as JSON object of the Replicated CLI/API (or None if it's deleted)
+    """
+    if cluster["deleted_at"]:
+        return None
+    running = time() - cluster["created_at"] >= scaled(scenario["replicated"]["running_after"])
+    return {
+        "id": cluster["id"],
+        "name": cluster["name"],
+        "distribution": cluster["distribution"],
+        "version": cluster["version"],
+        "status": "running" if running else "provisioning",
+        "created_at": iso_timestamp(cluster["created_at"]),
+    }
+
+
+def replicated_api_get_cluster(id):
+    """
+    Answers GET /cluster/<id> of the Vendor API (used by the API stand-in of run-benchmark.py)
+
+    Returns tuple (HTTP status, JSON document)
+    """
+    scenario = read_scenario()
+    sleep(scaled(scenario["replicated"]["api"]))
+    with locked_state() as state:
+        cluster = state["replicated"].get(id)
+    document = replicated_cluster_json(cluster, scenario) if cluster else None
+    if not document:
+        return 404, {"error": "not found"}
+    return 200, {"cluster": document}
+
+
+def replicated(args, scenario):
+    latencies = scenario["replicated"]
+    if args[0:2] == ["cluster", "create"]:
+        sleep(scaled(latencies["create"]))
+        cluster = {
+            "id": new_id(),
+            "name": option(args, "--name"),
+            "distribution": option(args, "--distribution"),
+            "version": option(args, "--version"),
+            "created_at": time(),
+            "deleted_at": None,
+        }
+        with locked_state() as state:
+            state["replicated"][cluster["id"]] = cluster
+        print(json.dumps([replicated_cluster_json(cluster, scenario)]))
+        return 0
+    if args[0:2] == ["cluster", "ls"]:
+        sleep(scaled(latencies["ls"]))
+        with locked_state() as state:
+            clusters = [replicated_cluster_json(c, scenario) for c in state["replicated"].values()]
+        print(json.dumps([c for c in clusters if c]))
+        return 0
+    if args[0:2] == ["cluster", "kubeconfig"]:
+        sleep(scaled(latencies["kubeconfig"]))
+        with open(option(args, "--output-path"), "w") as f:
+            f.write(FAKE_KUBECONFIG)
+        return 0
+    if args[0:2] == ["cluster", "rm"]:
+        sleep(scaled(latencies["rm"]))
+        name = option(args, "--name")
+        with locked_state() as state:
+            clusters = [c for c in state["replicated"].values() if c["name"] == name]
+            for cluster in clusters:
+                cluster["deleted_at"] = time()
+        if not clusters:
+            print(f"Error: cluster {name} not found", file=sys.stderr)
+            return 1
+        return 0
+    print(f"fake replicated: unsupported command {args}", file=sys.stderr)
+    return 1
+
+
+# --- ionosctl -----------------------------------------------------------------------------------
+
+
+def ionos_resource_json(resource_type, resource, scenario):
+    """
+    Returns the resource as JSON object of ionosctl (or None if it's gone)
+    """
+    now = time()
+    if resource["deleted_at"]:
+        if now - resource["deleted_at"] >= scaled(
+            scenario["ionos"][f"{resource_type}_deleted_after"]
+        ):
+            return None
+        state = "DESTROYING"
+    elif now - resource["created_at"] >= scaled(scenario["ionos"][f"{resource_type}_ready_after"]):
+        state = IONOS_TARGET_STATES[resource_type]
+    else:
+        state = "DEPLOYING"
+    return {
+        "id": resource["id"],
+        "properties": {"name": resource["name"]},
+        "metadata": {"state": state, "createdDate": iso_timestamp(resource["created_at"])},
+    }
+
+
+def ionosctl(args, scenario):
+    latencies = scenario["ionos"]
+    resource_type = "datacenter" if args[0] == "datacenter" else args[1]
+    verb = args[1] if args[0] == "datacenter" else args[2]
+
+    if args[0:3] == ["k8s", "kubeconfig", "get"]:
+        sleep(scaled(latencies["kubeconfig"]))
+        print(FAKE_KUBECONFIG)
+        return 0
+    if resource_type not in IONOS_TARGET_STATES:
+        print(f"fake ionosctl: unsupported command {args}", file=sys.stderr)
+        return 1
+
+    if verb == "create":
+        sleep(scaled(latencies["create"]))
+        resource = {
+            "id": str(uuid.uuid4()),
+            "name": option(args, "--name"),
+            "cluster_id": option(args, "--cluster-id"),
+            "created_at": time(),
+            "deleted_at": None,
+        }
+        with locked_state() as state:
+            state["ionos"][resource_type][resource["id"]] = resource
+        print(json.dumps(ionos_resource_json(resource_type, resource, scenario)))
+        return 0
+    if verb == "list":
+        sleep(scaled(latencies["list"]))
+        cluster_id = option(args, "--cluster-id")
+        with locked_state() as state:
+            items = [
+                ionos_resource_json(resource_type, r, scenario)
+                for r in state["ionos"][resource_type].values()
+                if cluster_id is None or r["cluster_id"] == cluster_id
+            ]
+        print(json.dumps({"type": "collection", "items": [i for i in items if i]}))
+        return 0
+    if verb == "delete":
+        sleep(scaled(latencies["delete"]))
+        id = option(args, f"--{resource_type}-id")
+        with locked_state() as state:
+            resource = state["ionos"][resource_type].get(id)
+            if resource:
+                resource["deleted_at"] = time()
+        if not resource:
+            print(f"Error: {resource_type} {id} not found", file=sys.stderr)
+            return 1
+        return 0
+    print(f"fake ionosctl: unsupported command {args}", file=sys.stderr)
+    return 1
+
+
+# --- kubectl, helm, git, test scripts -----------------------------------------------------------
+
+
+def nodes_registered(scenario):
+    """
+    Returns True if the nodes of the cluster have registered, i.e. the kubeconfig has been
+    written more than 'nodes_registered_after' seconds ago
+    """
+    try:
+        written = os.path.getmtime(os.environ.get("KUBECONFIG", ""))
+    except OSError:
+        return False
+    return time() - written >= scaled(scenario["kubectl"]["nodes_registered_after"])
+
+
+def kubectl(args, scenario):
+    latencies = scenario["kubectl"]
+    if args[0] == "wait":
+        if "nodes" in args and not nodes_registered(scenario):
+            sleep(scaled(latencies["default"]))
+            print("error: no matching resources found", file=sys.stderr)
+            return 1
+        sleep(scaled(latencies["wait"]))
+        print("node/fake-node-1 condition met")
+        return 0
+    if args[0:2] == ["rollout", "status"]:
+        sleep(scaled(latencies["rollout"]))
+        namespace = option(args, "-n", "default")
+        resource = next(a for a in args[2:] if "/" in a)
+        if (namespace, resource) not in WORKLOADS:
+            kind, name = resource.split("/")
+            print(f'Error from server (NotFound): {kind}s.apps "{name}" not found', file=sys.stderr)
+            return 1
+        print(f"{resource} successfully rolled out")
+        return 0
+    sleep(scaled(latencies["default"]))
+    if args[0:2] == ["get", "nodes"]:
+        if not nodes_registered(scenario):
+            print("No resources found", file=sys.stderr)
+        elif option(args, "-o", None) == "name":
+            print("node/fake-node-1")
+        else:
+            print("NAME          STATUS   ROLES    AGE   VERSION")
+            print("fake-node-1   Ready    <none>   1m    v1.33.0")
+        return 0
+    if args[0:2] == ["get", "--raw"]:
+        # GraphQL API of the Vector aggregator: number of sent events doesn't change (drained)
+        metrics = {"sentEventsTotal": {"sentEventsTotal": 42}}
+        node = {"componentId": "opensearch", "metrics": metrics}
+        print(json.dumps({"data": {"sinks": {"edges": [{"node": node}]}}}))
+        return 0
+    print(f"{args[0]} done")
+    return 0
+
+
+def helm(args, scenario):
+    verb = args[0]
+    if verb == "install" and "--wait" not in args:
+        # without --wait, helm returns as soon as the release is created
+        verb = "default"
+    sleep(scaled(scenario["helm"].get(verb, scenario["helm"]["default"])))
+    if verb == "pull":
+        chart = args[1].rstrip("/").split("/")[-1]
+        chart_file = f"{chart}-{option(args, '--version')}.tgz"
+        with open(os.path.join(option(args, "--destination"), chart_file), "wb") as f:
+            f.write(b"fake chart")
+        return 0
+    print(f"NAME: {args[1] if len(args) > 1 else ''}")
+    print("STATUS: deployed")
+    return 0
+
+
+def git(args, scenario):
+    sleep(scaled(scenario["git"]["clone"]))
+    if args[0] != "clone":
+        return 0
+    repo = os.path.basename(args[-1]).removesuffix(".git")
+    scripts_folder = os.path.join(repo, "scripts")
+    os.makedirs(scripts_folder, exist_ok=True)
+    # the test scripts of the repo call this script again
+    for script in ["run-tests", "auto-retry-tests.py"]:
+        with open(os.path.join(scripts_folder, script), "w") as f:
+            f.write(
+                "import os, sys\n"
+                f"os.execv(sys.executable, [sys.executable, {os.path.realpath(__file__)!r}, "
+                f"{script!r}, *sys.argv[1:]])\n"
+            )
+    print(f"Cloning into '{repo}'...")
+    return 0
+
+
+def test_script(args, scenario):
+    if "--skip-tests" in args:
+        sleep(scaled(scenario["tests"]["install_sdp"]))
+        print(f"SDP installed (Helm cache: {os.environ.get('HELM_CACHE_HOME', 'default')})")
+        return 0
+    for i in range(10):
+        sleep(scaled(scenario["tests"]["run"]) / 10)
+        print(f"--- PASS: test-{i}")
+    return 0
+
+
+FAKES = {
+    "replicated": replicated,
+    "ionosctl": ionosctl,
+    "kubectl": kubectl,
+    "helm": helm,
+    "git": git,
+    "run-tests": test_script,
+    "auto-retry-tests.py": test_script,
+}
+
+
+if __name__ == "__main__":
+    tool = os.path.basename(sys.argv[0])
+    args = sys.argv[1:]
+    if tool not in FAKES:
+        tool, args = args[0], args[1:]
+    start = perf_counter()
+    exit_code = FAKES[tool](args, read_scenario())
+    sys.stdout.flush()
+    record_invocation(tool, args, perf_counter() - start, exit_code)
+    sys.exit(exit_code)
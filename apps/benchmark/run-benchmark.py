@@ -0,0 +1,389 @@
+"""
+End-to-end benchmark of the orchestration done by the Operator Test Runner
+
+Runs operator-test-runner.py against fake 'replicated', 'ionosctl', 'kubectl', 'helm' and
+'git' executables (see fake_cli.py) with scripted latencies and state transitions, so that
+the overhead of the runner itself can be measured without paying for real clusters.
+
+For every platform, the runner is executed a number of rounds. The benchmark reports
+the wall time, the number of CLI invocations (per command) and the latency of the phases
+(from the runner's timings.json), and writes them to a JSON report which can serve
+as baseline for later runs.
+
+All durations of the scenario (and all sleeps of the runner) are multiplied by the time scale,
+so that a run takes seconds instead of an hour. The scenario can be adjusted with a JSON file
+which is merged into the default scenario.
+
+With --pool, the runner leases its cluster from a warm cluster pool, which is refilled
+(with cluster-pool.py) before every round. The refill isn't part of the measured wall time
+and the invocations, and a round fails if the runner didn't lease the cluster.
+
+    python run-benchmark.py [--platform replicated-kind] [--rounds 3] [--time-scale 0.01]
+                            [--scenario scenario.json] [--output report.json]
+                            [--baseline previous-report.json] [--pool]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+CATALOG_FOLDER = os.path.join(BENCHMARK_FOLDER, "..", "..", "catalog")
+FAKE_CLI = os.path.join(BENCHMARK_FOLDER, "fake_cli.py")
+SCALED_RUNNER = os.path.join(BENCHMARK_FOLDER, "scaled-runner.py")
+
+sys.path.insert(0, os.path.join(BENCHMARK_FOLDER, "..", "src"))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+import fake_cli  # noqa: E402
+from modules.catalog import Catalog  # noqa: E402
+
+# durations [seconds] of the fake CLIs, roughly what we see in reality
+DEFAULT_SCENARIO = {
+    "replicated": {
+        "create": 3,
+        "ls": 2,
+        "api": 0.5,
+        "kubeconfig": 2,
+        "rm": 2,
+        "running_after": 240,
+    },
+    "ionos": {
+        "create": 2,
+        "list": 1.5,
+        "delete": 2,
+        "kubeconfig": 1.5,
+        "datacenter_ready_after": 30,
+        "cluster_ready_after": 600,
+        "nodepool_ready_after": 900,
+        "datacenter_deleted_after": 60,
+        "cluster_deleted_after": 300,
+        "nodepool_deleted_after": 300,
+    },
+    "kubectl": {"default": 0.5, "wait": 20, "rollout": 30, "nodes_registered_after": 30},
+    "helm": {"install": 40, "pull": 5, "default": 1},
+    "git": {"clone": 5},
+    "tests": {"install_sdp": 120, "run": 600},
+}
+
+DEFAULT_PLATFORMS = ["replicated-kind", "ionos-k8s"]
+
+
+def merge(base, override):
+    """
+    Returns the base dict merged (deep) with the override dict
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merged[key] = merge(base[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class ReplicatedApiHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Vendor API of replicated.com (GET /cluster/<id>)
+    """
+
+    def do_GET(self):
+        status, document = fake_cli.replicated_api_get_cluster(self.path.rsplit("/", 1)[-1])
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def prepare_work_folder(work_folder, scenario):
+    """
+    Creates the fake CLIs, the catalog and the scenario file in the work folder.
+
+    Returns the folder containing the fake CLIs
+    """
+    bin_folder = os.path.join(work_folder, "bin")
+    os.makedirs(bin_folder)
+    os.chmod(FAKE_CLI, 0o755)
+    for tool in fake_cli.TOOLS:
+        os.symlink(FAKE_CLI, os.path.join(bin_folder, tool))
+    for file in ["platforms.yaml", "operator-tests.yaml"]:
+        shutil.copy(os.path.join(CATALOG_FOLDER, file), work_folder)
+    with open(os.path.join(work_folder, "scenario.json"), "w") as f:
+        json.dump(scenario, f, indent=4)
+    return bin_folder
+
+
+def select_test(catalog, platform_id):
+    """
+    Returns tuple (operator test, platform version) to be run on the given platform
+    """
+    platform = catalog.get_platform(platform_id)
+    if not platform:
+        raise SystemExit(f"The platform '{platform_id}' does not exist.")
+    for operator_test in catalog.operator_tests:
+        if any(p["id"] == platform["id"] for p in operator_test.get("platforms", [])):
+            return operator_test["id"], str(platform["versions"][0])
+    raise SystemExit(f"There is no operator test for the platform '{platform_id}'.")
+
+
+def run_round(work_folder, bin_folder, platform, operator, platform_version, args, api_url):
+    """
+    Executes the runner once.
+
+    Returns dict with the results of the round
+    """
+    round_folder = tempfile.mkdtemp(prefix="round_", dir=work_folder)
+    target_folder = os.path.join(round_folder, "target", "")
+    run_folder = os.path.join(round_folder, "run")
+    state_folder = os.path.join(round_folder, "state")
+    for folder in [target_folder, run_folder, state_folder]:
+        os.makedirs(folder)
+    # (the API stand-in reads the state of the current round)
+    fake_cli.use_state_dir(state_folder)
+
+    env = {
+        **os.environ,
+        "PATH": f"{bin_folder}{os.pathsep}{os.environ.get('PATH', '')}",
+        "BENCHMARK_TIME_SCALE": str(args.time_scale),
+        "FAKE_CLI_STATE_DIR": state_folder,
+        "FAKE_CLI_SCENARIO": os.path.join(work_folder, "scenario.json"),
+        "CATALOG_FOLDER": work_folder,
+        "TEMPLATE_CACHE_FOLDER": os.path.join(work_folder, "jinja-cache"),
+        "CHART_CACHE_DIR": os.path.join(work_folder, "chart-cache"),
+        "TARGET_FOLDER": target_folder,
+        "KUBECONFIG": os.path.join(round_folder, "kubeconfig"),
+        "REPLICATED_API_URL": api_url,
+        "REPLICATED_API_TOKEN": "fake",
+        "IONOS_USERNAME": "fake",
+        "IONOS_PASSWORD": "fake",
+        "CLUSTER_LOGGING_ENDPOINT": "https://fake",
+        "CLUSTER_LOGGING_USERNAME": "fake",
+        "CLUSTER_LOGGING_PASSWORD": "fake",
+        "OUTPUT_FILE_USER": f"{os.getuid()}:{os.getgid()}",
+        "PLATFORM": platform,
+        "PLATFORM_VERSION": platform_version,
+        "OPERATOR": operator,
+        "OPERATOR_VERSION": "0.0.0-dev",
+    }
+    env.pop("OPENSEARCH_DASHBOARDS_URL", None)
+    env.pop("CLUSTER_POOL_DIR", None)
+    env.pop("IONOS_LIST_CACHE_DIR", None)
+
+    refill_invocations = 0
+    if args.pool:
+        env["CLUSTER_POOL_DIR"] = os.path.join(round_folder, "pool")
+        with open(os.path.join(round_folder, "pool.log"), "wb") as log:
+            refill_exit_code = subprocess.run(
+                [
+                    sys.executable,
+                    SCALED_RUNNER,
+                    "cluster-pool.py",
+                    "refill",
+                    operator,
+                    platform,
+                    platform_version,
+                    "1",
+                ],
+                cwd=run_folder,
+                env=env,
+                stdout=log,
+                stderr=log,
+            ).returncode
+        if refill_exit_code != 0:
+            raise SystemExit(f"Refilling the pool failed, see {round_folder}/pool.log")
+        with open(fake_cli.INVOCATIONS_FILE) as f:
+            refill_invocations = len(f.readlines())
+
+    start = perf_counter()
+    with open(os.path.join(round_folder, "runner.log"), "wb") as log:
+        exit_code = subprocess.run(
+            [sys.executable, SCALED_RUNNER], cwd=run_folder, env=env, stdout=log, stderr=log
+        ).returncode
+    wall_time = perf_counter() - start
+
+    invocations = []
+    if os.path.exists(fake_cli.INVOCATIONS_FILE):
+        with open(fake_cli.INVOCATIONS_FILE) as f:
+            invocations = [json.loads(line) for line in f][refill_invocations:]
+    phases = {}
+    timings_file = os.path.join(target_folder, "timings.json")
+    if os.path.exists(timings_file):
+        with open(timings_file) as f:
+            phases = {name: t["duration"] for name, t in json.load(f)["phases"].items()}
+
+    with open(os.path.join(round_folder, "runner.log")) as f:
+        leased = "Leased cluster" in f.read()
+
+    return {
+        "exit_code": exit_code,
+        "leased": leased,
+        "wall_time": wall_time,
+        "invocations": dict(Counter(i["command"] for i in invocations)),
+        # (the fake CLIs only fail on calls the real ones would reject, e.g. unknown resources)
+        "failed_invocations": dict(
+            Counter(i["command"] for i in invocations if i["exit_code"] != 0)
+        ),
+        "cli_time": sum(i["duration"] for i in invocations),
+        "phases": phases,
+        "log": os.path.join(round_folder, "runner.log"),
+    }
+
+
+def summarize(rounds):
+    """
+    Aggregates the rounds of a platform (medians, invocations of the first round)
+    """
+    phase_names = sorted({name for r in rounds for name in r["phases"]})
+    return {
+        "rounds": len(rounds),
+        "failed_rounds": len([r for r in rounds if r["exit_code"] != 0]),
+        "wall_time": statistics.median(r["wall_time"] for r in rounds),
+        "cli_time": statistics.median(r["cli_time"] for r in rounds),
+        "cli_invocations": statistics.median(sum(r["invocations"].values()) for r in rounds),
+        "invocations": rounds[0]["invocations"],
+        "phases": {
+            name: statistics.median(r["phases"].get(name, 0.0) for r in rounds)
+            for name in phase_names
+        },
+    }
+
+
+def print_report(report, baseline):
+    """
+    Prints the report (compared to the baseline, if given)
+    """
+
+    def delta(path, value):
+        node = baseline
+        for key in path:
+            node = node.get(key, {}) if isinstance(node, dict) else {}
+        if not isinstance(node, (int, float)) or node == 0:
+            return ""
+        return f"  ({(value - node) / node:+.0%} vs. baseline)"
+
+    print()
+    print(f"Time scale: {report['time_scale']}")
+    if report.get("pool"):
+        print("Clusters leased from a warm cluster pool")
+    for platform, result in report["platforms"].items():
+        print()
+        print(f"{platform} ({result['rounds']} rounds, {result['failed_rounds']} failed)")
+        print(
+            f"  wall time        {result['wall_time']:8.2f} s"
+            f"{delta(['platforms', platform, 'wall_time'], result['wall_time'])}"
+        )
+        print(f"  CLI busy time    {result['cli_time']:8.2f} s")
+        print(
+            f"  CLI invocations  {result['cli_invocations']:8.0f}"
+            f"{delta(['platforms', platform, 'cli_invocations'], result['cli_invocations'])}"
+        )
+        for command, count in sorted(result["invocations"].items(), key=lambda c: -c[1]):
+            print(f"    {count:4d}  {command}")
+        print("  phases:")
+        width = max([18] + [len(name) + 2 for name in result["phases"]])
+        for name, duration in result["phases"].items():
+            print(
+                f"    {name:{width}s}{duration:8.2f} s"
+                f"{delta(['platforms', platform, 'phases', name], duration)}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--platform",
+        action="append",
+        help=f"platform to be benchmarked, can be repeated (default: {DEFAULT_PLATFORMS})",
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="runs per platform")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="factor for all durations")
+    parser.add_argument("--scenario", help="JSON file which is merged into the default scenario")
+    parser.add_argument("--output", default="benchmark-report.json", help="report file (JSON)")
+    parser.add_argument("--baseline", help="report of a previous run to compare with")
+    parser.add_argument(
+        "--pool", action="store_true", help="lease the clusters from a warm cluster pool"
+    )
+    parser.add_argument("--keep", action="store_true", help="keep the work folder (logs, ...)")
+    args = parser.parse_args()
+
+    scenario = DEFAULT_SCENARIO
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = merge(DEFAULT_SCENARIO, json.load(f))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    work_folder = tempfile.mkdtemp(prefix="operator-test-runner-benchmark_")
+    bin_folder = prepare_work_folder(work_folder, scenario)
+    os.environ["FAKE_CLI_SCENARIO"] = os.path.join(work_folder, "scenario.json")
+    os.environ["BENCHMARK_TIME_SCALE"] = str(args.time_scale)
+    fake_cli.TIME_SCALE = args.time_scale
+
+    catalog = Catalog.load(
+        print,
+        os.path.join(work_folder, "platforms.yaml"),
+        os.path.join(work_folder, "operator-tests.yaml"),
+    )
+    if not catalog:
+        raise SystemExit("Error reading catalog.")
+
+    api_server = ThreadingHTTPServer(("127.0.0.1", 0), ReplicatedApiHandler)
+    threading.Thread(target=api_server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{api_server.server_port}"
+
+    report = {
+        "time_scale": args.time_scale,
+        "pool": args.pool,
+        "scenario": scenario,
+        "platforms": {},
+    }
+    failed = False
+    for platform in args.platform or DEFAULT_PLATFORMS:
+        operator, platform_version = select_test(catalog, platform)
+        rounds = []
+        for i in range(args.rounds):
+            print(f"{platform}: round {i + 1}/{args.rounds} ({operator}, {platform_version})...")
+            result = run_round(
+                work_folder, bin_folder, platform, operator, platform_version, args, api_url
+            )
+            if result["exit_code"] != 0:
+                print(f"  runner exited with code {result['exit_code']}, see {result['log']}")
+                failed = True
+            if args.pool and not result["leased"]:
+                print(f"  runner didn't lease a cluster from the pool, see {result['log']}")
+                failed = True
+            for command, count in result["failed_invocations"].items():
+                print(f"  {count}x failed: {command}, see {result['log']}")
+                failed = True
+            rounds.append(result)
+        report["platforms"][platform] = summarize(rounds)
+
+    api_server.shutdown()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print_report(report, baseline)
+    print()
+    print(f"Report written to {args.output}")
+
+    if args.keep:
+        print(f"Work folder: {work_folder}")
+    else:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,29 @@
+"""
+Runs the Operator Test Runner with all sleeps multiplied by the time scale of the benchmark
+(BENCHMARK_TIME_SCALE env var), so that the fixed waits and poll intervals of the runner
+shrink along with the scripted latencies of the fake CLIs (see run-benchmark.py).
+
+Another application of src/ (e.g. cluster-pool.py) can be run the same way by passing
+its file name and arguments:
+
+    python scaled-runner.py [<application> <args>...]
+"""
+
+import os
+import runpy
+import sys
+import time
+
+SRC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+if __name__ == "__main__":
+    time_scale = float(os.environ.get("BENCHMARK_TIME_SCALE", "1"))
+    unscaled_sleep = time.sleep
+    # (has to be patched before the modules of the runner import it)
+    time.sleep = lambda seconds: unscaled_sleep(seconds * time_scale)
+
+    application = sys.argv[1] if len(sys.argv) > 1 else "operator-test-runner.py"
+    # (the application sees its own arguments only)
+    sys.argv = [application] + sys.argv[2:]
+    sys.path.insert(0, os.path.abspath(SRC_FOLDER))
+    runpy.run_path(os.path.join(SRC_FOLDER, application), run_name="__main__")
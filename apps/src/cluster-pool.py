@@ -0,0 +1,71 @@
+"""
+Main module of the Cluster Pool application
+
+Keeps a pool of pre-provisioned clusters which can be leased by the Operator Test Runner
+(see modules/cluster_pool.py). Meant to be run periodically, e.g. by a maintenance job.
+
+Usage:
+
+    cluster-pool.py refill <operator test> <platform> <platform version> <size>
+    cluster-pool.py expire
+"""
+
+import os
+import sys
+import uuid
+
+import modules.catalog as catalog
+from modules.cluster_pool import expire_pool, refill_pool
+
+# key for the env var containing the folder of the pool
+PARAM_KEY_CLUSTER_POOL_DIR = "CLUSTER_POOL_DIR"
+
+
+def refill(pool_dir, operator_test, platform_id, platform_version, size):
+    """
+    Refills the pool for the cluster spec of the given operator test / platform / version.
+
+    Returns True if the pool could be filled up to the desired size.
+    """
+    if not catalog.read_catalog(print):
+        print("Error reading catalog.")
+        return False
+    platform = catalog.get_platform(platform_id)
+    if not platform:
+        print(f"The platform '{platform_id}' does not exist.")
+        return False
+    if platform_version not in platform["versions"]:
+        print(f"The version '{platform_version}' does not exist for platform '{platform_id}'.")
+        return False
+    spec = catalog.get_spec_for_operator_test(operator_test, platform["id"], print)
+    if not spec:
+        print("Cluster spec could not be determined.")
+        return False
+    return refill_pool(
+        pool_dir,
+        platform["provider"],
+        spec,
+        platform_version,
+        size,
+        lambda: uuid.uuid4().hex,
+        print,
+    )
+
+
+if __name__ == "__main__":
+    print("testing.stackable.tech cluster-pool")
+    print()
+
+    if PARAM_KEY_CLUSTER_POOL_DIR not in os.environ:
+        print(f"Error: Please supply {PARAM_KEY_CLUSTER_POOL_DIR} as an environment variable.")
+        exit(1)
+    pool_dir = os.environ[PARAM_KEY_CLUSTER_POOL_DIR].strip()
+
+    if len(sys.argv) == 6 and sys.argv[1] == "refill":
+        if not refill(pool_dir, sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])):
+            exit(1)
+    elif len(sys.argv) == 2 and sys.argv[1] == "expire":
+        print(f"Terminated {expire_pool(pool_dir, print)} expired clusters.")
+    else:
+        print(__doc__)
+        exit(1)
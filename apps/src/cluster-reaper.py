@@ -0,0 +1,126 @@
+"""
+Main module of the Cluster Reaper application
+
+Terminates clusters the Operator Test Runner left behind. Meant to be run periodically by a
+maintenance job.
+
+    ledger      finishes the termination of the clusters which the Operator Test Runner
+                recorded in the "to-reap" ledger (see modules/reap_ledger.py)
+    orphans     scans the Replicated and IONOS accounts for orphaned test clusters, i.e.
+                clusters whose running mark in the ledger is stale (see modules/orphans.py),
+                and terminates them via the ledger, with --dry-run they are only listed
+
+Usage:
+
+    cluster-reaper.py ledger
+    cluster-reaper.py orphans [--dry-run]
+"""
+
+import os
+import sys
+from datetime import UTC, datetime
+
+from modules.orphans import (
+    ORPHAN_HEARTBEAT_TTL,
+    find_all_orphans,
+    known_cluster_names,
+    stale_marks,
+)
+from modules.reap_ledger import add_entry, run_reaper, unmark_running
+
+# keys for the env vars
+PARAM_KEY_REAP_LEDGER_DIR = "REAP_LEDGER_DIR"
+PARAM_KEY_REAPER_MAX_RUNTIME = "REAPER_MAX_RUNTIME"
+PARAM_KEY_ORPHAN_HEARTBEAT_TTL = "ORPHAN_HEARTBEAT_TTL"
+PARAM_KEY_CLUSTER_POOL_DIR = "CLUSTER_POOL_DIR"
+
+# default time [seconds] after which the reaper stops (it is run periodically anyway)
+DEFAULT_REAPER_MAX_RUNTIME = 3000
+
+
+def log(msg=""):
+    """
+    Logs the given text message to stdout.
+    """
+    print(f"{datetime.now(UTC):%Y-%m-%d %H:%M:%S} :: {msg}", flush=True)
+
+
+def get_ledger_dir():
+    if PARAM_KEY_REAP_LEDGER_DIR not in os.environ:
+        log(f"Error: Please supply {PARAM_KEY_REAP_LEDGER_DIR} as an environment variable.")
+        return None
+    return os.environ[PARAM_KEY_REAP_LEDGER_DIR].strip()
+
+
+def get_max_runtime():
+    return int(os.environ.get(PARAM_KEY_REAPER_MAX_RUNTIME, str(DEFAULT_REAPER_MAX_RUNTIME)))
+
+
+def reap_ledger():
+    """
+    Reaps the clusters of the ledger until it is empty (or the max. runtime is reached).
+
+    Returns True if no cluster is stuck.
+    """
+    ledger_dir = get_ledger_dir()
+    if not ledger_dir:
+        return False
+    return run_reaper(ledger_dir, log, get_max_runtime()) == 0
+
+
+def reap_orphans(dry_run):
+    """
+    Finds the orphaned test clusters and terminates them (unless dry_run is set).
+
+    Returns True if all accounts could be scanned and no cluster is stuck.
+    """
+    ledger_dir = get_ledger_dir()
+    if not ledger_dir:
+        return False
+    pool_dir = os.environ.get(PARAM_KEY_CLUSTER_POOL_DIR, "").strip() or None
+    heartbeat_ttl = int(
+        os.environ.get(PARAM_KEY_ORPHAN_HEARTBEAT_TTL, str(ORPHAN_HEARTBEAT_TTL))
+    )
+
+    marks = stale_marks(ledger_dir, heartbeat_ttl)
+    log(f"Found {len(marks)} running marks without heartbeat.")
+    orphans = find_all_orphans(marks, known_cluster_names(ledger_dir, pool_dir), log)
+    successful = True
+    for provider_id, provider_orphans in orphans.items():
+        if provider_orphans is None:
+            log(f"The {provider_id} account could not be scanned.")
+            successful = False
+            continue
+        log(f"Found {len(provider_orphans)} orphaned clusters on {provider_id}.")
+        unrecorded = set()
+        for orphan in provider_orphans:
+            log(f"  {orphan['name']} (no heartbeat for {orphan['silent_for'] / 3600:.1f}h)")
+            if not dry_run:
+                if not add_entry(ledger_dir, orphan["id"], provider_id, orphan["cluster"], log):
+                    unrecorded.add(orphan["id"])
+                    successful = False
+        if not dry_run:
+            # The ledger takes care of the orphans now, the other stale marks belong to clusters
+            # which are gone or already in the ledger.
+            for mark in marks:
+                if mark["provider"] == provider_id and mark["id"] not in unrecorded:
+                    unmark_running(ledger_dir, mark["id"])
+    if dry_run:
+        log("Dry run, no cluster is terminated.")
+        return successful
+    return run_reaper(ledger_dir, log, get_max_runtime()) == 0 and successful
+
+
+if __name__ == "__main__":
+    print("testing.stackable.tech cluster-reaper")
+    print()
+
+    if len(sys.argv) == 2 and sys.argv[1] == "ledger":
+        if not reap_ledger():
+            exit(1)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "orphans" and sys.argv[2:] in [[], ["--dry-run"]]:
+        if not reap_orphans("--dry-run" in sys.argv):
+            exit(1)
+    else:
+        print(__doc__)
+        exit(1)
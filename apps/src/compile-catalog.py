@@ -0,0 +1,40 @@
+"""
+Compiles the catalog into the cache file which is used for fast startup (see modules/catalog.py)
+
+Meant to be run at image build time. Prints how long a cold parse of the YAML files
+takes compared to loading the compiled cache.
+"""
+
+import os
+from time import perf_counter
+
+from modules.catalog import CATALOG_CACHE_FILE, Catalog
+
+# number of loads per measurement
+BENCHMARK_ROUNDS = 5
+
+
+def benchmark(load):
+    """
+    Returns the average duration [ms] of the given load function
+    """
+    start = perf_counter()
+    for _ in range(BENCHMARK_ROUNDS):
+        if not load():
+            raise SystemExit("Error reading catalog.")
+    return (perf_counter() - start) * 1000 / BENCHMARK_ROUNDS
+
+
+if __name__ == "__main__":
+    cold = benchmark(lambda: Catalog.load(print))
+
+    if os.path.exists(CATALOG_CACHE_FILE):
+        os.remove(CATALOG_CACHE_FILE)
+    Catalog.load_cached(print)
+    if not os.path.exists(CATALOG_CACHE_FILE):
+        raise SystemExit(f"Catalog cache {CATALOG_CACHE_FILE} could not be written.")
+
+    cached = benchmark(lambda: Catalog.load_cached(print))
+
+    print(f"Compiled catalog into {CATALOG_CACHE_FILE}")
+    print(f"Cold parse: {cold:.1f} ms, cached load: {cached:.1f} ms")
@@ -0,0 +1,72 @@
+"""
+Compiles the Jinja templates of the given folders into the bytecode cache (see modules/templates.py)
+
+Meant to be run at image build time (after compile-catalog.py):
+
+    python compile-templates.py <template folder> [<template folder> ...]
+
+If a folder contains the templates of the operator test jobs, it also prints how long rendering
+them over the real catalog takes when every render compiles the template from source
+(as it was done before) compared to the shared, cached Environment.
+"""
+
+import sys
+from time import perf_counter
+
+from jinja2 import Template
+
+import modules.catalog as catalog
+import modules.templates as templates
+
+# templates which are rendered over the whole test matrix
+MATRIX_TEMPLATES = ["operator_weekly_tests.j2", "operator_custom_tests.j2"]
+
+# number of renders per measurement
+BENCHMARK_ROUNDS = 10
+
+
+def benchmark(render):
+    """
+    Returns the average duration [ms] of the given render function
+    """
+    start = perf_counter()
+    for _ in range(BENCHMARK_ROUNDS):
+        render()
+    return (perf_counter() - start) * 1000 / BENCHMARK_ROUNDS
+
+
+def benchmark_matrix_templates(template_folder):
+    """
+    Benchmarks rendering the matrix templates over the real catalog.
+    (the operator versions, which are read from the chart registry at runtime,
+    are replaced by the dev version)
+    """
+    if not catalog.read_catalog(print):
+        raise SystemExit("Error reading catalog.")
+    context = {
+        "testsuites": catalog.operator_tests,
+        "platforms": {
+            p["id"]: {"name": p["name"], "versions": list(p["versions"])}
+            for p in catalog.platforms
+        },
+        "operator_versions": {ot["id"]: ["0.0.0-dev"] for ot in catalog.operator_tests},
+    }
+    environment = templates.get_environment(template_folder)
+    for name in MATRIX_TEMPLATES:
+        with open(f"{template_folder}{name}") as f:
+            source = f.read()
+        cold = benchmark(lambda: Template(source).render(context))
+        cached = benchmark(lambda: environment.get_template(name).render(context))
+        print(f"Rendering {name}: compiled per render {cold:.1f} ms, cached {cached:.1f} ms")
+
+
+if __name__ == "__main__":
+    for template_folder in sys.argv[1:]:
+        template_folder = template_folder.rstrip("/") + "/"
+        names = templates.precompile_templates(template_folder)
+        print(
+            f"Compiled {len(names)} templates of {template_folder} "
+            f"into {templates.TEMPLATE_CACHE_FOLDER}"
+        )
+        if all(name in names for name in MATRIX_TEMPLATES):
+            benchmark_matrix_templates(template_folder)
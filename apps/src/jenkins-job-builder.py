@@ -4,14 +4,21 @@ Main module of the Jenkins Job builder application
 See https://jenkins-job-builder.readthedocs.io/en/latest/
 """
 
+import hashlib
 import json
 import os
+import shutil
+import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 
 import requests
-from jinja2 import Template
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import modules.catalog as catalog
+from modules.templates import render_template
 
 # values of the params (given as env vars during Docker run)
 param_jenkins_url = None
@@ -22,11 +29,40 @@ param_jenkins_password = None
 PARAM_KEY_JENKINS_URL = "JENKINS_URL"
 PARAM_KEY_JENKINS_USERNAME = "JENKINS_USERNAME"
 PARAM_KEY_JENKINS_PASSWORD = "JENKINS_PASSWORD"
+PARAM_KEY_JJB_FULL_UPDATE = "JJB_FULL_UPDATE"
+PARAM_KEY_JJB_MANIFEST_FILE = "JJB_MANIFEST_FILE"
+PARAM_KEY_JJB_WORKERS = "JJB_WORKERS"
+
+# the generated JJB job definition files
+JJB_FILES = ["maintenance.yaml", "operator_weekly_tests.yaml", "operator_custom_tests.yaml"]
+
+# folder the rendered job definitions (XML) are written to
+JJB_XML_FOLDER = "/jjb/xml/"
+
+# manifest containing the hashes of the job definitions pushed to Jenkins by the previous run
+# (has to be on a persistent volume, otherwise every run is a full update)
+JJB_MANIFEST_FILE = os.environ.get(PARAM_KEY_JJB_MANIFEST_FILE, "/jjb-state/manifest.json")
+
+# number of parallel workers JJB uses to update the jobs (0 = number of CPUs)
+JJB_WORKERS = int(os.environ.get(PARAM_KEY_JJB_WORKERS, "8"))
+
+# folder containing the Jinja templates and the generated JJB files
+JJB_FOLDER = "/jjb/"
 
 SLACK_CHANNEL = "#team-testing"
 CLUSTER_LOGGING_ENDPOINT = "https://search.t2.stackable.tech"
 OPENSEARCH_DASHBOARDS_URL = "https://logs.t2.stackable.tech"
 
+# OCI registry containing the operator charts (can be overridden, e.g. by a local stand-in registry)
+CHART_REGISTRY_URL = os.environ.get("CHART_REGISTRY_URL", "https://oci.stackable.tech")
+
+# max. number of parallel requests to the chart registry
+CHART_REGISTRY_MAX_PARALLEL_REQUESTS = 8
+
+# timeout [seconds] (connect, read) and number of retries of the requests to the chart registry
+CHART_REGISTRY_TIMEOUT = (5, 30)
+CHART_REGISTRY_RETRIES = 3
+
 
 def get_platform_metadata():
     """
@@ -70,103 +106,179 @@ def generate_jjb_config():
     """
     Creates the config file for the JJB util using Jinja templating.
     """
-    with open("/jjb/jjb.conf.j2") as t:
-        template = Template(t.read())
-        with open("/jjb/jjb.conf", "w") as f:
-            f.write(template.render(os.environ))
-            f.close()
+    render_template(JJB_FOLDER, "jjb.conf.j2", os.environ, f"{JJB_FOLDER}jjb.conf")
 
 
 def generate_jjb_file_maintenance_jobs():
     """
     Creates the JJB job definition file defining the maintenance jobs using Jinja templating.
     """
-    with open("/jjb/maintenance.j2") as t:
-        template = Template(t.read())
-        with open("/jjb/maintenance.yaml", "w") as f:
-            f.write(template.render(os.environ))
-            f.close()
+    render_template(JJB_FOLDER, "maintenance.j2", os.environ, f"{JJB_FOLDER}maintenance.yaml")
 
 
 def generate_jjb_file_operator_weekly_test_jobs(platform_metadata):
     """
     Creates the JJB job definition files defining the weekly operator test jobs using Jinja templating.
     """
-    with open("/jjb/trigger-weekly-tests.groovy.j2") as t:
-        template = Template(t.read())
-        with open("/jjb/trigger-weekly-tests.groovy", "w") as f:
-            f.write(template.render({"testsuites": catalog.operator_tests}))
-            f.close()
-    with open("/jjb/operator_weekly_tests.j2") as t:
-        template = Template(t.read())
-        with open("/jjb/operator_weekly_tests.yaml", "w") as f:
-            f.write(
-                template.render(
-                    {
-                        "testsuites": catalog.operator_tests,
-                        "platforms": platform_metadata,
-                        "slack_channel": SLACK_CHANNEL,
-                        "cluster_logging_endpoint": CLUSTER_LOGGING_ENDPOINT,
-                        "opensearch_dashboards_url": OPENSEARCH_DASHBOARDS_URL,
-                    }
-                )
-            )
-            f.close()
+    render_template(
+        JJB_FOLDER,
+        "trigger-weekly-tests.groovy.j2",
+        {"testsuites": catalog.operator_tests},
+        f"{JJB_FOLDER}trigger-weekly-tests.groovy",
+    )
+    render_template(
+        JJB_FOLDER,
+        "operator_weekly_tests.j2",
+        {
+            "testsuites": catalog.operator_tests,
+            "platforms": platform_metadata,
+            "slack_channel": SLACK_CHANNEL,
+            "cluster_logging_endpoint": CLUSTER_LOGGING_ENDPOINT,
+            "opensearch_dashboards_url": OPENSEARCH_DASHBOARDS_URL,
+        },
+        f"{JJB_FOLDER}operator_weekly_tests.yaml",
+    )
 
 
 def generate_jjb_file_operator_custom_test_jobs(platform_metadata, operator_versions):
     """
     Creates the JJB job definition file defining the custom operator test jobs using Jinja templating.
     """
-    with open("/jjb/operator_custom_tests.j2") as t:
-        template = Template(t.read())
-        with open("/jjb/operator_custom_tests.yaml", "w") as f:
-            f.write(
-                template.render(
-                    {
-                        "testsuites": catalog.operator_tests,
-                        "platforms": platform_metadata,
-                        "operator_versions": operator_versions,
-                        "slack_channel": SLACK_CHANNEL,
-                        "cluster_logging_endpoint": CLUSTER_LOGGING_ENDPOINT,
-                        "opensearch_dashboards_url": OPENSEARCH_DASHBOARDS_URL,
-                    }
-                )
-            )
-            f.close()
+    render_template(
+        JJB_FOLDER,
+        "operator_custom_tests.j2",
+        {
+            "testsuites": catalog.operator_tests,
+            "platforms": platform_metadata,
+            "operator_versions": operator_versions,
+            "slack_channel": SLACK_CHANNEL,
+            "cluster_logging_endpoint": CLUSTER_LOGGING_ENDPOINT,
+            "opensearch_dashboards_url": OPENSEARCH_DASHBOARDS_URL,
+        },
+        f"{JJB_FOLDER}operator_custom_tests.yaml",
+    )
 
 
-def execute_jjb():
+def run_jjb(args):
     """
-    Executes JJB for all job definition files
+    Runs jenkins-jobs with the given args (output is passed through to the console).
+
+    args                list of arguments (after the config file option)
+
+    Returns tuple (exit_code, duration [seconds])
     """
-    exit_code = os.system("jenkins-jobs --conf /jjb/jjb.conf update /jjb/maintenance.yaml")
-    if exit_code != 0:
-        print(
-            f"ERROR: jenkins-jobs failed for maintenance.yaml with exit code {exit_code}",
-            file=sys.stderr,
-        )
-        sys.exit(1)
+    start = perf_counter()
+    exit_code = subprocess.run(["jenkins-jobs", "--conf", "/jjb/jjb.conf", *args]).returncode
+    return exit_code, perf_counter() - start
+
+
+def render_job_hashes(jjb_file):
+    """
+    Renders the jobs of the given JJB file to XML (jenkins-jobs test) and hashes them.
 
-    exit_code = os.system(
-        "jenkins-jobs --conf /jjb/jjb.conf update /jjb/operator_weekly_tests.yaml"
+    jjb_file            name of the JJB job definition file (in /jjb/)
+
+    Returns dict job name -> SHA-256 hash of the rendered job definition
+    """
+    output_folder = f"{JJB_XML_FOLDER}{jjb_file}/"
+    shutil.rmtree(output_folder, ignore_errors=True)
+    exit_code, duration = run_jjb(
+        ["-l", "warning", "test", "--config-xml", "-o", output_folder, f"/jjb/{jjb_file}"]
     )
+    print(f"{jjb_file}: rendered with exit code {exit_code} in {duration:.1f} s")
     if exit_code != 0:
         print(
-            f"ERROR: jenkins-jobs failed for operator_weekly_tests.yaml with exit code {exit_code}",
+            f"ERROR: jenkins-jobs test failed for {jjb_file} with exit code {exit_code}",
             file=sys.stderr,
         )
         sys.exit(1)
+    hashes = {}
+    for folder, _, files in os.walk(output_folder):
+        for file in files:
+            path = os.path.join(folder, file)
+            job_name = os.path.relpath(path, output_folder).removesuffix("/config.xml")
+            with open(path, "rb") as f:
+                hashes[job_name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
 
-    exit_code = os.system(
-        "jenkins-jobs --conf /jjb/jjb.conf update /jjb/operator_custom_tests.yaml"
-    )
-    if exit_code != 0:
-        print(
-            f"ERROR: jenkins-jobs failed for operator_custom_tests.yaml with exit code {exit_code}",
-            file=sys.stderr,
+
+def read_manifest():
+    """
+    Reads the manifest of the previous run.
+
+    Returns dict job name -> hash (empty if there is no manifest)
+    """
+    try:
+        with open(JJB_MANIFEST_FILE) as f:
+            return json.load(f)["jobs"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def write_manifest(job_hashes):
+    """
+    Writes the manifest for the next run.
+
+    job_hashes          dict job name -> hash
+    """
+    os.makedirs(os.path.dirname(JJB_MANIFEST_FILE), exist_ok=True)
+    with open(f"{JJB_MANIFEST_FILE}.tmp", "w") as f:
+        json.dump({"jobs": job_hashes}, f, indent=4, sort_keys=True)
+    os.replace(f"{JJB_MANIFEST_FILE}.tmp", JJB_MANIFEST_FILE)
+
+
+def execute_jjb():
+    """
+    Executes JJB for all job definition files
+
+    Only the jobs whose rendered definition changed since the previous run (see manifest)
+    are pushed to Jenkins. Jobs which were pushed by the previous run but don't exist anymore
+    are deleted. A full update is done if there is no manifest or JJB_FULL_UPDATE is set to 'true'.
+
+    The jobs of all files are pushed by a single JJB invocation using JJB_WORKERS parallel workers.
+    """
+    manifest = read_manifest()
+    full_update = len(manifest) == 0 or os.environ.get(PARAM_KEY_JJB_FULL_UPDATE) == "true"
+    if full_update:
+        print("Doing a full update of all jobs.")
+
+    job_hashes = {}
+    changed_jobs = []
+    for jjb_file in JJB_FILES:
+        file_job_hashes = render_job_hashes(jjb_file)
+        job_hashes.update(file_job_hashes)
+        file_changed_jobs = sorted(
+            name
+            for name, job_hash in file_job_hashes.items()
+            if full_update or manifest.get(name) != job_hash
         )
-        sys.exit(1)
+        print(f"{jjb_file}: {len(file_changed_jobs)} of {len(file_job_hashes)} jobs changed.")
+        changed_jobs.extend(file_changed_jobs)
+
+    if len(changed_jobs) > 0:
+        print(f"Updating {len(changed_jobs)} jobs using {JJB_WORKERS} workers...")
+        paths = os.pathsep.join(f"/jjb/{jjb_file}" for jjb_file in JJB_FILES)
+        exit_code, duration = run_jjb(
+            ["update", "--workers", str(JJB_WORKERS), paths, *([] if full_update else changed_jobs)]
+        )
+        print(f"jenkins-jobs update finished with exit code {exit_code} in {duration:.1f} s")
+        if exit_code != 0:
+            print(f"ERROR: jenkins-jobs failed with exit code {exit_code}", file=sys.stderr)
+            sys.exit(1)
+
+    removed_jobs = sorted(name for name in manifest if name not in job_hashes)
+    if len(removed_jobs) > 0:
+        print(f"Deleting {len(removed_jobs)} jobs which are not defined anymore: {removed_jobs}")
+        exit_code, duration = run_jjb(["delete", *removed_jobs])
+        print(f"jenkins-jobs delete finished with exit code {exit_code} in {duration:.1f} s")
+        if exit_code != 0:
+            print(
+                f"ERROR: jenkins-jobs delete failed with exit code {exit_code}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    write_manifest(job_hashes)
 
 
 def read_chart_versions() -> dict[str, list[str]]:
@@ -214,16 +326,52 @@ def read_chart_versions() -> dict[str, list[str]]:
         "zookeeper-operator",
     ]
 
+    # All requests share one session (and therefore the TLS connections to the registry)
+    session = requests.Session()
+    session.auth = ("user", "pass")
+    adapter = HTTPAdapter(
+        pool_maxsize=CHART_REGISTRY_MAX_PARALLEL_REQUESTS,
+        max_retries=Retry(
+            total=CHART_REGISTRY_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    def fetch_tags(op_name):
+        start = perf_counter()
+        try:
+            r = session.get(
+                f"{CHART_REGISTRY_URL}/v2/sdp-charts/{op_name}/tags/list",
+                timeout=CHART_REGISTRY_TIMEOUT,
+            )
+        except requests.RequestException as e:
+            return op_name, None, f"{e}", perf_counter() - start
+        if r.status_code != 200:
+            return op_name, None, r.text, perf_counter() - start
+        try:
+            tags = sorted([tag for tag in r.json()["tags"] if not tag.endswith(".sig")])
+        except (ValueError, KeyError, TypeError) as e:
+            # (e.g. an HTML error page of a proxy or a repository without tags)
+            error = f"unexpected response ({e!r}): {r.text[:200]}"
+            return op_name, [], error, perf_counter() - start
+        return op_name, tags, None, perf_counter() - start
+
     result = {}
 
-    for op_name in ops:
-        r = requests.get(
-            f"https://oci.stackable.tech/v2/sdp-charts/{op_name}/tags/list", auth=("user", "pass")
-        )
-        if r.status_code == 200:
-            result[op_name] = sorted([tag for tag in r.json()["tags"] if not tag.endswith(".sig")])
-        else:
-            print(f"failed to get tags for operator {op_name}: {r.text}", file=sys.stderr)
+    start = perf_counter()
+    with session, ThreadPoolExecutor(max_workers=CHART_REGISTRY_MAX_PARALLEL_REQUESTS) as executor:
+        for op_name, tags, error, latency in executor.map(fetch_tags, ops):
+            # (an unexpected response results in an empty list of tags)
+            if tags is not None:
+                result[op_name] = tags
+            if error:
+                print(f"failed to get tags for operator {op_name}: {error}", file=sys.stderr)
+            else:
+                print(f"fetched {len(tags)} tags for operator {op_name} in {latency * 1000:.0f} ms")
+    print(f"fetched tags for {len(result)}/{len(ops)} operators in {perf_counter() - start:.2f} s")
     return result
 
 
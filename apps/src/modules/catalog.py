@@ -1,67 +1,273 @@
 """
 This module enables access to the catalog
+
+The catalog is parsed once into an immutable Catalog object which indexes platforms
+and operator tests, so that all queries are dict lookups. As the object is never
+modified after construction, it can be shared between threads.
+
+Parsing the YAML files is slow compared to the rest of the startup, so the parsed catalog
+data is kept in a compiled cache file (pickle), keyed by the SHA-256 hash of the YAML files.
+The cache is produced at image build time (see compile-catalog.py) or on first load, and is
+ignored as soon as the YAML files change.
+
+For convenience, read_catalog() loads the catalog into this module and the module-level
+functions delegate to it.
 """
 
+import hashlib
+import os
+import pickle
+from types import MappingProxyType
+
 import hiyapyco
 
-# variables holding the catalog data
-providers = []
-platforms = []
-operator_tests = []
+# folder containing the catalog files (can be overridden, e.g. to run the apps outside the images)
+CATALOG_FOLDER = os.environ.get("CATALOG_FOLDER", "/")
 
+PLATFORMS_FILE = os.path.join(CATALOG_FOLDER, "platforms.yaml")
+OPERATOR_TESTS_FILE = os.path.join(CATALOG_FOLDER, "operator-tests.yaml")
+CATALOG_CACHE_FILE = os.path.join(CATALOG_FOLDER, "catalog.cache")
 
-def read_providers(logger):
-    """
-    Reads the list of cluster providers from platforms.yaml
+# version of the cache file format, part of the cache key
+CATALOG_CACHE_FORMAT = 1
 
-    logger              logger (String-consuming function)
-    """
-    global providers
-    platforms_yaml = hiyapyco.load("/platforms.yaml")
-    if "providers" not in platforms_yaml:
-        logger("platforms.yaml does not contain providers.")
-        return False
-    providers = platforms_yaml["providers"]
-    if len(providers) == 0:
-        logger("platforms.yaml does not contain providers.")
-        return False
-    # TODO More syntax checks to make sure the catalog file is usable
-    return True
+# default configuration of the auto-retry test script
+DEFAULT_AUTO_RETRY_CONFIG = MappingProxyType(
+    {
+        "attempts_parallel": 0,
+        "attempts_serial": 3,
+        "delete_failed_namespaces": True,
+    }
+)
+
+# default test script if an operator test doesn't specify one
+DEFAULT_TEST_SCRIPT = "auto-retry-tests.py"
 
 
-def read_platforms(logger):
+class Catalog:
+    """
+    Immutable, indexed view of the catalog (providers, platforms and operator tests).
     """
-    Reads the list of cluster platforms from platforms.yaml
 
-    logger              logger (String-consuming function)
+    def __init__(self, providers, platforms, operator_tests):
+        """
+        Builds the indexes.
+
+        providers           list of provider dicts (from platforms.yaml)
+        platforms           list of platform dicts (from platforms.yaml)
+        operator_tests      list of operator test dicts (from operator-tests.yaml)
+        """
+        self.providers = tuple(providers)
+        self.platforms = tuple(platforms)
+        self.operator_tests = tuple(operator_tests)
+
+        # (built in reverse order, so that the first definition wins in case of duplicates)
+        self._platforms_by_id = MappingProxyType({p["id"]: p for p in reversed(self.platforms)})
+        self._platforms_by_name = MappingProxyType(
+            {p["name"]: p for p in reversed(self.platforms)}
+        )
+        self._operator_tests_by_id = MappingProxyType(
+            {ot["id"]: ot for ot in reversed(self.operator_tests)}
+        )
+
+        # resolved cluster spec for every (operator test, platform) combination
+        specs = {}
+        for operator_test in self.operator_tests:
+            for operator_test_platform_def in operator_test.get("platforms", []):
+                platform = self._platforms_by_id.get(operator_test_platform_def["id"])
+                if not platform:
+                    continue
+                specs[(operator_test["id"], platform["id"])] = MappingProxyType(
+                    {
+                        **platform["spec"],
+                        **operator_test.get("spec", {}),
+                        **operator_test_platform_def.get("spec", {}),
+                    }
+                )
+        self._specs = MappingProxyType(specs)
+
+    @classmethod
+    def load(cls, logger, platforms_file=PLATFORMS_FILE, operator_tests_file=OPERATOR_TESTS_FILE):
+        """
+        Parses the catalog files (each one exactly once).
+
+        logger              logger (String-consuming function)
+        platforms_file      path of platforms.yaml
+        operator_tests_file path of operator-tests.yaml
+
+        Returns Catalog or None if the catalog files are not usable.
+        """
+        platforms_yaml = hiyapyco.load(platforms_file)
+        if not platforms_yaml or not platforms_yaml.get("providers"):
+            logger("platforms.yaml does not contain providers.")
+            return None
+        if not platforms_yaml.get("platforms"):
+            logger("platforms.yaml does not contain platforms.")
+            return None
+        operator_tests = hiyapyco.load(operator_tests_file)
+        if not operator_tests:
+            logger("operator-tests.yaml does not contain any tests.")
+            return None
+        # TODO More syntax checks to make sure the catalog files are usable
+        return cls(platforms_yaml["providers"], platforms_yaml["platforms"], operator_tests)
+
+    @classmethod
+    def load_cached(
+        cls,
+        logger,
+        platforms_file=PLATFORMS_FILE,
+        operator_tests_file=OPERATOR_TESTS_FILE,
+        cache_file=CATALOG_CACHE_FILE,
+    ):
+        """
+        Loads the catalog from the compiled cache file if it matches the catalog files,
+        parses the catalog files and (re)writes the cache file otherwise.
+
+        logger              logger (String-consuming function)
+        platforms_file      path of platforms.yaml
+        operator_tests_file path of operator-tests.yaml
+        cache_file          path of the compiled cache file
+
+        Returns Catalog or None if the catalog files are not usable.
+        """
+        key = catalog_hash(platforms_file, operator_tests_file)
+        try:
+            with open(cache_file, "rb") as f:
+                cached = pickle.load(f)
+            if cached["key"] == key:
+                return cls(cached["providers"], cached["platforms"], cached["operator_tests"])
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+            pass
+        catalog = cls.load(logger, platforms_file, operator_tests_file)
+        if catalog:
+            write_catalog_cache(catalog, key, cache_file, logger)
+        return catalog
+
+    def get_platform(self, platform):
+        """
+        Get the platform matching the platform string.
+        If the platform string matches an ID, that platform is chosen.
+        Otherwise, we search for a matching name attribute.
+
+        platform        string which identifies a platform
+        """
+        return self._platforms_by_id.get(platform) or self._platforms_by_name.get(platform)
+
+    def get_operator_test(self, operator_id):
+        """
+        Get the operator test definition by ID.
+
+        operator_id     ID of the operator test
+
+        Returns the operator test dict or None if not found.
+        """
+        return self._operator_tests_by_id.get(operator_id)
+
+    def get_spec_for_operator_test(self, operator_test, platform, logger):
+        """
+        Reads the cluster spec for the given operator/platform combination.
+
+        The cluster spec is calculated combining up to 3 specs as following:
+
+        1) Base spec: from platforms.yaml: 'spec' for the selected platform
+        2) Test-specific spec: Overwrite fields which are specified in the 'spec' section of the given operator test.
+        3) Platform-specific spec for operator test: Overwrite fields which are specified in the 'spec' section of the specific section for that platform inside the 'platforms' section of the operator test.
+
+        operator_test:      ID of operator test
+        platform            ID of platform
+
+        Returns None and prints out an error message if the combination is not valid.
+        """
+        spec = self._specs.get((operator_test, platform))
+        if spec is not None:
+            return dict(spec)
+        if platform not in self._platforms_by_id:
+            logger(f"The platform '{platform}' does not exist.")
+        elif operator_test not in self._operator_tests_by_id:
+            logger(f"The operator test '{operator_test}' does not exist.")
+        else:
+            logger(f"The test for '{operator_test}' is not defined for the platform '{platform}'.")
+        return None
+
+    def get_test_script(self, operator_id):
+        """
+        Get the test script name for a given operator.
+        Defaults to "auto-retry-tests.py" if not specified.
+
+        operator_id     ID of the operator test
+
+        Returns the test script name (e.g., "run-tests" or "auto-retry-tests.py")
+        """
+        operator_test = self.get_operator_test(operator_id)
+        if not operator_test:
+            return DEFAULT_TEST_SCRIPT
+        return operator_test.get("test_script", DEFAULT_TEST_SCRIPT)
+
+    def get_auto_retry_config(self, operator_id):
+        """
+        Get the auto-retry configuration for a given operator.
+        Returns default values if not specified.
+
+        operator_id     ID of the operator test
+
+        Returns dict with retry configuration:
+        {
+            'attempts_parallel': int,
+            'attempts_serial': int,
+            'delete_failed_namespaces': bool
+        }
+        """
+        operator_test = self.get_operator_test(operator_id)
+        if not operator_test or "auto_retry" not in operator_test:
+            return dict(DEFAULT_AUTO_RETRY_CONFIG)
+        # Merge operator config with defaults
+        return {**DEFAULT_AUTO_RETRY_CONFIG, **operator_test["auto_retry"]}
+
+
+def catalog_hash(platforms_file=PLATFORMS_FILE, operator_tests_file=OPERATOR_TESTS_FILE):
     """
-    global platforms
-    platforms = hiyapyco.load("/platforms.yaml")["platforms"]
-    platforms_yaml = hiyapyco.load("/platforms.yaml")
-    if "platforms" not in platforms_yaml:
-        logger("platforms.yaml does not contain platforms.")
-        return False
-    platforms = platforms_yaml["platforms"]
-    if len(platforms) == 0:
-        logger("platforms.yaml does not contain platforms.")
-        return False
-    # TODO More syntax checks to make sure the catalog file is usable
-    return True
+    Calculates the cache key: SHA-256 hash of the catalog files (and the cache format)
+    """
+    sha256 = hashlib.sha256(str(CATALOG_CACHE_FORMAT).encode("utf-8"))
+    for file in [platforms_file, operator_tests_file]:
+        with open(file, "rb") as f:
+            sha256.update(hashlib.sha256(f.read()).digest())
+    return sha256.hexdigest()
 
 
-def read_operator_tests(logger):
+def write_catalog_cache(catalog, key, cache_file, logger):
     """
-    Reads the list of operator test definitions from operator-tests.yaml
+    Writes the catalog data to the compiled cache file (best effort, errors are only logged).
 
+    catalog             Catalog
+    key                 cache key (see catalog_hash())
+    cache_file          path of the compiled cache file
     logger              logger (String-consuming function)
     """
-    global operator_tests
-    operator_tests = hiyapyco.load("/operator-tests.yaml")
-    if len(operator_tests) == 0:
-        logger("operator-tests.yaml does not contain any tests.")
-        return False
-    # TODO More syntax checks to make sure the catalog file is usable
-    return True
+    try:
+        with open(f"{cache_file}.tmp", "wb") as f:
+            pickle.dump(
+                {
+                    "key": key,
+                    "providers": catalog.providers,
+                    "platforms": catalog.platforms,
+                    "operator_tests": catalog.operator_tests,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(f"{cache_file}.tmp", cache_file)
+    except OSError as e:
+        logger(f"Could not write catalog cache {cache_file}: {e}")
+
+
+# the catalog loaded by read_catalog()
+catalog = None
+
+# variables holding the catalog data (kept for the templates of the job builder)
+providers = ()
+platforms = ()
+operator_tests = ()
 
 
 def read_catalog(logger):
@@ -70,12 +276,18 @@ def read_catalog(logger):
 
     logger              logger (String-consuming function)
     """
-    if not read_providers(logger):
-        return False
-    if not read_platforms(logger):
-        return False
-    if not read_operator_tests(logger):
+    global catalog
+    global providers
+    global platforms
+    global operator_tests
+
+    loaded_catalog = Catalog.load_cached(logger)
+    if not loaded_catalog:
         return False
+    catalog = loaded_catalog
+    providers = catalog.providers
+    platforms = catalog.platforms
+    operator_tests = catalog.operator_tests
     logger(f"Read {len(providers)} providers: [{','.join([p['id'] for p in providers])}]")
     logger(f"Read {len(platforms)} platforms: [{','.join([p['id'] for p in platforms])}]")
     logger(
@@ -86,123 +298,35 @@ def read_catalog(logger):
 
 def get_platform(platform):
     """
-    Get the platform matching the platform string.
-    If the platform string matches an ID, that platform is chosen.
-    Otherwise, we search for a matching name attribute.
-
-    platform        string which identifies a platform
+    Get the platform matching the platform string (see Catalog.get_platform())
     """
-    matching_platform = next(filter(lambda p: p["id"] == platform, platforms), None)
-    if not matching_platform:
-        matching_platform = next(filter(lambda p: p["name"] == platform, platforms), None)
-    return matching_platform
+    return catalog.get_platform(platform)
 
 
 def get_spec_for_operator_test(operator_test, platform, logger):
     """
-    Reads the cluster spec for the given operator/platform combination.
-
-    The cluster spec is calculated combining up to 3 specs as following:
-
-    1) Base spec: from platforms.yaml: 'spec' for the selected platform
-    2) Test-specific spec: Overwrite fields which are specified in the 'spec' section of the given operator test.
-    3) Platform-specific spec for operator test: Overwrite fields which are specified in the 'spec' section of the specific section for that platform inside the 'platforms' section of the operator test.
-
-    operator_test:      ID of operator test
-    platform            ID of platform
-
-    Returns None and prints out an error message if the combination is not valid.
+    Reads the cluster spec for the given operator/platform combination
+    (see Catalog.get_spec_for_operator_test())
     """
-
-    # Find the matching platform, exit if not existing
-    matching_platform = next(filter(lambda p: p["id"] == platform, platforms), None)
-    if not matching_platform:
-        logger(f"The platform '{platform}' does not exist.")
-        return None
-
-    # Find the matching operator test, exit if not existing
-    matching_operator_test = next(
-        filter(lambda ot: ot["id"] == operator_test, operator_tests), None
-    )
-    if not matching_operator_test:
-        logger(f"The operator test '{operator_test}' does not exist.")
-        return None
-
-    # Find out the matching definition for the given platform inside the given operator test, exit if not existing
-    matching_operator_test_platform_def = next(
-        filter(lambda p: p["id"] == platform, matching_operator_test["platforms"]), None
-    )
-    if not matching_operator_test_platform_def:
-        logger(f"The test for '{operator_test}' is not defined for the platform '{platform}'.")
-        return None
-
-    # The base spec from the platform
-    spec = matching_platform["spec"]
-
-    # If there are more specific specs in the operator test, overwrite the specs with these.
-    if "spec" in matching_operator_test:
-        spec = {**spec, **matching_operator_test["spec"]}
-
-    # If there are more specific specs in the operator test for the given platform, overwrite the specs with these.
-    if "spec" in matching_operator_test_platform_def:
-        spec = {**spec, **matching_operator_test_platform_def["spec"]}
-
-    return spec
+    return catalog.get_spec_for_operator_test(operator_test, platform, logger)
 
 
 def get_operator_test(operator_id):
     """
-    Get the operator test definition by ID.
-
-    operator_id     ID of the operator test
-
-    Returns the operator test dict or None if not found.
+    Get the operator test definition by ID (see Catalog.get_operator_test())
     """
-    return next(filter(lambda ot: ot["id"] == operator_id, operator_tests), None)
+    return catalog.get_operator_test(operator_id)
 
 
 def get_test_script(operator_id):
     """
-    Get the test script name for a given operator.
-    Defaults to "auto-retry-tests.py" if not specified.
-
-    operator_id     ID of the operator test
-
-    Returns the test script name (e.g., "run-tests" or "auto-retry-tests.py")
+    Get the test script name for a given operator (see Catalog.get_test_script())
     """
-    operator_test = get_operator_test(operator_id)
-    if not operator_test:
-        return "auto-retry-tests.py"  # default
-
-    return operator_test.get("test_script", "auto-retry-tests.py")
+    return catalog.get_test_script(operator_id)
 
 
 def get_auto_retry_config(operator_id):
     """
-    Get the auto-retry configuration for a given operator.
-    Returns default values if not specified.
-
-    operator_id     ID of the operator test
-
-    Returns dict with retry configuration:
-    {
-        'attempts_parallel': int,
-        'attempts_serial': int,
-        'delete_failed_namespaces': bool
-    }
+    Get the auto-retry configuration for a given operator (see Catalog.get_auto_retry_config())
     """
-    operator_test = get_operator_test(operator_id)
-
-    # Default configuration
-    default_config = {
-        "attempts_parallel": 0,
-        "attempts_serial": 3,
-        "delete_failed_namespaces": True,
-    }
-
-    if not operator_test or "auto_retry" not in operator_test:
-        return default_config
-
-    # Merge operator config with defaults
-    config = {**default_config, **operator_test["auto_retry"]}
-    return config
+    return catalog.get_auto_retry_config(operator_id)
@@ -0,0 +1,202 @@
+"""
+This module keeps a local cache of Helm charts, so that charts are not downloaded
+again by every test run.
+
+The cache lives in a folder which is shared by all runners (e.g. a Docker volume):
+
+    <cache_dir>/<chart>-<version>.tgz       packaged chart as pulled by 'helm pull'
+    <cache_dir>/helm/                       cache of Helm itself (repo indexes, charts)
+
+Charts are pulled into a temp file and renamed, so a runner never sees a partial chart.
+The modification time of a chart is updated whenever it's used, the least recently used
+charts are evicted when the cache exceeds CHART_CACHE_MAX_SIZE.
+
+Charts which are installed by scripts (e.g. the operators installed by the 'run-tests' script
+of an operator repo) can't be resolved to cached files. Such scripts are run with the cache of
+Helm pointed into the chart cache instead (see helm_cache_env()), so that Helm reuses the
+charts downloaded by previous runs. Helm keeps the repo indexes in the same folder, so it's
+seeded with the indexes of the repos added to the image ('helm repo add/update' in the
+Dockerfile) first.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+from time import time
+
+from modules.command import run_command
+
+# If set, charts are cached in this folder
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR")
+
+# max. size [bytes] of the cache
+CHART_CACHE_MAX_SIZE = int(os.environ.get("CHART_CACHE_MAX_SIZE", str(512 * 1024 * 1024)))
+
+# charts used within this time [seconds] are never evicted (another runner might be installing them)
+CHART_MIN_RETENTION = 3600
+
+# repository cache of Helm within the image (see the Dockerfile), it contains the repo indexes
+IMAGE_HELM_REPOSITORY_CACHE = os.environ.get(
+    "HELM_REPOSITORY_CACHE",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "helm", "repository"
+    ),
+)
+
+# hit/miss counters of the chart cache
+chart_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _chart_file(cache_dir, chart, version):
+    """
+    Returns the cache file of the chart, e.g. 'vector_vector-0.40.0.tgz' for 'vector/vector'
+    """
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", chart.removeprefix("oci://")).strip("_")
+    return os.path.join(cache_dir, f"{name}-{version}.tgz")
+
+
+def get_chart(chart, version, logger, cache_dir=None):
+    """
+    Returns the chart to be passed to 'helm install': the packaged chart from the cache
+    (it's pulled into the cache if it isn't there yet), or the given chart reference if there's
+    no cache or the chart could not be pulled.
+
+    chart               chart reference, e.g. 'vector/vector' or 'oci://registry/path/chart'
+    version             version of the chart
+    logger              logger (String-consuming function)
+    cache_dir           folder of the cache (default: CHART_CACHE_DIR)
+    """
+    cache_dir = cache_dir or CHART_CACHE_DIR
+    if not cache_dir:
+        return chart
+    chart_file = _chart_file(cache_dir, chart, version)
+    try:
+        os.utime(chart_file)
+        chart_cache_stats["hits"] = chart_cache_stats["hits"] + 1
+        return chart_file
+    except FileNotFoundError:
+        pass
+    chart_cache_stats["misses"] = chart_cache_stats["misses"] + 1
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        pull_dir = tempfile.mkdtemp(prefix=".pull-", dir=cache_dir)
+    except OSError as e:
+        logger(f"Chart cache {cache_dir} is not usable: {e}")
+        return chart
+    try:
+        exit_code, output = run_command(
+            f"helm pull {chart} --version {version} --destination {pull_dir}", "helm pull"
+        )
+        pulled = os.listdir(pull_dir)
+        if exit_code != 0 or len(pulled) != 1:
+            logger(f"Pulling chart {chart} {version} into the cache failed, using the repo:")
+            for line in output:
+                logger(line)
+            return chart
+        os.replace(os.path.join(pull_dir, pulled[0]), chart_file)
+    finally:
+        shutil.rmtree(pull_dir, ignore_errors=True)
+    evict_charts(cache_dir, logger)
+    return chart_file
+
+
+def evict_charts(cache_dir, logger, max_size=CHART_CACHE_MAX_SIZE):
+    """
+    Removes the least recently used charts until the cache doesn't exceed the max. size.
+
+    cache_dir           folder of the cache
+    logger              logger (String-consuming function)
+    max_size            max. size [bytes] of the cache
+
+    Returns the number of evicted charts.
+    """
+    charts = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".tgz"):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        charts.append((stat.st_mtime, stat.st_size, name))
+    size = sum(c[1] for c in charts)
+    evicted = 0
+    for mtime, chart_size, name in sorted(charts):
+        if size <= max_size or time() - mtime < CHART_MIN_RETENTION:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        logger(f"Evicted chart {name} from the cache.")
+        size = size - chart_size
+        evicted = evicted + 1
+    return evicted
+
+
+def seed_helm_repository_cache(source_dir, target_dir):
+    """
+    Copies the repo indexes ('<repo>-index.yaml', '<repo>-charts.txt') of the source repository
+    cache into the target one, unless the target already has the same or a newer version.
+    Files are copied into a temp file and renamed, so concurrent runners never see a partial index.
+
+    source_dir          repository cache of the image
+    target_dir          repository cache within the chart cache
+
+    Raises OSError if the target can't be written.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    if not os.path.isdir(source_dir):
+        return
+    for name in os.listdir(source_dir):
+        if not (name.endswith("-index.yaml") or name.endswith("-charts.txt")):
+            continue
+        source = os.path.join(source_dir, name)
+        target = os.path.join(target_dir, name)
+        try:
+            if os.stat(target).st_mtime >= os.stat(source).st_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        fd, tmp_file = tempfile.mkstemp(prefix=f".{name}.", dir=target_dir)
+        os.close(fd)
+        shutil.copy2(source, tmp_file)
+        os.replace(tmp_file, target)
+
+
+def helm_cache_env(logger, cache_dir=None):
+    """
+    Returns the environment variables (dict) which make Helm keep its cache (repo indexes and
+    downloaded charts) within the chart cache. The repository cache is seeded with the repo
+    indexes of the image (see seed_helm_repository_cache()).
+
+    logger              logger (String-consuming function)
+    cache_dir           folder of the cache (default: CHART_CACHE_DIR)
+
+    Returns an empty dict (i.e. Helm uses the cache of the image) if there's no chart cache
+    or it could not be seeded.
+    """
+    cache_dir = cache_dir or CHART_CACHE_DIR
+    if not cache_dir:
+        return {}
+    helm_cache_home = os.path.join(cache_dir, "helm")
+    repository_cache = os.path.join(helm_cache_home, "repository")
+    try:
+        seed_helm_repository_cache(IMAGE_HELM_REPOSITORY_CACHE, repository_cache)
+    except OSError as e:
+        logger(f"Helm cache in {helm_cache_home} is not usable, using the one of the image: {e}")
+        return {}
+    return {"HELM_CACHE_HOME": helm_cache_home, "HELM_REPOSITORY_CACHE": repository_cache}
+
+
+def log_chart_cache_stats(logger):
+    """
+    Logs the hit/miss counters of the chart cache
+    """
+    if CHART_CACHE_DIR:
+        logger(
+            f"Helm chart cache: {chart_cache_stats['hits']} hits, "
+            f"{chart_cache_stats['misses']} misses"
+        )
@@ -41,3 +41,50 @@ def terminate_cluster(provider_id, cluster, logger):
         return replicated.terminate_cluster(cluster, logger)
     if provider_id == "ionos":
         return ionos.terminate_cluster(cluster, logger)
+
+
+def advance_termination(provider_id, cluster, progress, logger):
+    """
+    Advances the termination of the given cluster by one step without waiting for it.
+    (Non-blocking, meant to be called repeatedly until it returns True)
+
+    provider_id         ID of the cloud provider / vendor
+    cluster             vendor-specific cluster object which was previously returned by create_cluster()
+    progress            dict which keeps the progress of the termination between the calls
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster is completely terminated.
+    """
+    if provider_id == "replicated":
+        return replicated.advance_termination(cluster, progress, logger)
+    if provider_id == "ionos":
+        return ionos.advance_termination(cluster, progress, logger)
+
+
+def name_for_id(provider_id, id):
+    """
+    Returns the name of the cluster with the given ID at the provider.
+
+    provider_id         ID of the cloud provider / vendor
+    id                  UUID of the cluster
+    """
+    if provider_id == "replicated":
+        return replicated.name_for_id(id)
+    if provider_id == "ionos":
+        return ionos.name_for_id(id)
+
+
+def list_test_clusters(provider_id, logger):
+    """
+    Lists the clusters in the provider's account which were created by the Operator Test Runner.
+
+    provider_id         ID of the cloud provider / vendor
+    logger              logger (String-consuming function)
+
+    Returns list of dict (name, created_at (ISO timestamp), vendor-specific cluster object)
+    or None if the clusters could not be listed.
+    """
+    if provider_id == "replicated":
+        return replicated.list_test_clusters(logger)
+    if provider_id == "ionos":
+        return ionos.list_test_clusters(logger)
@@ -6,79 +6,138 @@ This module installs the "cluster logging" on a test cluster.
 log index.
 """
 
+import os
+import tempfile
+
+from modules.chart_cache import get_chart
 from modules.command import run_command
+from modules.phases import run_phases
+from modules.templates import render_template
+
+# Helm chart of Vector (agent and aggregator)
+VECTOR_CHART = "vector/vector"
+VECTOR_CHART_VERSION = "0.40.0"
+
+# folder of the manifests and Helm values (/src/modules/.cluster_logging in the image)
+CLUSTER_LOGGING_FOLDER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cluster_logging"
+)
 
 
 def install_cluster_logging(cluster_id, endpoint, username, password, logger):
     """
     Installs cluster logging capabilities powered by Vector
 
+    The manifests (cluster metadata, credentials, Vector agent transforms, eventrouter)
+    are rendered into one bundle and applied by a single server-side apply, the Vector
+    releases are installed concurrently afterwards (see modules.phases) without waiting
+    for their rollout. The Vector chart is taken from the chart cache (see modules.chart_cache).
+    The readiness of the components has to be checked afterwards
+    (see readiness.wait_for_cluster_logging_ready()).
+    All steps are idempotent, so parts of the cluster logging may already be installed.
+
     cluster_id          ID of the cluster to be included in the logging data
     endpoint            Logging endpoint (OpenSearch)
     username            username for OpenSearch
     password            password for OpenSearch
     logger              logger (String-consuming function)
+
+    Returns tuple (successful, timings):
+    successful          True if all steps succeeded
+    timings             dict step name -> dict with 'start' and 'duration' (see run_phases())
     """
+    errors = {}
 
-    logger("Creating configmap 'cluster-metadata' to be used by Vector aggretator and agent...")
-    exit_code, output = run_command(
-        f"kubectl create configmap cluster-metadata --from-literal=T2_CLUSTER_ID={cluster_id}",
-        "create configmap cluster-metadata",
-    )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
-
-    logger("Create secret containing the credentials and endpoint for target logging system...")
-    exit_code, output = run_command(
-        f"kubectl create secret generic cluster-logging-target  --from-literal=endpoint='{endpoint}' --from-literal=user='{username}' --from-literal=password='{password}'",
-        "create secret for logging target",
-    )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
-
-    logger("Create configmap for Vector agent containing transformation rules...")
-    exit_code, output = run_command(
-        "kubectl apply -f /src/modules/.cluster_logging/vector-agent-transforms.yaml",
-        "kubectl apply",
-    )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
-
-    logger("Install Vector agent using Helm...")
-    exit_code, output = run_command(
-        "helm install vector-agent vector/vector --version 0.40.0  --values /src/modules/.cluster_logging/vector-agent-values.yaml --wait",
-        "helm install",
-    )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
-
-    logger("Install Vector aggregator using Helm...")
-    exit_code, output = run_command(
-        "helm install vector-aggregator vector/vector --version 0.40.0  --values /src/modules/.cluster_logging/vector-aggregator-values.yaml --wait",
-        "helm install",
-    )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
+    def step(name, command, description):
+        def run():
+            exit_code, output = run_command(command, description)
+            if exit_code != 0:
+                errors[name] = (exit_code, output)
+                return False
+            return True
 
-    logger(
-        "Install eventrouter container to pipe K8s events to stdout to be grabbed by Vector agent..."
-    )
-    exit_code, output = run_command(
-        "kubectl apply -f /src/modules/.cluster_logging/eventrouter.yaml", "install eventrouter"
+        return run
+
+    def guarded(name, function):
+        # (an exception is recorded like a failed command, so that it's reported with its message)
+        def run():
+            try:
+                return function()
+            except Exception as e:
+                errors[name] = (None, [f"{type(e).__name__}: {e}"])
+                return False
+
+        return run
+
+    def apply_manifests():
+        # (the bundle contains the credentials, so it only lives as long as it's needed)
+        fd, bundle_file = tempfile.mkstemp(prefix="cluster-logging-", suffix=".yaml")
+        os.close(fd)
+        try:
+            render_template(
+                CLUSTER_LOGGING_FOLDER,
+                "cluster-logging.yaml.j2",
+                {
+                    "cluster_id": cluster_id,
+                    "endpoint": endpoint,
+                    "username": username,
+                    "password": password,
+                },
+                bundle_file,
+            )
+            return step(
+                "manifests",
+                f"kubectl apply --server-side --force-conflicts --field-manager=operator-test-runner -f {bundle_file}",
+                "kubectl apply",
+            )()
+        finally:
+            os.remove(bundle_file)
+
+    charts = {}
+
+    def fetch_vector_chart():
+        charts["vector"] = get_chart(VECTOR_CHART, VECTOR_CHART_VERSION, logger)
+        return True
+
+    def install_vector(release):
+        # (a packaged chart from the cache has its version already)
+        version = "" if charts["vector"] != VECTOR_CHART else f" --version {VECTOR_CHART_VERSION}"
+        return step(
+            release,
+            f"helm upgrade --install {release} {charts['vector']}{version} --values {CLUSTER_LOGGING_FOLDER}/{release}-values.yaml",
+            "helm install",
+        )()
+
+    results, timings = run_phases(
+        [
+            ("manifests", guarded("manifests", apply_manifests), []),
+            ("vector-chart", guarded("vector-chart", fetch_vector_chart), []),
+            (
+                "vector-agent",
+                guarded("vector-agent", lambda: install_vector("vector-agent")),
+                ["manifests", "vector-chart"],
+            ),
+            (
+                "vector-aggregator",
+                guarded("vector-aggregator", lambda: install_vector("vector-aggregator")),
+                ["manifests", "vector-chart"],
+            ),
+        ],
+        logger,
     )
-    if exit_code != 0:
-        for line in output:
-            logger(line)
-        return False
 
-    return True
+    failed = [name for name, result in results.items() if not result]
+    if failed:
+        logger(f"Cluster logging: {len(failed)} of {len(results)} steps failed or were skipped:")
+        for name in failed:
+            if name not in errors:
+                logger(f"- {name}: skipped (a step it depends on failed)")
+                continue
+            exit_code, output = errors[name]
+            if exit_code is None:
+                logger(f"- {name}: failed with an exception")
+            else:
+                logger(f"- {name}: failed with exit code {exit_code}")
+            for line in output:
+                logger(f"    {line}")
+    return (not failed, timings)
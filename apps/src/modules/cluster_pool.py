@@ -0,0 +1,363 @@
+"""
+This module manages a pool of pre-provisioned ("warm") clusters.
+
+Provisioning a cluster dominates the runtime of many test jobs. The pool keeps clusters
+which were created in advance, keyed by provider, resolved cluster spec and platform version,
+and leases them to test runs.
+
+The pool lives in a directory which is shared by all runners (e.g. a Docker volume):
+
+    <pool_dir>/available/<key>/<cluster id>.json    clusters ready to be leased
+    <pool_dir>/leased/<cluster id>.json             clusters currently leased to a test run
+    <pool_dir>/expiring/<cluster id>.json           clusters being terminated by expire_pool()
+
+A lease is claimed by renaming the entry file from 'available' to 'leased', which is atomic
+on the same filesystem, so two runners can never claim the same cluster.
+A leased cluster is used by exactly one test run and terminated afterwards. The lease is
+the modification time of the entry file in 'leased': the runner renews it by touching the file
+while it uses the cluster (see start_lease_renewal()), the file itself is never rewritten.
+A renewal of an entry which has been moved to 'expiring' fails, so the runner loses the lease.
+Leases which are not renewed within their TTL (e.g. the runner was killed) and clusters
+which exceed their maximum age are terminated by expire_pool(). It claims them the same way
+(rename to 'expiring'), so concurrent runs never terminate a cluster twice.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from time import time
+
+from modules.cluster import create_cluster, terminate_cluster
+from modules.command import run_command
+
+# max. age [seconds] of a pooled cluster, it must leave enough time for a test run
+# (Replicated clusters are created with a TTL of 6h)
+POOL_CLUSTER_MAX_AGE = 3 * 3600
+
+# time [seconds] after which a lease which hasn't been renewed is considered abandoned
+LEASE_TTL = 30 * 60
+
+# interval [seconds] in which the runner renews its lease
+LEASE_RENEW_INTERVAL = 5 * 60
+
+# kubeconfig used by kubectl/helm in the runner (can be set per run via the KUBECONFIG env var)
+KUBECONFIG_FILE = os.environ.get("KUBECONFIG", "/root/.kube/config")
+
+
+def pool_key(provider_id, spec, platform_version):
+    """
+    Calculates the key of the pool for the given cluster parameters.
+
+    provider_id         ID of the cloud provider / vendor
+    spec                dict containing the (resolved) specification of the cluster
+    platform_version    version of the (K8s) platform
+
+    Returns key (String)
+    """
+    canonical = json.dumps(
+        {"provider": provider_id, "spec": spec, "version": platform_version}, sort_keys=True
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[0:16]
+
+
+def _available_dir(pool_dir, key):
+    return os.path.join(pool_dir, "available", key)
+
+
+def _leased_dir(pool_dir):
+    return os.path.join(pool_dir, "leased")
+
+
+def _expiring_dir(pool_dir):
+    return os.path.join(pool_dir, "expiring")
+
+
+def _read_entry(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _try_read_entry(path):
+    """
+    Reads an entry file which was listed before.
+
+    Returns the entry or None if it has been claimed or removed in the meantime.
+    """
+    try:
+        return _read_entry(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(path, entry):
+    """
+    Writes an entry file atomically (write to temp file + rename)
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def _claim(source_path, target_dir):
+    """
+    Atomically moves the given entry file to the target folder ('leased' or 'expiring').
+
+    Returns the path of the claimed entry or None if someone else claimed it first.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    target_path = os.path.join(target_dir, os.path.basename(source_path))
+    try:
+        os.rename(source_path, target_path)
+    except FileNotFoundError:
+        return None
+    return target_path
+
+
+def _lease_expires_at(path, entry):
+    """
+    Returns the time when the lease of the given leased entry expires
+    (last renewal + lease TTL) or None if the entry has been moved in the meantime.
+    """
+    try:
+        return os.path.getmtime(path) + entry.get("lease_ttl", LEASE_TTL)
+    except FileNotFoundError:
+        return None
+
+
+def _list_entries(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".json")
+    )
+
+
+def list_pool_entries(pool_dir):
+    """
+    Returns the entries (dicts) of all clusters of the pool, available, leased and expiring.
+    """
+    paths = _list_entries(_leased_dir(pool_dir)) + _list_entries(_expiring_dir(pool_dir))
+    available_root = os.path.join(pool_dir, "available")
+    if os.path.isdir(available_root):
+        for key in os.listdir(available_root):
+            paths.extend(_list_entries(_available_dir(pool_dir, key)))
+    # (entries which were leased or released in the meantime are skipped)
+    return [entry for entry in map(_try_read_entry, paths) if entry]
+
+
+def count_available(pool_dir, key):
+    """
+    Counts the clusters which are available for the given key.
+    """
+    now = time()
+    entries = map(_try_read_entry, _list_entries(_available_dir(pool_dir, key)))
+    return len([entry for entry in entries if entry and entry["expires_at"] > now])
+
+
+def lease_cluster(
+    pool_dir, provider_id, spec, platform_version, cluster_info_file, logger, lease_ttl=LEASE_TTL
+):
+    """
+    Leases a cluster from the pool and makes it the current cluster (kubeconfig).
+
+    pool_dir            folder of the pool
+    provider_id         ID of the cloud provider / vendor
+    spec                dict containing the (resolved) specification of the cluster
+    platform_version    version of the (K8s) platform
+    cluster_info_file   file to write cluster-specific information into
+    logger              logger (String-consuming function)
+    lease_ttl           time [seconds] after which the lease is considered abandoned
+                        (if it isn't renewed)
+
+    Returns the pool entry (dict) or None if no cluster is available.
+    """
+    key = pool_key(provider_id, spec, platform_version)
+    now = time()
+    for path in _list_entries(_available_dir(pool_dir, key)):
+        # The entry is touched before it is claimed, so that it starts with a fresh lease
+        # and expire_pool() never sees it as an abandoned lease.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        leased_path = _claim(path, _leased_dir(pool_dir))
+        if not leased_path:
+            continue
+        entry = _read_entry(leased_path)
+        if entry["expires_at"] <= now:
+            # too old to be used for a test, expire_pool() will terminate it
+            entry["lease_ttl"] = 0
+            _write_entry(leased_path, entry)
+            continue
+        entry["lease_ttl"] = lease_ttl
+        _write_entry(leased_path, entry)
+        with open(KUBECONFIG_FILE, "w") as f:
+            f.write(entry["kubeconfig"])
+        run_command(f"kubectl get nodes > {cluster_info_file}", "kubectl get nodes")
+        logger(f"Leased cluster {entry['id']} from pool {key}.")
+        return entry
+    logger(f"No cluster available in pool {key}.")
+    return None
+
+
+def renew_lease(pool_dir, entry, logger):
+    """
+    Extends the lease of a leased cluster by touching its entry file.
+    (The file is never rewritten, so a renewal can't bring back an entry which
+    expire_pool() has moved to 'expiring'.)
+
+    pool_dir            folder of the pool
+    entry               pool entry which was previously returned by lease_cluster()
+    logger              logger (String-consuming function)
+
+    Returns True if the lease was renewed, False if it has been lost (expired) in the meantime.
+    """
+    leased_path = os.path.join(_leased_dir(pool_dir), f"{entry['id']}.json")
+    try:
+        os.utime(leased_path)
+    except FileNotFoundError:
+        logger(f"The lease of cluster {entry['id']} has been lost, it can't be renewed.")
+        return False
+    return True
+
+
+def start_lease_renewal(pool_dir, entry, logger, interval=LEASE_RENEW_INTERVAL):
+    """
+    Renews the lease of a leased cluster periodically in a background thread,
+    so that expire_pool() doesn't terminate the cluster while a (long) test run is using it.
+
+    pool_dir            folder of the pool
+    entry               pool entry which was previously returned by lease_cluster()
+    logger              logger (String-consuming function)
+    interval            interval [seconds] of the renewals
+
+    Returns an event which stops the renewal when set.
+    """
+    stopped = threading.Event()
+
+    def renew():
+        while not stopped.wait(interval):
+            if not renew_lease(pool_dir, entry, logger):
+                return
+
+    threading.Thread(target=renew, daemon=True).start()
+    return stopped
+
+
+def release_cluster(pool_dir, entry, logger):
+    """
+    Terminates a leased cluster and removes it from the pool.
+    (A cluster which has been used by a test run is never returned to the pool.)
+
+    pool_dir            folder of the pool
+    entry               pool entry which was previously returned by lease_cluster()
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster was terminated.
+    """
+    if not terminate_cluster(entry["provider"], entry["cluster"], logger):
+        return False
+    for folder in [_leased_dir(pool_dir), _expiring_dir(pool_dir)]:
+        path = os.path.join(folder, f"{entry['id']}.json")
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+
+def refill_pool(pool_dir, provider_id, spec, platform_version, size, id_factory, logger):
+    """
+    Creates clusters until the pool for the given key contains the desired number of clusters.
+    (Blocking operation, clusters are created one after another because they share the kubeconfig)
+
+    pool_dir            folder of the pool
+    provider_id         ID of the cloud provider / vendor
+    spec                dict containing the (resolved) specification of the cluster
+    platform_version    version of the (K8s) platform
+    size                desired number of available clusters
+    id_factory          function without params which returns a new (unique) cluster ID
+    logger              logger (String-consuming function)
+
+    Returns True if the pool contains the desired number of clusters,
+    False if a cluster could not be created.
+    """
+    key = pool_key(provider_id, spec, platform_version)
+    folder = _available_dir(pool_dir, key)
+    os.makedirs(folder, exist_ok=True)
+    missing = size - count_available(pool_dir, key)
+    created = 0
+    while created < missing:
+        id = id_factory()
+        logger(f"Creating cluster {id} for pool {key} ({created + 1}/{missing})...")
+        cluster = create_cluster(provider_id, id, spec, platform_version, os.devnull, logger)
+        if not cluster:
+            logger(f"Cluster for pool {key} could not be created.")
+            break
+        with open(KUBECONFIG_FILE) as f:
+            kubeconfig = f.read()
+        now = time()
+        _write_entry(
+            os.path.join(folder, f"{id}.json"),
+            {
+                "id": id,
+                "key": key,
+                "provider": provider_id,
+                "spec": spec,
+                "platform_version": platform_version,
+                "cluster": cluster,
+                "kubeconfig": kubeconfig,
+                "created_at": now,
+                "expires_at": now + POOL_CLUSTER_MAX_AGE,
+            },
+        )
+        created = created + 1
+    logger(f"Pool {key} contains {count_available(pool_dir, key)} available clusters.")
+    return created >= missing
+
+
+def expire_pool(pool_dir, logger):
+    """
+    Terminates all clusters which are too old to be leased and all abandoned leases.
+
+    pool_dir            folder of the pool
+    logger              logger (String-consuming function)
+
+    Returns the number of terminated clusters.
+    """
+    now = time()
+    candidates = []
+    available_root = os.path.join(pool_dir, "available")
+    if os.path.isdir(available_root):
+        for key in os.listdir(available_root):
+            candidates.extend(
+                (path, False) for path in _list_entries(_available_dir(pool_dir, key))
+            )
+    candidates.extend((path, True) for path in _list_entries(_leased_dir(pool_dir)))
+
+    # The expired entries are claimed (moved to 'expiring') before they are terminated,
+    # so that a concurrent run doesn't terminate them again.
+    expired = []
+    for path, leased in candidates:
+        entry = _try_read_entry(path)
+        if not entry:
+            continue
+        expires_at = _lease_expires_at(path, entry) if leased else entry["expires_at"]
+        if expires_at is None or expires_at > now:
+            continue
+        expiring_path = _claim(path, _expiring_dir(pool_dir))
+        if expiring_path:
+            expired.append(expiring_path)
+
+    terminated = 0
+    for path in expired:
+        entry = _read_entry(path)
+        logger(f"Terminating expired cluster {entry['id']} of pool {entry['key']}...")
+        if release_cluster(pool_dir, entry, logger):
+            terminated = terminated + 1
+        else:
+            # hand it back as an expired lease, so that the next run retries the termination
+            entry["lease_ttl"] = 0
+            _write_entry(path, entry)
+            _claim(path, _leased_dir(pool_dir))
+    return terminated
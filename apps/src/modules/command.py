@@ -2,8 +2,159 @@
 This util module helps you to run system processes
 """
 
-from subprocess import PIPE, Popen, TimeoutExpired
-from time import sleep
+import os
+import re
+import sys
+from collections import deque
+from subprocess import PIPE, STDOUT, Popen, TimeoutExpired
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+# number of trailing output lines kept in memory when streaming the output of a command
+STREAMING_TAIL_SIZE = 200
+
+# max. number of bytes pumped from a process to its output targets at once
+PUMP_BUFFER_SIZE = 64 * 1024
+
+
+# Classes of failures of a command, recognized by its output (the first matching class wins):
+# name -> (pattern, retryable, base delay [seconds] before the first retry)
+FAILURE_CLASSES = {
+    "timeout": (
+        re.compile(r"timed out|timeout|deadline exceeded", re.IGNORECASE),
+        True,
+        30,
+    ),
+    "rate-limit": (
+        re.compile(r"\b429\b|too ?many ?requests|rate limit", re.IGNORECASE),
+        True,
+        60,
+    ),
+    # (status codes only in an HTTP context, other numbers in the output must not match)
+    "registry": (
+        re.compile(
+            r"(\bstatus( code)?:? |\bHTTP/[0-9.]+ |\bresponse code |\bcode[ =])50[0234]\b|"
+            r"bad gateway|service unavailable|internal server error|gateway time-?out|"
+            r"connection reset by peer|unexpected EOF",
+            re.IGNORECASE,
+        ),
+        True,
+        20,
+    ),
+    "dns": (
+        re.compile(
+            r"no such host|temporary failure in name resolution|could not resolve host|"
+            r"server misbehaving",
+            re.IGNORECASE,
+        ),
+        True,
+        10,
+    ),
+    "webhook-not-ready": (
+        re.compile(
+            r"failed calling webhook|no endpoints available for service|connection refused",
+            re.IGNORECASE,
+        ),
+        True,
+        10,
+    ),
+    # (right after CRDs have been installed, the API server doesn't serve their kinds yet)
+    "crd-not-ready": (
+        re.compile(
+            r"no matches for kind|ensure CRDs are installed first|"
+            r"the server could not find the requested resource",
+            re.IGNORECASE,
+        ),
+        True,
+        10,
+    ),
+    # (only errors which are specific to the chart/version or the command line; resources which
+    # are not found (yet), 404s and authorization errors can be transient and are retried)
+    "permanent": (
+        re.compile(
+            r"chart .*not found|no chart (name|version) found|manifest unknown|"
+            r"unknown (version|flag|command|shorthand flag)|"
+            r"invalid (chart|version|semantic version|reference format)|improper constraint",
+            re.IGNORECASE,
+        ),
+        False,
+        0,
+    ),
+}
+
+# number of trailing output lines which are used to classify a failure
+# (the error is reported at the end, earlier lines might contain harmless matches)
+CLASSIFIED_OUTPUT_LINES = 20
+
+# class of failures which are not recognized (retried like before there were classes)
+UNKNOWN_FAILURE = "unknown"
+UNKNOWN_FAILURE_DELAY = 30
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed command is retried.
+
+    Failures are classified by the output of the command (see FAILURE_CLASSES). Permanent
+    failures (e.g. an unknown version) are not retried at all, transient ones are retried
+    with a delay growing exponentially from the base delay of their class.
+    With a fixed delay, all failures are retried blindly after this delay.
+    """
+
+    def __init__(
+        self, max_attempts=3, max_time=None, backoff_factor=2, max_delay=300, fixed_delay=None
+    ):
+        """
+        max_attempts        max. number of attempts (including the first one)
+        max_time            time [seconds] after which no retry is started (None: no limit)
+        backoff_factor      factor by which the delay grows from retry to retry
+        max_delay           upper bound [seconds] of a single delay
+        fixed_delay         if given, delay [seconds] before every retry, regardless of the failure
+        """
+        self.max_attempts = max_attempts
+        self.max_time = max_time
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.fixed_delay = fixed_delay
+
+    def classify(self, exit_code, output):
+        """
+        Returns the name of the class of the failure (see FAILURE_CLASSES, or UNKNOWN_FAILURE)
+
+        exit_code           exit code of the command (-1: killed after timeout)
+        output              output of the command (list of lines)
+        """
+        if exit_code == -1:
+            return "timeout"
+        text = "\n".join(output[-CLASSIFIED_OUTPUT_LINES:])
+        for name, (pattern, _, _) in FAILURE_CLASSES.items():
+            if pattern.search(text):
+                return name
+        return UNKNOWN_FAILURE
+
+    def next_delay(self, failure_class, attempt, elapsed):
+        """
+        Returns the delay [seconds] before the next attempt or None if we should give up.
+
+        failure_class       class of the failure of the last attempt (see classify())
+        attempt             number of the last attempt (starting with 1)
+        elapsed             time [seconds] since the first attempt was started
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if self.fixed_delay is not None:
+            delay = self.fixed_delay
+        else:
+            if failure_class == UNKNOWN_FAILURE:
+                retryable, base_delay = True, UNKNOWN_FAILURE_DELAY
+            else:
+                _, retryable, base_delay = FAILURE_CLASSES[failure_class]
+            if not retryable:
+                return None
+            delay = min(base_delay * self.backoff_factor ** (attempt - 1), self.max_delay)
+        if self.max_time is not None and elapsed + delay > self.max_time:
+            return None
+        return delay
 
 
 def output_to_string_array(byte_stream):
@@ -13,7 +164,17 @@ def output_to_string_array(byte_stream):
     return [line.strip() for line in byte_stream.decode("utf-8").splitlines()]
 
 
-def run_command(command, description, timeout=60, retries=1, delay=60):
+def run_command(
+    command,
+    description,
+    timeout=60,
+    retries=1,
+    delay=60,
+    line_callback=None,
+    retry_policy=None,
+    logger=None,
+    env=None,
+):
     """
     Execute command.
 
@@ -22,35 +183,153 @@ def run_command(command, description, timeout=60, retries=1, delay=60):
     timeout             time [seconds], after which system call is killed
     retries             number of tries to execute command if it returns <> 0
     delay               time [seconds] between two (re)tries.
+    line_callback       if given, the output (stdout and stderr merged) is streamed line by line
+                        to this function (String-consuming) while the command is running, and only
+                        the last STREAMING_TAIL_SIZE lines are kept for the returned output.
+    retry_policy        if given, it decides about the retries instead of retries/delay
+                        (see RetryPolicy)
+    logger              if given, the retries, the attempts and the time spent are logged
+                        (String-consuming function)
+    env                 if given, these environment variables (dict) are set for the command
+                        in addition to the ones of the current process
 
     Returns tuple (exit_code, output)
     """
-    while retries > 0:
-        exit_code, output = _run_command(command, description, timeout)
+    if env:
+        env = {**os.environ, **env}
+    if not retry_policy:
+        retry_policy = RetryPolicy(max_attempts=retries, fixed_delay=delay)
+    start = monotonic()
+    attempt = 0
+    while True:
+        attempt = attempt + 1
+        if line_callback:
+            exit_code, output = _run_command_streaming(
+                command, description, line_callback, timeout, env=env
+            )
+        else:
+            exit_code, output = _run_command(command, description, timeout, env=env)
         if exit_code == 0:
+            if logger and attempt > 1:
+                logger(
+                    f"{description} succeeded after {attempt} attempts "
+                    f"({monotonic() - start:.0f}s)."
+                )
+            return exit_code, output
+        failure_class = retry_policy.classify(exit_code, output)
+        next_delay = retry_policy.next_delay(failure_class, attempt, monotonic() - start)
+        if next_delay is None:
+            if logger:
+                logger(
+                    f"{description} failed ({failure_class}), giving up after {attempt} "
+                    f"attempt(s) ({monotonic() - start:.0f}s)."
+                )
             return exit_code, output
-        retries = retries - 1
-        sleep(delay)
-    return exit_code, output
+        if logger:
+            logger(
+                f"{description} failed ({failure_class}), retrying in {next_delay:.0f}s "
+                f"(attempt {attempt + 1}/{retry_policy.max_attempts})..."
+            )
+        sleep(next_delay)
 
 
-def _run_command(command, description, timeout=60):
+def _run_command(command, description, timeout=60, env=None):
     """
     Execute command (module-internal)
 
     command             command
     description         command (short) description
     timeout             time [seconds], after which system call is killed
+    env                 environment of the command (default: the one of the current process)
 
     Returns tuple (exit_code, output)
     """
-    proc = Popen(["/bin/bash", "-c", command], stdout=PIPE, stderr=PIPE)
+    proc = Popen(["/bin/bash", "-c", command], stdout=PIPE, stderr=PIPE, env=env)
     try:
         output, errs = proc.communicate(timeout=timeout)
     except TimeoutExpired:
         proc.kill()
         _, errs = proc.communicate()
-        return -1, f"{description} timed out after {timeout} seconds."
+        return -1, [f"{description} timed out after {timeout} seconds."]
     if proc.returncode != 0:
         return proc.returncode, output_to_string_array(errs)
     return 0, output_to_string_array(output)
+
+
+def _run_command_streaming(
+    command, description, line_callback, timeout=60, tail_size=STREAMING_TAIL_SIZE, env=None
+):
+    """
+    Execute command and stream its output (module-internal)
+
+    The output is read by a pump thread and handed over to the callback line by line
+    as soon as it arrives. Only a bounded tail of the output is kept in memory.
+
+    command             command
+    description         command (short) description
+    line_callback       function (String-consuming) which is called for every line of output
+    timeout             time [seconds], after which system call is killed
+    tail_size           number of trailing output lines to be returned
+    env                 environment of the command (default: the one of the current process)
+
+    Returns tuple (exit_code, output) where output contains the last tail_size lines
+    """
+    tail = deque(maxlen=tail_size)
+    # (the pump thread may still append after a timeout, so the tail is only copied under the lock)
+    tail_lock = Lock()
+    proc = Popen(["/bin/bash", "-c", command], stdout=PIPE, stderr=STDOUT, env=env)
+
+    def pump():
+        for raw_line in proc.stdout:
+            line = raw_line.decode("utf-8", errors="replace").rstrip()
+            with tail_lock:
+                tail.append(line)
+            line_callback(line)
+
+    pump_thread = Thread(target=pump, daemon=True)
+    pump_thread.start()
+    try:
+        proc.wait(timeout=timeout)
+    except TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        # processes spawned by the command might still hold the pipe, so we don't wait forever
+        pump_thread.join(timeout=5)
+        with tail_lock:
+            output = list(tail)
+        return -1, [*output, f"{description} timed out after {timeout} seconds."]
+    pump_thread.join()
+    return proc.returncode, list(tail)
+
+
+def run_process(args, cwd, output_file, buffer_size=PUMP_BUFFER_SIZE):
+    """
+    Runs a process (without shell) and pumps its output (stdout and stderr merged) to stdout
+    and into the output file while it is running (blocking operation, no timeout).
+
+    The output is passed on in chunks as soon as it arrives (at most buffer_size bytes are held
+    in memory), so progress output which is not terminated by a newline shows up immediately.
+
+    args                command line of the process (list)
+    cwd                 working directory of the process
+    output_file         file the output is written to (replaced if it exists)
+    buffer_size         max. number of bytes pumped at once
+
+    Returns the exit code of the process
+    """
+    with open(output_file, "wb") as f:
+        try:
+            proc = Popen(args, cwd=cwd, stdout=PIPE, stderr=STDOUT, bufsize=0)
+        except OSError as e:
+            message = f"{args[0]} could not be started: {e}\n".encode("utf-8")
+            sys.stdout.buffer.write(message)
+            sys.stdout.flush()
+            f.write(message)
+            return 1
+        with proc:
+            fd = proc.stdout.fileno()
+            while chunk := os.read(fd, buffer_size):
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.flush()
+                f.write(chunk)
+        return proc.returncode
@@ -0,0 +1,182 @@
+"""
+This module provides a log sink which writes timestamped messages to stdout and a logfile.
+
+The logfile is kept open and written with a buffer which is flushed periodically and on exit,
+optionally by a background writer thread, so that the caller never waits for the disk.
+Identical consecutive messages (e.g. the state polls of the providers) are collapsed into
+a counter, so that the logging cost doesn't grow with the number of polls. Output of commands
+which is relayed to the log is written verbatim instead (see LogSink.log()).
+"""
+
+import atexit
+import queue
+import sys
+import threading
+from datetime import UTC, datetime
+from time import monotonic
+
+# time [seconds] after which buffered lines are written to the logfile
+FLUSH_INTERVAL = 2
+
+# size [bytes] of the write buffer of the logfile
+FILE_BUFFER_SIZE = 64 * 1024
+
+# time [seconds] after which a collapsed message is reported even if it is still repeated,
+# so that long waits remain visible in the log
+REPEAT_REPORT_INTERVAL = 60
+
+# marker in the queue of the background writer
+_FLUSH = object()
+_CLOSE = object()
+
+
+class LogSink:
+    """
+    Thread-safe sink for log messages (stdout + logfile).
+    """
+
+    def __init__(self, file, flush_interval=FLUSH_INTERVAL, background=False):
+        """
+        file                logfile (opened lazily in append mode on the first message)
+        flush_interval      time [seconds] after which buffered lines are written to the logfile
+        background          True if the logfile is written by a background writer thread
+        """
+        self.file = file
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._handle = None
+        self._closed = False
+        self._last_flush = monotonic()
+        self._last_message = None
+        self._repeated = 0
+        self._repeated_since = 0.0
+        self._queue = None
+        self._writer = None
+        if background:
+            self._queue = queue.SimpleQueue()
+            self._writer = threading.Thread(target=self._write_loop, name="log-sink", daemon=True)
+            self._writer.start()
+        atexit.register(self.close)
+
+    def log(self, msg="", collapse=True):
+        """
+        Logs the given text message to stdout AND the logfile.
+
+        msg                 text message
+        collapse            False if the message must not be collapsed with identical ones
+                            (e.g. the output of a command, where repeated lines are meaningful)
+        """
+        with self._lock:
+            if self._closed:
+                return
+            now = monotonic()
+            lines = []
+            if not collapse:
+                if self._repeated > 0:
+                    lines.append(self._repeat_line())
+                lines.append(msg)
+                self._last_message = None
+            elif msg and msg == self._last_message:
+                self._repeated = self._repeated + 1
+                if now - self._repeated_since < REPEAT_REPORT_INTERVAL:
+                    return
+                lines.append(self._repeat_line())
+                self._repeated_since = now
+            else:
+                if self._repeated > 0:
+                    lines.append(self._repeat_line())
+                lines.append(msg)
+                self._last_message = msg
+                self._repeated_since = now
+            self._emit(lines)
+
+    def flush(self):
+        """
+        Writes all buffered lines to the logfile.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if self._queue:
+                self._queue.put(_FLUSH)
+            else:
+                self._flush_file()
+
+    def close(self):
+        """
+        Reports a pending collapsed message, flushes and closes the logfile.
+        (Registered to be run on exit)
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if self._repeated > 0:
+                self._emit([self._repeat_line()])
+            self._closed = True
+            if self._queue:
+                self._queue.put(_CLOSE)
+        if self._writer:
+            self._writer.join()
+        else:
+            self._close_file()
+
+    def _repeat_line(self):
+        line = f"(last message repeated {self._repeated} times)"
+        self._repeated = 0
+        return line
+
+    def _emit(self, lines):
+        """
+        Writes the lines to stdout (immediately, to keep the order with the output of
+        subprocesses) and to the logfile (buffered). Has to be called holding the lock.
+        """
+        timestamp = f"{datetime.now(UTC):%Y-%m-%d %H:%M:%S}"
+        text = "".join(f"{timestamp} :: {line}\n" for line in lines)
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        if self._queue:
+            self._queue.put(text)
+        else:
+            self._write_file(text)
+            if monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_file()
+
+    def _write_loop(self):
+        """
+        Loop of the background writer thread
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush_file()
+                continue
+            if item is _CLOSE:
+                self._close_file()
+                return
+            if item is _FLUSH:
+                self._flush_file()
+                continue
+            self._write_file(item)
+            if monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_file()
+
+    def _write_file(self, text):
+        if self._handle is None:
+            try:
+                self._handle = open(self.file, "a", buffering=FILE_BUFFER_SIZE)
+            except OSError as e:
+                print(f"Cannot write logfile {self.file}: {e}", file=sys.stderr)
+                self._handle = False
+        if self._handle:
+            self._handle.write(text)
+
+    def _flush_file(self):
+        if self._handle:
+            self._handle.flush()
+        self._last_flush = monotonic()
+
+    def _close_file(self):
+        if self._handle:
+            self._handle.close()
+        self._handle = False
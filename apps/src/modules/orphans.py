@@ -0,0 +1,104 @@
+"""
+This module finds orphaned test clusters in the accounts of the cluster providers.
+
+A cluster is orphaned if the Operator Test Runner created it but never terminated it
+(e.g. the runner container was killed). The runner marks every cluster it creates as running
+and keeps the mark alive with a heartbeat (see modules/reap_ledger.py). Only clusters with
+a stale mark, i.e. whose heartbeat stopped more than ORPHAN_HEARTBEAT_TTL ago, are orphans:
+clusters of live test runs (however long they take) and clusters which were not created by
+a runner (even if their names match the naming scheme) are never reported.
+Clusters which are known to be taken care of (warm cluster pool, reap ledger) are skipped, too.
+
+The orphans are terminated by recording them in the reap ledger (see modules/reap_ledger.py).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from modules.cluster import list_test_clusters, name_for_id
+from modules.cluster_pool import list_pool_entries
+from modules.reap_ledger import read_entries, read_running_marks
+
+# providers whose accounts are scanned
+PROVIDERS = ["replicated", "ionos"]
+
+# time [seconds] after which a running mark without heartbeat is considered stale
+# (the runner renews it every HEARTBEAT_INTERVAL, see modules/reap_ledger.py)
+ORPHAN_HEARTBEAT_TTL = 30 * 60
+
+
+def known_cluster_names(ledger_dir, pool_dir):
+    """
+    Returns the names of the clusters which must not be reported as orphans:
+    set of tuples (provider ID, cluster name)
+
+    ledger_dir          folder of the reap ledger (or None)
+    pool_dir            folder of the warm cluster pool (or None)
+    """
+    entries = (read_entries(ledger_dir) if ledger_dir else []) + (
+        list_pool_entries(pool_dir) if pool_dir else []
+    )
+    return {(e["provider"], name_for_id(e["provider"], e["id"])) for e in entries}
+
+
+def stale_marks(ledger_dir, heartbeat_ttl):
+    """
+    Returns the running marks (see modules/reap_ledger.py) whose heartbeat has stopped
+    more than heartbeat_ttl [seconds] ago
+    """
+    now = time()
+    return [m for m in read_running_marks(ledger_dir) if now - m["heartbeat_at"] >= heartbeat_ttl]
+
+
+def find_orphans(provider_id, marks, known_names, logger):
+    """
+    Finds the orphaned test clusters in the account of the given provider.
+
+    provider_id         ID of the cloud provider / vendor
+    marks               stale running marks of the provider, see stale_marks()
+    known_names         names of the clusters which are no orphans, see known_cluster_names()
+    logger              logger (String-consuming function)
+
+    Returns list of dict (name, ID, time [seconds] since the last heartbeat,
+    vendor-specific cluster object) or None if the account could not be scanned.
+    """
+    if not marks:
+        return []
+    clusters = list_test_clusters(provider_id, logger)
+    if clusters is None:
+        return None
+    marks_by_name = {name_for_id(provider_id, m["id"]): m for m in marks}
+    now = time()
+    return [
+        {
+            **cluster,
+            "id": marks_by_name[cluster["name"]]["id"],
+            "silent_for": now - marks_by_name[cluster["name"]]["heartbeat_at"],
+        }
+        for cluster in clusters
+        if cluster["name"] in marks_by_name and (provider_id, cluster["name"]) not in known_names
+    ]
+
+
+def find_all_orphans(marks, known_names, logger):
+    """
+    Scans the accounts of all providers which have stale marks (concurrently)
+    for orphaned test clusters.
+
+    marks               stale running marks, see stale_marks()
+    known_names         names of the clusters which are no orphans, see known_cluster_names()
+    logger              logger (String-consuming function)
+
+    Returns dict provider ID -> list of orphans (None if the account could not be scanned)
+    """
+    with ThreadPoolExecutor(max_workers=len(PROVIDERS)) as executor:
+        results = executor.map(
+            lambda provider_id: find_orphans(
+                provider_id,
+                [m for m in marks if m["provider"] == provider_id],
+                known_names,
+                logger,
+            ),
+            PROVIDERS,
+        )
+        return dict(zip(PROVIDERS, results))
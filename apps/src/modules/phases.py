@@ -0,0 +1,109 @@
+"""
+This util module runs the phases of a job as a small dependency graph.
+
+Phases which don't depend on each other (e.g. provisioning a cluster and cloning a
+Git repo) are run concurrently in threads, so that only the phases which really
+depend on each other end up on the critical path.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+
+
+def run_phases(phases, logger, max_workers=4):
+    """
+    Runs the given phases, each one as soon as all of its dependencies succeeded (blocking operation)
+
+    phases              list of tuples (name, function, dependencies):
+                        name            unique name of the phase
+                        function        function without params which executes the phase
+                        dependencies    list of names of the phases which have to succeed before
+                        A phase fails if its function returns None/False or raises an exception.
+                        Phases depending on a failed phase are skipped.
+    logger              logger (String-consuming function)
+    max_workers         maximum number of phases running at the same time
+
+    Returns tuple (results, timings):
+    results             dict phase name -> result of the function (None if failed or skipped)
+    timings             dict phase name -> dict with 'start' (offset [seconds] from the start of
+                        the first phase) and 'duration' [seconds] (only phases which were run)
+    """
+    pending = {name: (function, dependencies) for (name, function, dependencies) in phases}
+    results = {}
+    timings = {}
+    succeeded = set()
+    failed = set()
+    start = monotonic()
+
+    def run_phase(name, function):
+        phase_start = monotonic()
+        logger(f"Starting phase '{name}'...")
+        try:
+            return function()
+        except Exception as e:
+            logger(f"Phase '{name}' raised an exception: {e}")
+            return None
+        finally:
+            timings[name] = {
+                "start": phase_start - start,
+                "duration": monotonic() - phase_start,
+            }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            # skip phases with failed dependencies (transitively)
+            skipped = True
+            while skipped:
+                skipped = False
+                for name, (_, dependencies) in list(pending.items()):
+                    if any(d in failed for d in dependencies):
+                        logger(f"Phase '{name}' is skipped because a dependency failed.")
+                        del pending[name]
+                        failed.add(name)
+                        results[name] = None
+                        skipped = True
+
+            # start all phases whose dependencies succeeded
+            for name, (function, dependencies) in list(pending.items()):
+                if all(d in succeeded for d in dependencies):
+                    del pending[name]
+                    running[executor.submit(run_phase, name, function)] = name
+
+            if not running:
+                for name in pending:
+                    logger(f"Phase '{name}' has unresolvable dependencies and is skipped.")
+                    failed.add(name)
+                    results[name] = None
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+                if results[name] is None or results[name] is False:
+                    failed.add(name)
+                else:
+                    succeeded.add(name)
+
+    log_phase_timings(timings, monotonic() - start, logger)
+    return results, timings
+
+
+def log_phase_timings(timings, wall_time, logger):
+    """
+    Logs the durations of the phases and how much time was saved by running them concurrently.
+
+    timings             dict phase name -> dict with 'start' and 'duration' (see run_phases())
+    wall_time           overall duration [seconds]
+    logger              logger (String-consuming function)
+    """
+    for name, timing in sorted(timings.items(), key=lambda t: t[1]["start"]):
+        logger(
+            f"Phase '{name}' started at +{timing['start']:.0f}s and took {timing['duration']:.0f}s"
+        )
+    serial_time = sum(timing["duration"] for timing in timings.values())
+    logger(
+        f"Phases took {wall_time:.0f}s (serial: {serial_time:.0f}s, "
+        f"moved off the critical path: {serial_time - wall_time:.0f}s)"
+    )
@@ -0,0 +1,114 @@
+"""
+This util module helps you to wait for a (cloud) resource to reach a desired state.
+
+Instead of polling in a fixed interval, the poller uses a hint of how long the state
+transition is expected to take: While the resource is far from being ready, it polls
+rarely. The closer we get to the expected duration, the shorter the intervals get.
+Once the expected duration has passed, the resource is most likely to become ready any moment,
+so the poller keeps polling in a short interval (1/GRACE_INTERVAL_DIVISOR of the expected
+duration, at least the min. interval) for a grace window (up to GRACE_FACTOR times
+the expected duration). Only after that, it backs off exponentially (with jitter)
+until the resource is ready or the hard deadline is reached.
+"""
+
+import random
+from time import monotonic, sleep
+
+# bounds [seconds] for the time between two polls
+MIN_INTERVAL = 5
+MAX_INTERVAL = 60
+
+# the poller keeps polling in the grace interval until this multiple of the expected duration
+GRACE_FACTOR = 2
+
+# interval during the grace window: this fraction of the expected duration (at least the min.
+# interval), so that slow transitions (e.g. a nodepool taking 15 min.) aren't polled every 5s
+GRACE_INTERVAL_DIVISOR = 20
+
+# growth factor of the interval once the grace window has passed
+BACKOFF_FACTOR = 1.5
+
+# relative jitter applied to every interval, so that concurrent waiters don't poll in lockstep
+JITTER = 0.2
+
+
+def next_interval(elapsed, expected_duration, overdue_polls, min_interval, max_interval):
+    """
+    Calculates the time to sleep before the next poll.
+
+    elapsed             time [seconds] since the wait started
+    expected_duration   time [seconds] the state transition is expected to take
+    overdue_polls       number of polls already done after the grace window has passed
+    min_interval        lower bound of the interval [seconds]
+    max_interval        upper bound of the interval [seconds]
+
+    Returns the interval [seconds]
+    """
+    remaining = expected_duration - elapsed
+    if remaining > 0:
+        # halve the distance to the expected point in time
+        interval = remaining / 2
+    elif elapsed < expected_duration * GRACE_FACTOR:
+        interval = max(min_interval, expected_duration / GRACE_INTERVAL_DIVISOR)
+    else:
+        interval = min_interval * BACKOFF_FACTOR**overdue_polls
+    interval = min(max(interval, min_interval), max_interval)
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def wait_for_state(
+    description,
+    read_state,
+    target_state,
+    logger,
+    expected_duration=60,
+    deadline=3600,
+    min_interval=MIN_INTERVAL,
+    max_interval=MAX_INTERVAL,
+):
+    """
+    Waits until a resource is in the desired state (blocking method)
+
+    description         (short) description of the resource, e.g. "Cluster 1234"
+    read_state          function without params which returns the current state of the resource
+    target_state        desired state
+    logger              logger (String-consuming function)
+    expected_duration   hint how long [seconds] the state transition usually takes
+    deadline            time [seconds] after which we stop waiting
+    min_interval        lower bound of the interval [seconds] between two polls
+    max_interval        upper bound of the interval [seconds] between two polls
+
+    Returns True if the resource reached the target state, False if the deadline was hit.
+    """
+    start = monotonic()
+    polls = 0
+    overdue_polls = 0
+    poll_time = 0.0
+
+    while True:
+        poll_start = monotonic()
+        state = read_state()
+        poll_time = poll_time + monotonic() - poll_start
+        polls = polls + 1
+        logger(f"{description} is in state {state}")
+
+        elapsed = monotonic() - start
+        if state == target_state:
+            break
+        if elapsed >= deadline:
+            logger(
+                f"{description} did not reach state {target_state} within {deadline} seconds."
+            )
+            break
+        if elapsed >= expected_duration * GRACE_FACTOR:
+            overdue_polls = overdue_polls + 1
+        interval = next_interval(
+            elapsed, expected_duration, overdue_polls, min_interval, max_interval
+        )
+        sleep(min(interval, deadline - elapsed))
+
+    logger(
+        f"Waited {elapsed:.0f}s for {description} (expected: {expected_duration}s), "
+        f"{polls} polls, avg. poll latency {poll_time / polls:.1f}s"
+    )
+    return state == target_state
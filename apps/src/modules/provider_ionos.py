@@ -2,45 +2,202 @@
 This module creates IONOS clusters using the CLI
 """
 
-from time import sleep
+import fcntl
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from time import time
 
 from modules.command import run_command
+from modules.poller import wait_for_state
 
+# Hints how long [seconds] a resource usually takes to reach a state (None means: deleted).
+# They are used by the poller to poll rarely in the beginning and more eagerly towards the end.
+DATACENTER_STATE_DURATIONS = {"AVAILABLE": 30, None: 60}
+CLUSTER_STATE_DURATIONS = {"ACTIVE": 600, None: 300}
+NODEPOOL_STATE_DURATIONS = {"ACTIVE": 900, None: 300}
 
-def query_command_for_table(command, description):
-    """
-    Runs the given command and returns the results as a list of dicts
-    """
-    cmd_output = run_command(command, description)
-    if cmd_output[0] != 0:
-        return (cmd_output[0], cmd_output[1])
-    if len(cmd_output[1]) == 0:
-        return (0, [])
-    headers = cmd_output[1][0]
-    column_names = [c for c in headers.split(" ") if len(c) > 0]
-    columns = []
-    index = 0
-    while index < len(column_names):
-        if index < len(column_names) - 1:
-            columns.append(
-                (
-                    column_names[index],
-                    headers.find(column_names[index]),
-                    headers.find(column_names[index + 1]),
-                )
+# time [seconds] after which we give up waiting for a state
+STATE_DEADLINE = 3600
+
+# time [seconds] after which a delete which didn't take effect is issued again (reaper)
+DELETE_RETRY_INTERVAL = 600
+
+# kubeconfig for the created cluster (can be set per run via the KUBECONFIG env var)
+KUBECONFIG_FILE = os.environ.get("KUBECONFIG", "/root/.kube/config")
+
+# compact record of an IONOS resource (datacenter, K8s cluster or nodepool)
+Resource = namedtuple("Resource", ["id", "name", "state", "created"], defaults=[None])
+
+# names of the resources created by the Operator Test Runner (see name_for_id())
+CLUSTER_NAME_PATTERN = re.compile(r"^[0-9a-f]{10}$")
+
+# list commands (their results are cached, see query_list())
+DATACENTER_LIST_COMMAND = "ionosctl datacenter list"
+CLUSTER_LIST_COMMAND = "ionosctl k8s cluster list"
+
+# time [seconds] during which the result of a list command is shared between all waiters
+LIST_CACHE_TTL = 5
+
+# If set, list results are also shared between processes using files in this folder
+LIST_CACHE_DIR = os.environ.get("IONOS_LIST_CACHE_DIR")
+
+# hit/miss counters of the list cache
+list_cache_stats = {"hits": 0, "misses": 0}
+
+# in-process list cache: command -> (timestamp, result), and one lock per command
+_list_cache = {}
+_list_cache_locks = {}
+_list_cache_locks_lock = threading.Lock()
+
+
+def parse_resources(json_output):
+    """
+    Parses the JSON output (--output json) of ionosctl into compact records.
+
+    The output is either a single resource (create commands) or a collection whose
+    'items' are resources (list commands). Only the fields we need are kept.
+
+    json_output         JSON document (String)
+
+    Returns list of Resource
+    """
+    if len(json_output.strip()) == 0:
+        return []
+    document = json.loads(json_output)
+    if isinstance(document, list):
+        items = document
+    elif document.get("type") == "collection" or "items" in document:
+        items = document.get("items", [])
+    else:
+        items = [document]
+    return [
+        Resource(
+            item.get("id"),
+            item.get("properties", {}).get("name"),
+            item.get("metadata", {}).get("state"),
+            item.get("metadata", {}).get("createdDate"),
+        )
+        for item in items
+    ]
+
+
+def nodepool_list_command(cluster_id):
+    """
+    Returns the command which lists the nodepools of the given K8s cluster
+    """
+    return f"ionosctl k8s nodepool list --cluster-id {cluster_id}"
+
+
+def query_command_for_resources(command, description):
+    """
+    Runs the given ionosctl command with JSON output and returns the results as a list of Resource
+    """
+    exit_code, output = run_command(f"{command} --output json", description)
+    if exit_code != 0:
+        return (exit_code, output)
+    try:
+        return (0, parse_resources("\n".join(output)))
+    except (ValueError, AttributeError) as e:
+        return (1, [f"Could not parse output of {description}: {e}"])
+
+
+def _list_cache_file(command):
+    return os.path.join(LIST_CACHE_DIR, hashlib.sha256(command.encode("utf-8")).hexdigest())
+
+
+def _query_list_via_file(command, description):
+    """
+    Runs a list command, sharing the result with other processes via a cache file.
+    The file is locked while the command is running, so concurrent processes wait for the
+    result instead of running the same command.
+
+    Returns tuple (exit_code, result, hit)
+    """
+    os.makedirs(LIST_CACHE_DIR, exist_ok=True)
+    cache_file = _list_cache_file(command)
+    with open(f"{cache_file}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(cache_file) as f:
+                snapshot = json.load(f)
+            if time() - snapshot["timestamp"] < LIST_CACHE_TTL:
+                return (0, [Resource(*r) for r in snapshot["result"]], True)
+        except (OSError, ValueError, KeyError):
+            pass
+        exit_code, result = query_command_for_resources(command, description)
+        if exit_code == 0:
+            # (unique temp file per writer, the rename makes the result visible atomically)
+            fd, tmp_file = tempfile.mkstemp(
+                prefix=f"{os.path.basename(cache_file)}.", suffix=".tmp", dir=LIST_CACHE_DIR
             )
+            with os.fdopen(fd, "w") as f:
+                json.dump({"timestamp": time(), "result": result}, f)
+            os.replace(tmp_file, cache_file)
+        return (exit_code, result, False)
+
+
+def query_list(command, description):
+    """
+    Runs the given list command and returns the results as a list of Resource
+    (see query_command_for_resources()).
+
+    Successful results are cached for LIST_CACHE_TTL seconds, so that concurrent waiters
+    share one list result instead of each calling the IONOS API.
+    """
+    with _list_cache_locks_lock:
+        lock = _list_cache_locks.setdefault(command, threading.Lock())
+    with lock:
+        cached = _list_cache.get(command)
+        if cached and time() - cached[0] < LIST_CACHE_TTL:
+            list_cache_stats["hits"] = list_cache_stats["hits"] + 1
+            return (0, cached[1])
+        if LIST_CACHE_DIR:
+            exit_code, result, hit = _query_list_via_file(command, description)
         else:
-            columns.append((column_names[index], headers.find(column_names[index]), -1))
-        index = index + 1
-    result = []
-    for line in cmd_output[1][1:]:
-        result.append(
-            {
-                name: line[start:end].strip() if end != -1 else line[start:].strip()
-                for (name, start, end) in columns
-            }
-        )
-    return (0, result)
+            exit_code, result = query_command_for_resources(command, description)
+            hit = False
+        counter = "hits" if hit else "misses"
+        list_cache_stats[counter] = list_cache_stats[counter] + 1
+        if exit_code == 0:
+            _list_cache[command] = (time(), result)
+        return (exit_code, result)
+
+
+def invalidate_list_cache(command):
+    """
+    Drops the cached result of the given list command, e.g. after a resource it lists
+    has been created or deleted. The results of other list commands are kept.
+
+    A list command which is currently running is waited for (the locks of query_list()),
+    so that its result, which might predate the change, doesn't survive the invalidation.
+    """
+    with _list_cache_locks_lock:
+        lock = _list_cache_locks.setdefault(command, threading.Lock())
+    with lock:
+        _list_cache.pop(command, None)
+        if not LIST_CACHE_DIR or not os.path.isdir(LIST_CACHE_DIR):
+            return
+        cache_file = _list_cache_file(command)
+        with open(f"{cache_file}.lock", "w") as file_lock:
+            fcntl.flock(file_lock, fcntl.LOCK_EX)
+            try:
+                os.remove(cache_file)
+            except FileNotFoundError:
+                pass
+
+
+def log_list_cache_stats(logger):
+    """
+    Logs the hit/miss counters of the list cache
+    """
+    logger(
+        f"IONOS list cache: {list_cache_stats['hits']} hits, {list_cache_stats['misses']} misses"
+    )
 
 
 def create_datacenter(name, location, logger):
@@ -54,14 +211,15 @@ def create_datacenter(name, location, logger):
     Returns the IONOS-internal datacenter ID
     """
     command = f"ionosctl datacenter create --name {name} --location {location}"
-    exit_code, output = query_command_for_table(command, "create datacenter")
+    exit_code, output = query_command_for_resources(command, "create datacenter")
+    invalidate_list_cache(DATACENTER_LIST_COMMAND)
     if exit_code != 0:
         logger(
             f"Creating a datacenter named '{name}' failed with exit code {exit_code} and the following message:"
         )
         print(output)
         return None
-    return output[0]["DatacenterId"]
+    return output[0].id
 
 
 def get_datacenter(id, logger):
@@ -71,13 +229,13 @@ def get_datacenter(id, logger):
     id                  ID of the DC
     logger              logger (String-consuming function)
     """
-    command = "ionosctl datacenter list"
-    exit_code, output = query_command_for_table(command, "list datacenters")
+    command = DATACENTER_LIST_COMMAND
+    exit_code, output = query_list(command, "list datacenters")
     if exit_code != 0:
         logger(f"Reading datacenters failed with exit code {exit_code} and the following message:")
         print(output)
         return None
-    return next(iter([dc for dc in output if dc["DatacenterId"] == id]), None)
+    return next((dc for dc in output if dc.id == id), None)
 
 
 def delete_datacenter(id, logger):
@@ -89,6 +247,7 @@ def delete_datacenter(id, logger):
     """
     command = f"ionosctl datacenter delete --datacenter-id {id} --force"
     exit_code, output = run_command(command, "delete datacenter")
+    invalidate_list_cache(DATACENTER_LIST_COMMAND)
     if exit_code != 0:
         logger(
             f"Deleting the datacenter {id} failed with exit code {exit_code} and the following message:"
@@ -101,20 +260,27 @@ def delete_datacenter(id, logger):
 def wait_for_datacenter_state(id, target_state, logger):
     """
     Waits until a datacenter is in the desired state (blocking method)
-    Polls the CLI every 5 seconds.
+    Polls the CLI with an adaptive interval.
 
     id                  ID of the DC
     target_state        desired state
     logger              logger (String-consuming function)
+
+    Returns True if the state was reached, False if we gave up waiting.
     """
-    datacenter = get_datacenter(id, logger)
-    state = datacenter["State"] if datacenter else None
-    logger(f"Datacenter {id} is in state {state}")
-    while state != target_state:
-        sleep(5)
+
+    def read_state():
         datacenter = get_datacenter(id, logger)
-        state = datacenter["State"] if datacenter else None
-        logger(f"Datacenter {id} is in state {state}")
+        return datacenter.state if datacenter else None
+
+    return wait_for_state(
+        f"Datacenter {id}",
+        read_state,
+        target_state,
+        logger,
+        expected_duration=DATACENTER_STATE_DURATIONS.get(target_state, 60),
+        deadline=STATE_DEADLINE,
+    )
 
 
 def ionosctl_create_cluster(name, k8s_version, logger):
@@ -128,14 +294,15 @@ def ionosctl_create_cluster(name, k8s_version, logger):
     Returns the IONOS-internal cluster ID
     """
     command = f"ionosctl k8s cluster create --name {name} --k8s-version {k8s_version}"
-    exit_code, output = query_command_for_table(command, "create cluster")
+    exit_code, output = query_command_for_resources(command, "create cluster")
+    invalidate_list_cache(CLUSTER_LIST_COMMAND)
     if exit_code != 0:
         logger(
             f"Creating a cluster named '{name}' failed with exit code {exit_code} and the following message:"
         )
         print(output)
         return None
-    return output[0]["ClusterId"]
+    return output[0].id
 
 
 def get_cluster(id, logger):
@@ -145,13 +312,13 @@ def get_cluster(id, logger):
     id                  ID of the K8s cluster
     logger              logger (String-consuming function)
     """
-    command = "ionosctl k8s cluster list"
-    exit_code, output = query_command_for_table(command, "list clusters")
+    command = CLUSTER_LIST_COMMAND
+    exit_code, output = query_list(command, "list clusters")
     if exit_code != 0:
         logger(f"Reading clusters failed with exit code {exit_code} and the following message:")
         print(output)
         return None
-    return next(iter([c for c in output if c["ClusterId"] == id]), None)
+    return next((c for c in output if c.id == id), None)
 
 
 def delete_cluster(id, logger):
@@ -163,6 +330,7 @@ def delete_cluster(id, logger):
     """
     command = f"ionosctl k8s cluster delete --cluster-id {id} --force"
     exit_code, output = run_command(command, "delete cluster")
+    invalidate_list_cache(CLUSTER_LIST_COMMAND)
     if exit_code != 0:
         logger(
             f"Deleting the cluster {id} failed with exit code {exit_code} and the following message:"
@@ -175,20 +343,27 @@ def delete_cluster(id, logger):
 def wait_for_cluster_state(id, target_state, logger):
     """
     Waits until a K8s cluster is in the desired state (blocking method)
-    Polls the CLI every 5 seconds.
+    Polls the CLI with an adaptive interval.
 
     id                  ID of the cluster
     target_state        desired state
     logger              logger (String-consuming function)
+
+    Returns True if the state was reached, False if we gave up waiting.
     """
-    cluster = get_cluster(id, logger)
-    state = cluster["State"] if cluster else None
-    logger(f"Cluster {id} is in state {state}")
-    while state != target_state:
-        sleep(5)
+
+    def read_state():
         cluster = get_cluster(id, logger)
-        state = cluster["State"] if cluster else None
-        logger(f"Cluster {id} is in state {state}")
+        return cluster.state if cluster else None
+
+    return wait_for_state(
+        f"Cluster {id}",
+        read_state,
+        target_state,
+        logger,
+        expected_duration=CLUSTER_STATE_DURATIONS.get(target_state, 60),
+        deadline=STATE_DEADLINE,
+    )
 
 
 def create_nodepool(
@@ -210,14 +385,15 @@ def create_nodepool(
     Returns the IONOS-internal nodepool ID
     """
     command = f"ionosctl k8s nodepool create --datacenter-id {datacenter_id} --cluster-id {cluster_id} --name {name} --cores {cores} --node-count {node_count} --ram {ram} --storage-type {disk_type} --storage-size {disk_size}"
-    exit_code, output = query_command_for_table(command, "create nodepool")
+    exit_code, output = query_command_for_resources(command, "create nodepool")
+    invalidate_list_cache(nodepool_list_command(cluster_id))
     if exit_code != 0:
         logger(
             f"Creating a nodepool named '{name}' failed with exit code {exit_code} and the following message:"
         )
         print(output)
         return None
-    return output[0]["NodePoolId"]
+    return output[0].id
 
 
 def get_nodepool(id, cluster_id, logger):
@@ -228,13 +404,13 @@ def get_nodepool(id, cluster_id, logger):
     cluster_id          ID of the K8s cluster
     logger              logger (String-consuming function)
     """
-    command = f"ionosctl k8s nodepool list --cluster-id {cluster_id}"
-    exit_code, output = query_command_for_table(command, "list nodepools")
+    command = nodepool_list_command(cluster_id)
+    exit_code, output = query_list(command, "list nodepools")
     if exit_code != 0:
         logger(f"Reading nodepools failed with exit code {exit_code} and the following message:")
         print(output)
         return None
-    return next(iter([n for n in output if n["NodePoolId"] == id]), None)
+    return next((n for n in output if n.id == id), None)
 
 
 def delete_nodepool(id, cluster_id, logger):
@@ -247,6 +423,7 @@ def delete_nodepool(id, cluster_id, logger):
     """
     command = f"ionosctl k8s nodepool delete --cluster-id {cluster_id} --nodepool-id {id} --force"
     exit_code, output = run_command(command, "delete nodepool")
+    invalidate_list_cache(nodepool_list_command(cluster_id))
     if exit_code != 0:
         logger(
             f"Deleting the nodepool {id} of cluster {cluster_id} failed with exit code {exit_code} and the following message:"
@@ -259,29 +436,36 @@ def delete_nodepool(id, cluster_id, logger):
 def wait_for_nodepool_state(id, cluster_id, target_state, logger):
     """
     Waits until a K8s nodepool is in the desired state (blocking method)
-    Polls the CLI every 5 seconds.
+    Polls the CLI with an adaptive interval.
 
     id                  ID of the nodepool
     cluster_id          ID of the K8s cluster
     target_state        desired state
     logger              logger (String-consuming function)
+
+    Returns True if the state was reached, False if we gave up waiting.
     """
-    nodepool = get_nodepool(id, cluster_id, logger)
-    state = nodepool["State"] if nodepool else None
-    logger(f"Nodepool {id} is in state {state}")
-    while state != target_state:
-        sleep(5)
+
+    def read_state():
         nodepool = get_nodepool(id, cluster_id, logger)
-        state = nodepool["State"] if nodepool else None
-        logger(f"Nodepool {id} is in state {state}")
+        return nodepool.state if nodepool else None
+
+    return wait_for_state(
+        f"Nodepool {id}",
+        read_state,
+        target_state,
+        logger,
+        expected_duration=NODEPOOL_STATE_DURATIONS.get(target_state, 60),
+        deadline=STATE_DEADLINE,
+    )
 
 
 def update_kubeconfig(cluster_id, logger):
     """
-    Updates the kubeconfig (in default folder /root/.kube/config/) for the given cluster
+    Updates the kubeconfig (KUBECONFIG_FILE, default /root/.kube/config) for the given cluster
     """
     exit_code, output = run_command(
-        f"ionosctl k8s kubeconfig get --cluster-id {cluster_id} > /root/.kube/config",
+        f"ionosctl k8s kubeconfig get --cluster-id {cluster_id} > {KUBECONFIG_FILE}",
         "update kubeconfig",
     )
     if exit_code != 0:
@@ -298,6 +482,75 @@ def write_cluster_info_file(cluster_info_file):
     run_command(f"kubectl get nodes > {cluster_info_file}", "kubectl get nodes")
 
 
+def list_test_clusters(logger):
+    """
+    Lists the clusters in the account which were created by the Operator Test Runner.
+    The datacenter, K8s cluster and nodepool of a cluster share the name (see name_for_id()),
+    the resources are grouped by it. Incomplete clusters (e.g. only a datacenter) are included.
+
+    logger              logger (String-consuming function)
+
+    Returns list of dict (name, created_at (ISO timestamp), vendor-specific cluster object)
+    or None if the resources could not be listed.
+    """
+    clusters = {}
+
+    def add(resource, key):
+        if not CLUSTER_NAME_PATTERN.match(resource.name or ""):
+            return False
+        if resource.name not in clusters:
+            clusters[resource.name] = {
+                "name": resource.name,
+                "created_at": resource.created,
+                "cluster": {
+                    "cluster_name": resource.name,
+                    "datacenter_id": None,
+                    "cluster_id": None,
+                    "nodepool_id": None,
+                },
+            }
+        cluster = clusters[resource.name]
+        if resource.created and (
+            not cluster["created_at"] or resource.created < cluster["created_at"]
+        ):
+            cluster["created_at"] = resource.created
+        if cluster["cluster"][key]:
+            logger(f"Ignoring {key} {resource.id}, there are several resources named {resource.name}")
+            return False
+        cluster["cluster"][key] = resource.id
+        return True
+
+    for command, description, key in [
+        (DATACENTER_LIST_COMMAND, "list datacenters", "datacenter_id"),
+        (CLUSTER_LIST_COMMAND, "list clusters", "cluster_id"),
+    ]:
+        exit_code, output = query_list(command, description)
+        if exit_code != 0:
+            logger(f"Listing failed ({description}) with exit code {exit_code}:")
+            for line in output:
+                logger(line)
+            return None
+        for resource in output:
+            if add(resource, key) and key == "cluster_id":
+                nodepool_command = nodepool_list_command(resource.id)
+                exit_code, nodepools = query_list(nodepool_command, "list nodepools")
+                if exit_code != 0:
+                    logger(f"Listing failed (list nodepools) with exit code {exit_code}:")
+                    for line in nodepools:
+                        logger(line)
+                    return None
+                for nodepool in nodepools:
+                    add(nodepool, "nodepool_id")
+    return list(clusters.values())
+
+
+def name_for_id(id):
+    """
+    Returns the name of the cluster with the given ID (the first 10 digits of the UUID)
+    """
+    return id[0:10]
+
+
 def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     """
     Creates an IONOS cluster with the given spec. (Blocking operation)
@@ -311,10 +564,17 @@ def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     Returns vendor-specific cluster object.
 
     If not cluster could be created, the reason is logged and None is returned.
+    The resources which were already created are deleted in this case.
     """
 
-    # name is first 10 digits of ID
-    cluster_name = id[0:10]
+    cluster_name = name_for_id(id)
+    # resources created so far (for the cleanup if the creation fails)
+    created = {
+        "cluster_name": cluster_name,
+        "datacenter_id": None,
+        "cluster_id": None,
+        "nodepool_id": None,
+    }
 
     logger(f"Creating cluster {cluster_name} on IONOS...")
 
@@ -323,17 +583,26 @@ def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     if not datacenter_id:
         logger("Error creating datacenter.")
         return None
+    created["datacenter_id"] = datacenter_id
     logger(f"Created datacenter '{cluster_name}' (id={datacenter_id})")
-    wait_for_datacenter_state(datacenter_id, "AVAILABLE", logger)
+    if not wait_for_datacenter_state(datacenter_id, "AVAILABLE", logger):
+        logger("Datacenter did not become available.")
+        delete_partial_cluster(created, logger)
+        return None
     logger(f"Datacenter '{cluster_name}' (id={datacenter_id}) is ready for use.")
 
     logger(f"Creating K8s cluster '{cluster_name}'...")
     cluster_id = ionosctl_create_cluster(cluster_name, platform_version, logger)
     if not cluster_id:
         logger("Error creating K8s cluster.")
+        delete_partial_cluster(created, logger)
         return None
+    created["cluster_id"] = cluster_id
     logger(f"Created K8s cluster '{cluster_name}' (id={cluster_id})")
-    wait_for_cluster_state(cluster_id, "ACTIVE", logger)
+    if not wait_for_cluster_state(cluster_id, "ACTIVE", logger):
+        logger("K8s cluster did not become active.")
+        delete_partial_cluster(created, logger)
+        return None
     logger(f"K8s Cluster '{cluster_name}' (id={cluster_id}) is ready for use.")
 
     logger(f"Creating nodepool '{cluster_name}'...")
@@ -350,55 +619,150 @@ def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     )
     if not nodepool_id:
         logger("Error creating nodepool.")
+        delete_partial_cluster(created, logger)
         return None
+    created["nodepool_id"] = nodepool_id
     logger(f"Created nodepool '{cluster_name}' (id={nodepool_id})")
-    wait_for_nodepool_state(nodepool_id, cluster_id, "ACTIVE", logger)
+    if not wait_for_nodepool_state(nodepool_id, cluster_id, "ACTIVE", logger):
+        logger("Nodepool did not become active.")
+        delete_partial_cluster(created, logger)
+        return None
     logger(f"Nodepool '{cluster_name}' (id={nodepool_id}) is ready for use.")
 
     logger("Updating kubeconfig...")
     if not update_kubeconfig(cluster_id, logger):
         logger("Error updating kubeconfig.")
+        delete_partial_cluster(created, logger)
         return None
 
     write_cluster_info_file(cluster_info_file)
+    log_list_cache_stats(logger)
 
-    return {
-        "cluster_name": cluster_name,
-        "datacenter_id": datacenter_id,
-        "cluster_id": cluster_id,
-        "nodepool_id": nodepool_id,
-    }
+    return created
+
+
+def delete_partial_cluster(id, logger):
+    """
+    Deletes the resources of a cluster whose creation failed. (Blocking operation)
+    If they can't be deleted, they're left to the orphan reaper (see modules/orphans.py),
+    which finds them by their name.
+
+    id                  vendor-specific cluster object, the IDs of the resources which
+                        weren't created are None
+    logger              logger (String-consuming function)
+    """
+    logger(f"Deleting the resources which were created for '{id['cluster_name']}'...")
+    if not terminate_cluster(id, logger):
+        logger(f"The resources of '{id['cluster_name']}' could not be deleted.")
 
 
 def terminate_cluster(id, logger):
     """
     Terminates the given cluster. (Blocking operation)
+    Resources whose ID is None (i.e. which were never created) are skipped.
 
     id                  vendor-specific cluster object which was previously returned by create_cluster()
     logger              logger (String-consuming function)
     """
-    if not delete_nodepool(id["nodepool_id"], id["cluster_id"], logger):
-        logger("Error deleting nodepool")
-        return False
+    if id["nodepool_id"]:
+        if not delete_nodepool(id["nodepool_id"], id["cluster_id"], logger):
+            logger("Error deleting nodepool")
+            return False
 
-    logger(f"Deleting nodepool for '{id['cluster_name']}'...")
-    wait_for_nodepool_state(id["nodepool_id"], id["cluster_id"], None, logger)
-    logger(f"Nodepool for '{id['cluster_name']}' successfully deleted.")
+        logger(f"Deleting nodepool for '{id['cluster_name']}'...")
+        if not wait_for_nodepool_state(id["nodepool_id"], id["cluster_id"], None, logger):
+            logger("Nodepool could not be deleted.")
+            return False
+        logger(f"Nodepool for '{id['cluster_name']}' successfully deleted.")
 
-    if not delete_cluster(id["cluster_id"], logger):
-        logger("Error deleting cluster")
-        return False
+    if id["cluster_id"]:
+        if not delete_cluster(id["cluster_id"], logger):
+            logger("Error deleting cluster")
+            return False
 
-    logger(f"Deleting cluster for '{id['cluster_name']}'...")
-    wait_for_cluster_state(id["cluster_id"], None, logger)
-    logger(f"Cluster for '{id['cluster_name']}' successfully deleted.")
+        logger(f"Deleting cluster for '{id['cluster_name']}'...")
+        if not wait_for_cluster_state(id["cluster_id"], None, logger):
+            logger("Cluster could not be deleted.")
+            return False
+        logger(f"Cluster for '{id['cluster_name']}' successfully deleted.")
 
     if not delete_datacenter(id["datacenter_id"], logger):
         logger("Error deleting datacenter")
         return False
 
     logger(f"Deleting datacenter for '{id['cluster_name']}'...")
-    wait_for_datacenter_state(id["datacenter_id"], None, logger)
+    if not wait_for_datacenter_state(id["datacenter_id"], None, logger):
+        logger("Datacenter could not be deleted.")
+        return False
     logger(f"Datacenter for '{id['cluster_name']}' successfully deleted.")
+    log_list_cache_stats(logger)
+
+    return True
+
+
+def _resource_exists(command, description, id):
+    """
+    Checks whether the resource with the given ID is in the result of the given list command
+
+    Returns True/False, or None if the list command failed (i.e. we don't know)
+    """
+    exit_code, output = query_list(command, description)
+    if exit_code != 0:
+        return None
+    return any(r.id == id for r in output)
+
+
+def advance_termination(id, progress, logger):
+    """
+    Advances the termination of the given cluster by one step without waiting for it.
+    (Used by the reaper, which calls it repeatedly until the cluster is gone)
+
+    The resources are deleted in dependency order (nodepool, K8s cluster, datacenter),
+    a resource is only deleted when the resources depending on it are gone.
+    Deletes which didn't take effect are issued again after DELETE_RETRY_INTERVAL.
+    If a resource can't be read, nothing is done (the next call tries again).
+
+    id                  vendor-specific cluster object which was previously returned by create_cluster()
+    progress            dict resource -> time the delete was issued (updated by this function)
+    logger              logger (String-consuming function)
+
+    Returns True if all resources of the cluster are gone.
+    """
+
+    def issue_delete(resource, delete):
+        issued = progress.get(resource)
+        if issued is None or time() - issued >= DELETE_RETRY_INTERVAL:
+            logger(f"Deleting {resource} of '{id['cluster_name']}'...")
+            if delete():
+                progress[resource] = time()
+        return False
+
+    cluster_exists = _resource_exists(
+        CLUSTER_LIST_COMMAND, "list clusters", id["cluster_id"]
+    )
+    if cluster_exists is None:
+        return False
+    if cluster_exists:
+        nodepool_exists = _resource_exists(
+            nodepool_list_command(id["cluster_id"]),
+            "list nodepools",
+            id["nodepool_id"],
+        )
+        if nodepool_exists is None:
+            return False
+        if nodepool_exists:
+            return issue_delete(
+                "nodepool", lambda: delete_nodepool(id["nodepool_id"], id["cluster_id"], logger)
+            )
+        return issue_delete("cluster", lambda: delete_cluster(id["cluster_id"], logger))
+
+    datacenter_exists = _resource_exists(
+        DATACENTER_LIST_COMMAND, "list datacenters", id["datacenter_id"]
+    )
+    if datacenter_exists is None:
+        return False
+    if datacenter_exists:
+        return issue_delete("datacenter", lambda: delete_datacenter(id["datacenter_id"], logger))
 
+    logger(f"All resources of '{id['cluster_name']}' are deleted.")
     return True
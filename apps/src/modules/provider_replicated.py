@@ -1,11 +1,38 @@
 """
 This module creates replicated.com clusters using the CLI
+
+Single clusters are queried by ID using the Vendor API, so that polling a cluster's state
+doesn't get more expensive with the number of clusters in the account.
 """
 
+import json
+import os
 import re
-from time import sleep
+from time import sleep, time
+
+import requests
 
 from modules.command import run_command
+from modules.poller import wait_for_state
+
+# hint how long [seconds] a cluster usually takes to be up and running (used by the poller)
+RUNNING_STATE_DURATION = 300
+
+# time [seconds] after which we give up waiting for a cluster to be up and running
+RUNNING_STATE_DEADLINE = 3600
+
+# Vendor API of replicated.com, used to query single clusters by ID
+# (can be overridden, e.g. by a local stand-in)
+REPLICATED_API_URL = os.environ.get("REPLICATED_API_URL", "https://api.replicated.com/vendor/v3")
+
+# kubeconfig for the created cluster (can be set per run via the KUBECONFIG env var)
+KUBECONFIG_FILE = os.environ.get("KUBECONFIG", "/root/.kube/config")
+
+# names of the clusters created by the Operator Test Runner (see name_for_id())
+CLUSTER_NAME_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# cache of the IDs of the clusters we know: cluster name -> cluster ID
+cluster_ids = {}
 
 
 def api_call_create_cluster(cluster_name, spec, platform_version, logger):
@@ -17,7 +44,7 @@ def api_call_create_cluster(cluster_name, spec, platform_version, logger):
     platform_version    version of the (K8s) platform
     logger              logger (String-consuming function)
     """
-    command = f"replicated cluster create --name {cluster_name} --distribution {spec['distribution']} --instance-type {spec['instance-type']} --version {platform_version} --disk {spec['disk-size']} --nodes {spec['node-count']} --ttl 6h"
+    command = f"replicated cluster create --name {cluster_name} --distribution {spec['distribution']} --instance-type {spec['instance-type']} --version {platform_version} --disk {spec['disk-size']} --nodes {spec['node-count']} --ttl 6h --output json"
     logger(f"System call: --> {command}")
     exit_code, output = run_command(command, "replicated cluster create")
     if exit_code != 0:
@@ -26,46 +53,111 @@ def api_call_create_cluster(cluster_name, spec, platform_version, logger):
         )
         logger(output)
         return False
+    try:
+        created = json.loads("\n".join(output))
+        if isinstance(created, list):
+            created = created[0]
+        cluster_ids[cluster_name] = read_cluster_from_json(created)["id"]
+    except (ValueError, KeyError, TypeError, IndexError):
+        # the ID will be looked up in the cluster list
+        pass
     return True
 
 
-def read_clusters_from_ls_output(output):
+def read_cluster_from_json(cluster):
     """
-    Reads a list of cluster (states) from the output of the Replicated CLI ls (list) command.
+    Reads the cluster metadata from a cluster object of the Replicated CLI/API JSON output.
 
-    output      string output
+    cluster     dict (parsed JSON)
 
-    Returns list of dicts (cluster metadata)
+    Returns dict (cluster metadata)
     """
-    regex = re.compile(r"^([0-9a-f]*)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+.*")
-    cluster_states = {}
-    for line in output:
-        matcher = regex.match(line)
-        if matcher:
-            cluster_states[matcher.group(2)] = {
-                "id": matcher.group(1),
-                "name": matcher.group(2),
-                "distribution": matcher.group(3),
-                "version": matcher.group(4),
-                "state": matcher.group(5),
-            }
-    return cluster_states
+    return {
+        "id": cluster["id"],
+        "name": cluster["name"],
+        "distribution": cluster.get("distribution"),
+        "version": cluster.get("version"),
+        "state": cluster.get("status"),
+        "created_at": cluster.get("created_at"),
+    }
 
 
 def get_clusters():
     """
     Get all currently existing clusters.
+
+    Returns dict cluster name -> cluster metadata
+    """
+    exit_code, output = run_command("replicated cluster ls --output json", "replicated cluster ls")
+    if exit_code != 0:
+        return {}
+    try:
+        clusters = [read_cluster_from_json(c) for c in json.loads("\n".join(output)) or []]
+    except (ValueError, KeyError, TypeError):
+        return {}
+    for cluster in clusters:
+        cluster_ids[cluster["name"]] = cluster["id"]
+    return {cluster["name"]: cluster for cluster in clusters}
+
+
+def list_test_clusters(logger):
+    """
+    Lists the clusters in the account which were created by the Operator Test Runner
+    (i.e. whose names match CLUSTER_NAME_PATTERN).
+
+    logger              logger (String-consuming function)
+
+    Returns list of dict (name, created_at (ISO timestamp), vendor-specific cluster object)
+    or None if the clusters could not be listed.
+    """
+    exit_code, output = run_command("replicated cluster ls --output json", "replicated cluster ls")
+    if exit_code != 0:
+        logger(f"Listing the clusters failed with exit code {exit_code} and the following message:")
+        for line in output:
+            logger(line)
+        return None
+    try:
+        clusters = [read_cluster_from_json(c) for c in json.loads("\n".join(output)) or []]
+    except (ValueError, KeyError, TypeError) as e:
+        logger(f"Could not parse the cluster list: {e}")
+        return None
+    return [
+        {"name": c["name"], "created_at": c["created_at"], "cluster": c["name"]}
+        for c in clusters
+        if CLUSTER_NAME_PATTERN.match(c["name"] or "")
+    ]
+
+
+def get_cluster_by_id(id):
+    """
+    Get a single cluster by its ID using the Vendor API
+
+    Returns the cluster metadata or None if the cluster could not be read.
     """
-    exit_code, output = run_command("replicated cluster ls", "replicated cluster ls")
-    if exit_code == 0:
-        return read_clusters_from_ls_output(output)
-    return {}
+    try:
+        response = requests.get(
+            f"{REPLICATED_API_URL}/cluster/{id}",
+            headers={"Authorization": os.environ.get("REPLICATED_API_TOKEN", "")},
+            timeout=30,
+        )
+        if response.status_code != 200:
+            return None
+        return read_cluster_from_json(response.json()["cluster"])
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return None
 
 
 def get_cluster(name):
     """
     Get cluster by name
+
+    If the ID of the cluster is known, only this cluster is queried.
+    Otherwise (or if that query fails), the cluster is looked up in the list of all clusters.
     """
+    if name in cluster_ids:
+        cluster = get_cluster_by_id(cluster_ids[name])
+        if cluster:
+            return cluster
     clusters = get_clusters()
     return clusters.get(name, None)
 
@@ -76,24 +168,35 @@ def wait_for_running_cluster(name, logger):
 
     name        name of the cluster
     logger              logger (String-consuming function)
+
+    Returns True if the cluster is running, False if we gave up waiting.
     """
-    state = None
-    while state != "running":
-        logger(f"Cluster '{name}' is in state {state}")
-        sleep(5)
+
+    def read_state():
         cluster = get_cluster(name)
-        state = cluster["state"] if cluster else None
+        return cluster["state"] if cluster else None
+
+    if not wait_for_state(
+        f"Cluster '{name}'",
+        read_state,
+        "running",
+        logger,
+        expected_duration=RUNNING_STATE_DURATION,
+        deadline=RUNNING_STATE_DEADLINE,
+    ):
+        return False
 
-    logger(f"Cluster '{name}' is in state {state}")
     logger("Sleeping 10 seconds, as sometimes kubeconfig could not be generated directly afterwards")
     sleep(10)
+    return True
 
 def update_kubeconfig(cluster, logger):
     """
-    Updates the kubeconfig (in default folder /root/.kube/config/) for the given cluster
+    Updates the kubeconfig (KUBECONFIG_FILE, default /root/.kube/config) for the given cluster
     """
     exit_code, output = run_command(
-        f"replicated cluster kubeconfig {cluster['id']}", "update kubeconfig"
+        f"replicated cluster kubeconfig {cluster['id']} --output-path {KUBECONFIG_FILE}",
+        "update kubeconfig",
     )
     if exit_code != 0:
         for line in output:
@@ -109,6 +212,13 @@ def write_cluster_info_file(cluster_info_file):
     run_command(f"kubectl get nodes > {cluster_info_file}", "kubectl get nodes")
 
 
+def name_for_id(id):
+    """
+    Returns the name of the cluster with the given ID (the full UUID)
+    """
+    return id
+
+
 def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     """
     Creates a replicated.com cluster with the given spec. (Blocking operation)
@@ -124,7 +234,7 @@ def create_cluster(id, spec, platform_version, cluster_info_file, logger):
     If not cluster could be created, the reason is logged and None is returned.
     """
 
-    cluster_name = id
+    cluster_name = name_for_id(id)
 
     logger(f"Creating cluster {cluster_name} on replicated.com...")
 
@@ -132,7 +242,9 @@ def create_cluster(id, spec, platform_version, cluster_info_file, logger):
         return None
 
     logger("Polling for the cluster to be up and running...")
-    wait_for_running_cluster(cluster_name, logger)
+    if not wait_for_running_cluster(cluster_name, logger):
+        logger("Cluster did not reach the state 'running'.")
+        return None
 
     cluster = get_cluster(cluster_name)
 
@@ -162,4 +274,23 @@ def terminate_cluster(id, logger):
         )
         logger(output)
         return False
+    cluster_ids.pop(id, None)
+    return True
+
+
+def advance_termination(id, progress, logger):
+    """
+    Advances the termination of the given cluster without waiting for it (used by the reaper).
+    A replicated.com cluster is removed by a single call, so there's only one step.
+
+    id                  vendor-specific cluster object which was previously returned by create_cluster()
+    progress            dict resource -> time the delete was issued (updated by this function)
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster is removed.
+    """
+    if "cluster" not in progress:
+        if not terminate_cluster(id, logger):
+            return False
+        progress["cluster"] = time()
     return True
@@ -0,0 +1,167 @@
+"""
+This module provides readiness probes for the test cluster.
+
+Each probe returns as soon as its condition holds (or its upper bound is reached)
+and logs how long it actually waited.
+"""
+
+import json
+from time import monotonic, sleep
+from urllib.parse import quote
+
+from modules.command import run_command
+
+# interval [seconds] between two checks whether nodes have registered with the cluster
+NODE_REGISTRATION_INTERVAL = 5
+
+# interval [seconds] between two samples of the log pipeline
+DRAIN_SAMPLE_INTERVAL = 5
+
+# number of consecutive unchanged samples after which the log pipeline is considered drained
+DRAIN_STABLE_SAMPLES = 2
+
+# fixed wait [seconds] for the log pipeline if the Vector aggregator can't be queried
+DRAIN_FALLBACK_WAIT = 60
+
+# GraphQL query for the number of events sent by the sinks of the Vector aggregator
+VECTOR_SENT_EVENTS_QUERY = (
+    "{ sinks { edges { node { componentId metrics { sentEventsTotal { sentEventsTotal } } } } } }"
+)
+
+# API server proxy path to the GraphQL API of the Vector aggregator
+VECTOR_AGGREGATOR_GRAPHQL_PATH = (
+    "/api/v1/namespaces/default/services/vector-aggregator:8686/proxy/graphql"
+)
+
+
+def count_nodes():
+    """
+    Returns the number of nodes which have registered with the cluster (0 if unknown)
+    """
+    exit_code, output = run_command("kubectl get nodes -o name", "get nodes")
+    if exit_code != 0:
+        return 0
+    return len([line for line in output if line.startswith("node/")])
+
+
+def wait_for_nodes_ready(timeout, logger):
+    """
+    Waits until all nodes of the cluster are Ready (blocking operation)
+
+    Right after provisioning, no node may have registered yet ('kubectl wait' would return
+    at once with "no matching resources found"), so we first wait for the first node.
+
+    timeout             upper bound [seconds] for the wait
+    logger              logger (String-consuming function)
+
+    Returns True if all nodes are ready, False otherwise.
+    """
+    start = monotonic()
+    while count_nodes() == 0:
+        if monotonic() - start >= timeout:
+            logger(f"No node has registered with the cluster within {timeout}s.")
+            return False
+        sleep(min(NODE_REGISTRATION_INTERVAL, max(timeout - (monotonic() - start), 0)))
+    remaining = max(int(timeout - (monotonic() - start)), 1)
+    exit_code, output = run_command(
+        f"kubectl wait --for=condition=Ready nodes --all --timeout={remaining}s",
+        "wait for nodes",
+        timeout=remaining + 30,
+    )
+    logger(f"Waited {monotonic() - start:.0f}s for the nodes to become ready.")
+    if exit_code != 0:
+        for line in output:
+            logger(line)
+        return False
+    return True
+
+
+def wait_for_cluster_logging_ready(timeout, logger):
+    """
+    Waits until the rollouts of the cluster logging components are complete (blocking operation)
+
+    timeout             upper bound [seconds] for the whole wait
+    logger              logger (String-consuming function)
+
+    Returns True if all components are rolled out, False otherwise.
+    """
+    start = monotonic()
+    ready = True
+    for namespace, resource in [
+        ("default", "daemonset/vector-agent"),
+        ("default", "statefulset/vector-aggregator"),
+        ("kube-system", "deployment/eventrouter"),
+    ]:
+        remaining = max(int(timeout - (monotonic() - start)), 1)
+        exit_code, output = run_command(
+            f"kubectl rollout status -n {namespace} {resource} --timeout={remaining}s",
+            f"rollout status {resource}",
+            timeout=remaining + 30,
+        )
+        if exit_code != 0:
+            for line in output:
+                logger(line)
+            ready = False
+            break
+    logger(f"Waited {monotonic() - start:.0f}s for the cluster logging to become ready.")
+    return ready
+
+
+def read_vector_sent_events():
+    """
+    Reads the total number of events which the sinks of the Vector aggregator have sent.
+
+    Returns the number of events or None if it could not be determined.
+    """
+    exit_code, output = run_command(
+        f"kubectl get --raw '{VECTOR_AGGREGATOR_GRAPHQL_PATH}?query={quote(VECTOR_SENT_EVENTS_QUERY)}'",
+        "query vector aggregator",
+    )
+    if exit_code != 0:
+        return None
+    try:
+        edges = json.loads("".join(output))["data"]["sinks"]["edges"]
+        return sum(
+            edge["node"]["metrics"]["sentEventsTotal"]["sentEventsTotal"]
+            for edge in edges
+            if edge["node"]["metrics"]["sentEventsTotal"]
+        )
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def wait_for_logs_drained(timeout, logger):
+    """
+    Waits until the log pipeline has shipped the logs to the target system (blocking operation)
+
+    The pipeline is considered drained when the number of events sent by the Vector aggregator
+    did not change for DRAIN_STABLE_SAMPLES consecutive samples.
+    If the aggregator cannot be queried, we wait for DRAIN_FALLBACK_WAIT seconds instead
+    (at most the timeout).
+
+    timeout             upper bound [seconds] for the wait
+    logger              logger (String-consuming function)
+
+    Returns True if the pipeline is drained, False if the timeout was reached.
+    """
+    start = monotonic()
+    previous = read_vector_sent_events()
+    if previous is None:
+        wait = min(DRAIN_FALLBACK_WAIT, timeout)
+        logger(f"The Vector aggregator can't be queried, waiting {wait}s for the logs instead.")
+        sleep(wait)
+        return False
+    stable_samples = 0
+    while monotonic() - start < timeout:
+        sleep(min(DRAIN_SAMPLE_INTERVAL, max(timeout - (monotonic() - start), 0)))
+        current = read_vector_sent_events()
+        if current is not None and current == previous:
+            stable_samples = stable_samples + 1
+            if stable_samples >= DRAIN_STABLE_SAMPLES:
+                logger(f"Waited {monotonic() - start:.0f}s for the logs to be processed.")
+                return True
+        else:
+            stable_samples = 0
+        previous = current
+    logger(f"Waited {monotonic() - start:.0f}s for the logs to be processed (timed out).")
+    return False
@@ -0,0 +1,314 @@
+"""
+This module manages the "to-reap" ledger of clusters whose termination is finished asynchronously.
+
+Terminating a cluster can take a long time (e.g. IONOS: nodepool, K8s cluster and datacenter
+are deleted one after another). Instead of waiting for it, the Operator Test Runner records
+the cluster in the ledger, starts the termination and returns. The reaper (cluster-reaper.py)
+finishes the termination of all recorded clusters, step by step and with retries.
+
+The ledger lives in a directory shared by the runners and the reaper (e.g. a Docker volume):
+
+    <ledger_dir>/<cluster id>.json          cluster whose termination is not finished yet
+    <ledger_dir>/running/<cluster id>.json  cluster which is in use by a runner ("running mark")
+
+An entry is locked while it is processed, so multiple reapers can work on the same ledger.
+
+A runner marks the cluster it creates as running before it creates it and keeps the mark alive
+with a heartbeat (the modification time of the mark) until the cluster is recorded in the ledger
+or terminated. A mark whose heartbeat has stopped belongs to a killed runner, its cluster is
+an orphan (see modules/orphans.py).
+"""
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep, time
+
+from modules.cluster import advance_termination
+
+# max. number of clusters whose termination is advanced at the same time
+REAPER_MAX_WORKERS = 8
+
+# time [seconds] between two passes of the reaper over the ledger
+REAP_INTERVAL = 30
+
+# age [seconds] after which an entry is reported as stuck
+STUCK_AGE = 2 * 3600
+
+# interval [seconds] in which a runner renews the heartbeat of its running mark
+HEARTBEAT_INTERVAL = 5 * 60
+
+
+def _entry_path(ledger_dir, id):
+    return os.path.join(ledger_dir, f"{id}.json")
+
+
+def _running_path(ledger_dir, id):
+    return os.path.join(ledger_dir, "running", f"{id}.json")
+
+
+def _write_entry(path, entry):
+    """
+    Writes an entry file atomically (write to temp file + rename)
+    (The temp file has a unique name, so concurrent writers never write into the same one.)
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path)
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def list_entries(ledger_dir):
+    """
+    Returns the paths of all entries of the ledger
+    """
+    if not os.path.isdir(ledger_dir):
+        return []
+    return sorted(
+        os.path.join(ledger_dir, name) for name in os.listdir(ledger_dir) if name.endswith(".json")
+    )
+
+
+def add_entry(ledger_dir, id, provider_id, cluster, logger):
+    """
+    Records the cluster in the ledger (without starting its termination).
+
+    ledger_dir          folder of the ledger
+    id                  ID of the cluster (unique, used as name of the entry)
+    provider_id         ID of the cloud provider / vendor
+    cluster             vendor-specific cluster object which was previously returned by create_cluster()
+    logger              logger (String-consuming function)
+
+    Returns the path of the entry or None if the cluster could not be recorded.
+    """
+    path = _entry_path(ledger_dir, id)
+    try:
+        os.makedirs(ledger_dir, exist_ok=True)
+        _write_entry(
+            path,
+            {
+                "id": id,
+                "provider": provider_id,
+                "cluster": cluster,
+                "recorded_at": time(),
+                "progress": {},
+                "passes": 0,
+            },
+        )
+    except OSError as e:
+        logger(f"Cluster {id} could not be recorded for reaping: {e}")
+        return None
+    return path
+
+
+def read_entries(ledger_dir):
+    """
+    Returns the entries (dicts) of the ledger
+    """
+    entries = []
+    for path in list_entries(ledger_dir):
+        try:
+            with open(path) as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError):
+            # removed or being written in the meantime
+            continue
+    return entries
+
+
+def mark_running(ledger_dir, id, provider_id, logger):
+    """
+    Marks the cluster as running, i.e. in use by this runner (see start_heartbeat()).
+    Has to be called before the cluster is created, so that it's never left behind unmarked.
+
+    ledger_dir          folder of the ledger
+    id                  ID of the cluster
+    provider_id         ID of the cloud provider / vendor
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster was marked.
+    """
+    path = _running_path(ledger_dir, id)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_entry(path, {"id": id, "provider": provider_id, "marked_at": time()})
+    except OSError as e:
+        logger(f"Cluster {id} could not be marked as running: {e}")
+        return False
+    return True
+
+
+def start_heartbeat(ledger_dir, id, logger, interval=HEARTBEAT_INTERVAL):
+    """
+    Renews the heartbeat of the running mark periodically in a background thread.
+
+    ledger_dir          folder of the ledger
+    id                  ID of the cluster
+    logger              logger (String-consuming function)
+    interval            interval [seconds] of the heartbeats
+
+    Returns an event which stops the heartbeat when set.
+    """
+    path = _running_path(ledger_dir, id)
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(interval):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                logger(f"The running mark of cluster {id} has been removed, heartbeat stopped.")
+                return
+            except OSError as e:
+                logger(f"The heartbeat of cluster {id} failed: {e}")
+
+    threading.Thread(target=beat, daemon=True).start()
+    return stopped
+
+
+def unmark_running(ledger_dir, id):
+    """
+    Removes the running mark of the cluster (it's terminated or recorded in the ledger).
+    """
+    try:
+        os.remove(_running_path(ledger_dir, id))
+    except FileNotFoundError:
+        pass
+
+
+def read_running_marks(ledger_dir):
+    """
+    Returns the running marks (dicts) of the ledger, with the time of their last heartbeat
+    ('heartbeat_at', seconds since the epoch)
+    """
+    marks = []
+    for path in list_entries(os.path.join(ledger_dir, "running")):
+        try:
+            with open(path) as f:
+                mark = json.load(f)
+            mark["heartbeat_at"] = os.path.getmtime(path)
+        except (OSError, ValueError):
+            # removed or being written in the meantime
+            continue
+        marks.append(mark)
+    return marks
+
+
+def record_for_reaping(ledger_dir, id, provider_id, cluster, logger):
+    """
+    Records the cluster in the ledger and starts its termination (without waiting for it).
+
+    ledger_dir          folder of the ledger
+    id                  ID of the cluster (unique, used as name of the entry)
+    provider_id         ID of the cloud provider / vendor
+    cluster             vendor-specific cluster object which was previously returned by create_cluster()
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster was recorded (the reaper takes care of it from now on).
+    """
+    path = add_entry(ledger_dir, id, provider_id, cluster, logger)
+    if not path:
+        return False
+    logger(f"Recorded cluster {id} for reaping, starting termination...")
+    reap_entry(path, logger)
+    return True
+
+
+def reap_entry(path, logger):
+    """
+    Advances the termination of the cluster of the given entry by one step
+    and removes the entry once the cluster is gone.
+
+    path                path of the entry file
+    logger              logger (String-consuming function)
+
+    Returns True if the cluster is gone, False if it's still there (or the entry is locked).
+    """
+    try:
+        lock = open(f"{path}.lock", "w")
+    except OSError as e:
+        logger(f"Could not lock {path}: {e}")
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # another reaper is working on it
+            return False
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return True
+        try:
+            done = advance_termination(
+                entry["provider"], entry["cluster"], entry["progress"], logger
+            )
+        except Exception as e:
+            logger(f"Advancing the termination of cluster {entry['id']} failed: {e}")
+            done = False
+        if done:
+            os.remove(path)
+            os.remove(f"{path}.lock")
+            logger(f"Cluster {entry['id']} is terminated and removed from the ledger.")
+            return True
+        entry["passes"] = entry["passes"] + 1
+        _write_entry(path, entry)
+        return False
+
+
+def reap_ledger(ledger_dir, logger, max_workers=REAPER_MAX_WORKERS):
+    """
+    Advances the termination of all clusters of the ledger by one step (concurrently).
+
+    ledger_dir          folder of the ledger
+    logger              logger (String-consuming function)
+    max_workers         max. number of clusters processed at the same time
+
+    Returns the number of clusters which are not terminated yet.
+    """
+    paths = list_entries(ledger_dir)
+    if not paths:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        done = list(executor.map(lambda path: reap_entry(path, logger), paths))
+    return len([d for d in done if not d])
+
+
+def run_reaper(ledger_dir, logger, max_runtime, interval=REAP_INTERVAL):
+    """
+    Reaps the ledger until it is empty or the max. runtime is reached (blocking operation)
+
+    ledger_dir          folder of the ledger
+    logger              logger (String-consuming function)
+    max_runtime         time [seconds] after which the reaper stops
+    interval            time [seconds] between two passes over the ledger
+
+    Returns the number of stuck clusters (older than STUCK_AGE and still not terminated).
+    """
+    start = monotonic()
+    while True:
+        remaining = reap_ledger(ledger_dir, logger)
+        logger(f"{remaining} clusters left in the ledger.")
+        if remaining == 0 or monotonic() - start + interval > max_runtime:
+            break
+        sleep(interval)
+
+    stuck = 0
+    for entry in read_entries(ledger_dir):
+        if time() - entry["recorded_at"] > STUCK_AGE:
+            logger(
+                f"Cluster {entry['id']} ({entry['provider']}) is stuck: recorded "
+                f"{(time() - entry['recorded_at']) / 3600:.1f}h ago, {entry['passes']} passes."
+            )
+            stuck = stuck + 1
+    return stuck
@@ -0,0 +1,69 @@
+"""
+This module provides the Jinja templating shared by the apps.
+
+Templates are loaded by one Jinja Environment per template folder, so that every template
+is compiled at most once per process. The compiled templates are additionally kept in a
+bytecode cache folder, which is filled at image build time (see compile-templates.py),
+so that a fresh process doesn't have to compile them either.
+"""
+
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+# folder of the Jinja bytecode cache (can be overridden, e.g. for a read-only image)
+TEMPLATE_CACHE_FOLDER = os.environ.get("TEMPLATE_CACHE_FOLDER", "/jinja-cache/")
+
+# Environment per template folder
+environments = {}
+
+
+def get_environment(template_folder):
+    """
+    Returns the (shared) Jinja Environment for the given template folder.
+
+    template_folder     folder containing the templates
+    """
+    if template_folder not in environments:
+        bytecode_cache = None
+        try:
+            os.makedirs(TEMPLATE_CACHE_FOLDER, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_FOLDER)
+        except OSError:
+            # templates are still cached in memory by the Environment
+            pass
+        environments[template_folder] = Environment(
+            loader=FileSystemLoader(template_folder),
+            bytecode_cache=bytecode_cache,
+            auto_reload=False,
+        )
+    return environments[template_folder]
+
+
+def render_template(template_folder, template_name, context, output_file):
+    """
+    Renders the given template into a file.
+
+    template_folder     folder containing the templates
+    template_name       name of the template (relative to the template folder)
+    context             dict of the variables which are available to the template
+    output_file         file the rendered template is written to
+    """
+    template = get_environment(template_folder).get_template(template_name)
+    with open(output_file, "w") as f:
+        f.write(template.render(context))
+
+
+def precompile_templates(template_folder):
+    """
+    Compiles all templates (*.j2) of the given folder into the bytecode cache.
+
+    template_folder     folder containing the templates
+
+    Returns the list of the names of the compiled templates
+    """
+    environment = get_environment(template_folder)
+    names = environment.list_templates(extensions=["j2"])
+    for name in names:
+        environment.get_template(name)
+    return names
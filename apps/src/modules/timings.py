@@ -0,0 +1,123 @@
+"""
+This module records how long the phases of a test run take.
+
+The timings are written as JSON report and as Prometheus textfile (see
+https://github.com/prometheus/node_exporter#textfile-collector), both labelled with
+the parameters of the run, so that the slowest phases can be found across the test matrix.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from datetime import UTC, datetime
+from time import monotonic
+
+# names of the metrics in the Prometheus textfile
+PHASE_DURATION_METRIC = "operator_test_phase_duration_seconds"
+RUN_DURATION_METRIC = "operator_test_run_duration_seconds"
+
+
+class PhaseTimer:
+    """
+    Records the start (offset from the start of the run) and the duration of named phases.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now(UTC)
+        self.start = monotonic()
+        self.phases = {}
+
+    def elapsed(self):
+        """
+        Returns the time [seconds] since the start of the run
+        """
+        return monotonic() - self.start
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager which records the duration of the enclosed block as phase.
+
+        name                name of the phase
+        """
+        phase_start = self.elapsed()
+        try:
+            yield
+        finally:
+            self.phases[name] = {"start": phase_start, "duration": self.elapsed() - phase_start}
+
+    def add_phases(self, timings, offset):
+        """
+        Adds phases which were timed elsewhere (e.g. by modules.phases.run_phases()).
+
+        timings             dict phase name -> dict with 'start' and 'duration' [seconds]
+        offset              offset [seconds] of the timings from the start of the run
+        """
+        for name, timing in timings.items():
+            self.phases[name] = {
+                "start": offset + timing["start"],
+                "duration": timing["duration"],
+            }
+
+    def write_json(self, file, labels):
+        """
+        Writes the timings as JSON report.
+
+        file                target file
+        labels              dict describing the run (operator, platform, ...)
+        """
+        _write_file(
+            file,
+            json.dumps(
+                {
+                    "labels": labels,
+                    "started_at": self.started_at.isoformat(),
+                    "duration": self.elapsed(),
+                    "phases": dict(sorted(self.phases.items(), key=lambda p: p[1]["start"])),
+                },
+                indent=4,
+            ),
+        )
+
+    def write_prometheus(self, file, labels):
+        """
+        Writes the timings as Prometheus textfile.
+
+        file                target file
+        labels              dict describing the run (operator, platform, ...)
+        """
+        lines = [
+            f"# HELP {PHASE_DURATION_METRIC} Duration of a phase of an operator test run",
+            f"# TYPE {PHASE_DURATION_METRIC} gauge",
+        ]
+        for name, timing in sorted(self.phases.items(), key=lambda p: p[1]["start"]):
+            lines.append(
+                f"{PHASE_DURATION_METRIC}{_format_labels({**labels, 'phase': name})} "
+                f"{timing['duration']:.3f}"
+            )
+        lines.extend(
+            [
+                f"# HELP {RUN_DURATION_METRIC} Duration of an operator test run",
+                f"# TYPE {RUN_DURATION_METRIC} gauge",
+                f"{RUN_DURATION_METRIC}{_format_labels(labels)} {self.elapsed():.3f}",
+            ]
+        )
+        _write_file(file, "\n".join(lines) + "\n")
+
+
+def _format_labels(labels):
+    escaped = {
+        key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for key, value in labels.items()
+    }
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+
+def _write_file(file, content):
+    """
+    Writes the file atomically (write to temp file + rename), so that a collector never
+    reads a partially written file
+    """
+    with open(f"{file}.tmp", "w") as f:
+        f.write(content)
+    os.replace(f"{file}.tmp", file)
@@ -0,0 +1,239 @@
+"""
+Main module of the Operator Test Orchestrator application
+
+Runs a whole matrix of operator tests from one process (inside the Operator Test Runner image).
+Each run is executed by the Operator Test Runner (operator-test-runner.py) as a subprocess
+with its own isolated state:
+
+* target folder     <target folder>/<run name>/ (TARGET_FOLDER env var)
+* kubeconfig        <work folder>/kubeconfig (KUBECONFIG env var)
+* working folder    <work folder>/ (the operator repo is cloned into it)
+* logger            output lines of the run are prefixed with the run name
+
+The runs are driven concurrently by asyncio, with a bounded number of concurrent runs
+per cluster provider.
+
+The matrix is read from a YAML file (MATRIX_FILE env var) which contains a list of runs:
+
+    - operator: airflow-operator
+      platform: replicated-kind
+      platform_version: 1.35.0          # optional, default: latest version of the platform
+      operator_version: 0.0.0-dev       # optional, default: 0.0.0-dev
+      test_script_params: --parallel 1  # optional
+      git_branch: main                  # optional
+
+If no matrix file is given, the weekly test matrix is taken from the catalog.
+All other env vars (credentials, cluster logging, ...) are passed on to the runs.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import UTC, datetime
+
+import hiyapyco
+
+import modules.catalog as catalog
+
+# keys for the env vars
+PARAM_KEY_MATRIX_FILE = "MATRIX_FILE"
+PARAM_KEY_MAX_RUNS_PER_PROVIDER = "MAX_RUNS_PER_PROVIDER"
+
+# default max. number of concurrent runs per provider, can be overridden
+# with the env var MAX_RUNS_PER_PROVIDER, e.g. "replicated=8,ionos=2"
+DEFAULT_MAX_RUNS_PER_PROVIDER = {"replicated": 8, "ionos": 2}
+
+TARGET_FOLDER = "/target/"
+WORK_FOLDER = "/work/"
+RESULTS_FILE = f"{TARGET_FOLDER}matrix-results.json"
+# size [bytes] of the chunks in which the output of a run is read, longer lines are split
+OUTPUT_CHUNK_SIZE = 64 * 1024
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "operator-test-runner.py")
+
+
+def log(msg=""):
+    """
+    Logs the given text message of the orchestrator to stdout.
+    """
+    print(f"{datetime.now(UTC):%Y-%m-%d %H:%M:%S} :: {msg}", flush=True)
+
+
+def read_max_runs_per_provider():
+    """
+    Reads the max. number of concurrent runs per provider.
+
+    Returns dict provider ID -> max. number of concurrent runs
+    """
+    max_runs = dict(DEFAULT_MAX_RUNS_PER_PROVIDER)
+    for limit in os.environ.get(PARAM_KEY_MAX_RUNS_PER_PROVIDER, "").split(","):
+        if "=" in limit:
+            provider, value = limit.split("=", 1)
+            max_runs[provider.strip()] = int(value)
+    return max_runs
+
+
+def read_weekly_matrix():
+    """
+    Creates the matrix of the weekly tests from the catalog.
+
+    Returns list of run definitions (dicts)
+    """
+    return [
+        {
+            "operator": operator_test["id"],
+            "platform": operator_test["weekly_test"]["platform"],
+            "test_script_params": operator_test["weekly_test"].get("test_script_params", ""),
+        }
+        for operator_test in catalog.operator_tests
+        if "weekly_test" in operator_test
+    ]
+
+
+def resolve_run(run):
+    """
+    Completes a run definition with default values and the provider of its platform.
+
+    Returns the completed run definition or None if the run is not valid.
+    """
+    platform = catalog.get_platform(run["platform"])
+    if not platform:
+        log(f"The platform '{run['platform']}' does not exist.")
+        return None
+    platform_version = str(run.get("platform_version", platform["versions"][0]))
+    return {
+        "name": f"{run['operator']}_{platform['id']}_{platform_version}",
+        "operator": run["operator"],
+        "platform": platform["id"],
+        "provider": platform["provider"],
+        "platform_version": platform_version,
+        "operator_version": str(run.get("operator_version", "0.0.0-dev")),
+        "test_script_params": run.get("test_script_params", ""),
+        "git_branch": run.get("git_branch"),
+    }
+
+
+async def relay_output(stream, name):
+    """
+    Prints the output of a run line by line, prefixed with the name of the run.
+
+    The output is read in chunks, so that a line exceeding the line limit of asyncio's
+    StreamReader doesn't abort the run (such a line is printed in several parts).
+
+    stream              StreamReader of the output of the run
+    name                name of the run
+    """
+    buffer = b""
+    while chunk := await stream.read(OUTPUT_CHUNK_SIZE):
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        if len(buffer) >= OUTPUT_CHUNK_SIZE:
+            lines.append(buffer)
+            buffer = b""
+        for line in lines:
+            print(f"[{name}] {line.decode('utf-8', errors='replace').rstrip()}", flush=True)
+    if buffer:
+        print(f"[{name}] {buffer.decode('utf-8', errors='replace').rstrip()}", flush=True)
+
+
+async def execute_run(run, semaphore):
+    """
+    Executes a single run of the matrix in a subprocess (as soon as its provider has capacity).
+
+    run                 run definition (see resolve_run())
+    semaphore           semaphore limiting the concurrent runs of the provider
+
+    Returns the exit code of the run
+    """
+    async with semaphore:
+        target_folder = os.path.join(TARGET_FOLDER, run["name"], "")
+        os.makedirs(target_folder, exist_ok=True)
+        os.makedirs(WORK_FOLDER, exist_ok=True)
+        work_folder = tempfile.mkdtemp(prefix=f"{run['name']}_", dir=WORK_FOLDER)
+        # (it only holds the clone and the kubeconfig, the results are written to the target folder)
+        try:
+            env = {
+                **os.environ,
+                "TARGET_FOLDER": target_folder,
+                "KUBECONFIG": os.path.join(work_folder, "kubeconfig"),
+                "PLATFORM": run["platform"],
+                "PLATFORM_VERSION": run["platform_version"],
+                "OPERATOR": run["operator"],
+                "OPERATOR_VERSION": run["operator_version"],
+                "TEST_SCRIPT_PARAMS": run["test_script_params"],
+            }
+            if run["git_branch"]:
+                env["GIT_BRANCH"] = run["git_branch"]
+
+            log(f"Starting run {run['name']}...")
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable,
+                RUNNER,
+                env=env,
+                cwd=work_folder,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+            )
+            await relay_output(proc.stdout, run["name"])
+            exit_code = await proc.wait()
+            log(f"Run {run['name']} exited with code {exit_code}")
+            return exit_code
+        finally:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+
+async def execute_matrix(runs, max_runs_per_provider):
+    """
+    Executes all runs of the matrix concurrently (bounded per provider).
+
+    Returns list of exit codes (same order as the runs)
+    """
+    semaphores = {
+        provider: asyncio.Semaphore(max_runs_per_provider.get(provider, 1))
+        for provider in {run["provider"] for run in runs}
+    }
+    return await asyncio.gather(*[execute_run(run, semaphores[run["provider"]]) for run in runs])
+
+
+if __name__ == "__main__":
+    print("testing.stackable.tech operator-test-orchestrator")
+    print()
+
+    print("This app runs a matrix of operator integration tests.")
+    print()
+
+    if not os.path.isdir(TARGET_FOLDER):
+        print(f"Error: A target folder volume has to be supplied as mount on {TARGET_FOLDER}. ")
+        exit(1)
+
+    log("Reading catalog...")
+    if not catalog.read_catalog(log):
+        log("Error reading catalog, operator-test-orchestrator is aborted.")
+        exit(1)
+
+    if PARAM_KEY_MATRIX_FILE in os.environ:
+        log(f"Reading matrix from {os.environ[PARAM_KEY_MATRIX_FILE]}...")
+        matrix = hiyapyco.load(os.environ[PARAM_KEY_MATRIX_FILE].strip()) or []
+    else:
+        log("Reading weekly test matrix from catalog...")
+        matrix = read_weekly_matrix()
+
+    runs = [resolve_run(run) for run in matrix]
+    if None in runs or len(runs) == 0:
+        log("The matrix is empty or not valid, operator-test-orchestrator is aborted.")
+        exit(1)
+
+    max_runs_per_provider = read_max_runs_per_provider()
+    log(f"Executing {len(runs)} runs (max. concurrent runs per provider: {max_runs_per_provider})")
+    exit_codes = asyncio.run(execute_matrix(runs, max_runs_per_provider))
+
+    results = {run["name"]: exit_code for run, exit_code in zip(runs, exit_codes, strict=True)}
+    with open(RESULTS_FILE, "w") as f:
+        json.dump(results, f, indent=4)
+
+    log("Results:")
+    for name, exit_code in results.items():
+        log(f"  {name}: {exit_code}")
+
+    exit(0 if all(exit_code == 0 for exit_code in exit_codes) else 1)
@@ -3,17 +3,31 @@ Main module of the Operator Test Runner application
 """
 
 import os
-import sys
+import shlex
 import uuid
 from datetime import UTC, datetime, timedelta
-from time import sleep
-
-from jinja2 import Template
 
 import modules.catalog as catalog
+from modules.chart_cache import helm_cache_env, log_chart_cache_stats
 from modules.cluster import create_cluster, terminate_cluster
 from modules.cluster_logging import install_cluster_logging
-from modules.command import run_command
+from modules.cluster_pool import lease_cluster, release_cluster, start_lease_renewal
+from modules.command import RetryPolicy, run_command, run_process
+from modules.log_sink import LogSink
+from modules.phases import run_phases
+from modules.reap_ledger import (
+    mark_running,
+    record_for_reaping,
+    start_heartbeat,
+    unmark_running,
+)
+from modules.readiness import (
+    wait_for_cluster_logging_ready,
+    wait_for_logs_drained,
+    wait_for_nodes_ready,
+)
+from modules.templates import render_template
+from modules.timings import PhaseTimer
 
 # values of the params (given as env vars during Docker run)
 param_output_file_user = "0:0"
@@ -26,6 +40,11 @@ param_cluster_logging_endpoint = None
 param_cluster_logging_username = None
 param_cluster_logging_password = None
 param_opensearch_dashboards_url = None
+param_cluster_ready_timeout = 600
+param_cluster_logging_ready_timeout = 300
+param_logs_drain_timeout = 120
+param_cluster_pool_dir = None
+param_reap_ledger_dir = None
 
 # keys for the env vars
 PARAM_KEY_PLATFORM = "PLATFORM"
@@ -42,16 +61,52 @@ PARAM_KEY_CLUSTER_LOGGING_ENDPOINT = "CLUSTER_LOGGING_ENDPOINT"
 PARAM_KEY_CLUSTER_LOGGING_USERNAME = "CLUSTER_LOGGING_USERNAME"
 PARAM_KEY_CLUSTER_LOGGING_PASSWORD = "CLUSTER_LOGGING_PASSWORD"
 PARAM_KEY_OPENSEARCH_DASHBOARDS_URL = "OPENSEARCH_DASHBOARDS_URL"
+PARAM_KEY_CLUSTER_READY_TIMEOUT = "CLUSTER_READY_TIMEOUT"
+PARAM_KEY_CLUSTER_LOGGING_READY_TIMEOUT = "CLUSTER_LOGGING_READY_TIMEOUT"
+PARAM_KEY_LOGS_DRAIN_TIMEOUT = "LOGS_DRAIN_TIMEOUT"
+PARAM_KEY_CLUSTER_POOL_DIR = "CLUSTER_POOL_DIR"
+PARAM_KEY_REAP_LEDGER_DIR = "REAP_LEDGER_DIR"
 
 # by convention, this is the return code for "unstable cluster"
 EXIT_CODE_CLUSTER_FAILED = 255
 
+# retries of the SDP installation: transient failures (registry, DNS, webhooks not ready yet, ...)
+# are retried for up to 15 minutes, permanent ones (e.g. unknown operator version) fail at once
+SDP_INSTALL_RETRY_POLICY = RetryPolicy(max_attempts=10, max_time=900)
+
 # constants for the file handling
-TARGET_FOLDER = "/target/"
+# (the target folder can be overridden, e.g. by the test matrix orchestrator)
+TARGET_FOLDER = os.path.join(os.environ.get("TARGET_FOLDER", "/target/"), "")
 TESTDRIVER_LOGFILE = f"{TARGET_FOLDER}testdriver.log"
 TEST_OUTPUT_LOGFILE = f"{TARGET_FOLDER}test-output.log"
 CLUSTER_INFO_FILE = f"{TARGET_FOLDER}cluster-info.txt"
 LOG_INDEX_LINKS_FILE = f"{TARGET_FOLDER}logs.html"
+TIMINGS_FILE = f"{TARGET_FOLDER}timings.json"
+TIMINGS_METRICS_FILE = f"{TARGET_FOLDER}timings.prom"
+
+# records the durations of the phases of this run
+phase_timer = PhaseTimer()
+
+# sink of the log messages (the logfile is written by a background thread)
+log_sink = LogSink(TESTDRIVER_LOGFILE, background=True)
+
+
+def read_timeout_param(key, default):
+    """
+    Reads a timeout [seconds] from the given env var (default if it isn't set).
+
+    Returns the timeout or None (after printing an error) if it's not a positive integer.
+    """
+    if key not in os.environ:
+        return default
+    try:
+        timeout = int(os.environ[key].strip())
+    except ValueError:
+        timeout = 0
+    if timeout <= 0:
+        print(f"Error: {key} has to be a positive number of seconds, got '{os.environ[key]}'.")
+        return None
+    return timeout
 
 
 def init():
@@ -71,6 +126,11 @@ def init():
     global param_cluster_logging_username
     global param_cluster_logging_password
     global param_opensearch_dashboards_url
+    global param_cluster_ready_timeout
+    global param_cluster_logging_ready_timeout
+    global param_logs_drain_timeout
+    global param_cluster_pool_dir
+    global param_reap_ledger_dir
 
     if PARAM_KEY_REPLICATED_API_TOKEN not in os.environ:
         print(f"Error: Please supply {PARAM_KEY_REPLICATED_API_TOKEN} as an environment variable.")
@@ -138,10 +198,38 @@ def init():
 
     if PARAM_KEY_TEST_SCRIPT_PARAMS in os.environ:
         param_test_script_params = os.environ[PARAM_KEY_TEST_SCRIPT_PARAMS].strip()
+        # (the params are split like a shell does it, see run_tests())
+        try:
+            shlex.split(param_test_script_params)
+        except ValueError as e:
+            print(f"Error: {PARAM_KEY_TEST_SCRIPT_PARAMS} can't be parsed: {e}")
+            return False
 
     if PARAM_KEY_OPENSEARCH_DASHBOARDS_URL in os.environ:
         param_opensearch_dashboards_url = os.environ[PARAM_KEY_OPENSEARCH_DASHBOARDS_URL].strip()
 
+    param_cluster_ready_timeout = read_timeout_param(
+        PARAM_KEY_CLUSTER_READY_TIMEOUT, param_cluster_ready_timeout
+    )
+    param_cluster_logging_ready_timeout = read_timeout_param(
+        PARAM_KEY_CLUSTER_LOGGING_READY_TIMEOUT, param_cluster_logging_ready_timeout
+    )
+    param_logs_drain_timeout = read_timeout_param(
+        PARAM_KEY_LOGS_DRAIN_TIMEOUT, param_logs_drain_timeout
+    )
+    if None in [
+        param_cluster_ready_timeout,
+        param_cluster_logging_ready_timeout,
+        param_logs_drain_timeout,
+    ]:
+        return False
+
+    if PARAM_KEY_CLUSTER_POOL_DIR in os.environ:
+        param_cluster_pool_dir = os.environ[PARAM_KEY_CLUSTER_POOL_DIR].strip()
+
+    if PARAM_KEY_REAP_LEDGER_DIR in os.environ:
+        param_reap_ledger_dir = os.environ[PARAM_KEY_REAP_LEDGER_DIR].strip()
+
     return True
 
 
@@ -157,12 +245,17 @@ def set_target_folder_owner():
 def log(msg=""):
     """
     Logs the given text message to stdout AND the logfile.
+    (Identical consecutive messages are collapsed, see LogSink)
     """
-    timestamp = f"{datetime.now(UTC):%Y-%m-%d %H:%M:%S}"
-    print(f"{timestamp} :: {msg}")
-    sys.stdout.flush()
-    with open(TESTDRIVER_LOGFILE, "a") as f:
-        f.write(f"{timestamp} :: {msg}\n")
+    log_sink.log(msg)
+
+
+def log_output(line):
+    """
+    Logs a line of the output of a command to stdout AND the logfile.
+    (Written verbatim, identical lines are not collapsed)
+    """
+    log_sink.log(line, collapse=False)
 
 
 def clone_git_repo(repo):
@@ -180,6 +273,54 @@ def clone_git_repo(repo):
     return True
 
 
+def wait_for_cluster_ready():
+    """
+    Waits for all nodes of the cluster to become ready.
+    As the tests might still succeed, a cluster which is not ready in time is only logged.
+
+    Returns True (always)
+    """
+    log(f"Waiting (max. {param_cluster_ready_timeout}s) for the cluster to become ready...")
+    if not wait_for_nodes_ready(param_cluster_ready_timeout, log):
+        log("Not all nodes are ready, continuing anyway...")
+    return True
+
+
+def setup_cluster_logging(cluster_id):
+    """
+    Installs the cluster logging and waits for it to become ready.
+
+    cluster_id:            ID of the cluster to be included in the logging data
+
+    Returns True if the cluster logging was installed, False otherwise.
+    """
+    log("Install Cluster Logging (powered by Vector)...")
+    install_start = phase_timer.elapsed()
+    installed, step_timings = install_cluster_logging(
+        cluster_id,
+        param_cluster_logging_endpoint,
+        param_cluster_logging_username,
+        param_cluster_logging_password,
+        log,
+    )
+    phase_timer.add_phases(
+        {f"cluster-logging/{name}": timing for name, timing in step_timings.items()},
+        install_start,
+    )
+    log_chart_cache_stats(log)
+    if not installed:
+        log("Error installing Cluster Logging, continuing without it...")
+        return False
+    log("Installed Cluster Logging (powered by Vector).")
+
+    log(
+        f"Waiting (max. {param_cluster_logging_ready_timeout}s) for the cluster logging to become ready..."
+    )
+    if not wait_for_cluster_logging_ready(param_cluster_logging_ready_timeout, log):
+        log("Cluster Logging is not ready, continuing anyway...")
+    return True
+
+
 def run_tests(operator, operator_version, test_script_params):
     """
     Runs the tests using the test script in the operator repo.
@@ -189,7 +330,12 @@ def run_tests(operator, operator_version, test_script_params):
     operator:              name of the operator-repo (usually with suffix '-operator')
     operator_version:      Version of the operator to be tested
     test_script_params:    additional params
+
+    The test script is run without a shell. The params are split into arguments like a shell
+    does it (shlex.split(): quotes and backslashes are honoured), but there's no globbing,
+    no variable expansion and no other shell syntax (e.g. '$HOME' or '*' are passed literally).
     """
+    test_script_args = shlex.split(test_script_params)
 
     # Get test script configuration - check for runtime override first
     test_script_override = os.environ.get("TEST_SCRIPT", "").strip()
@@ -210,14 +356,25 @@ def run_tests(operator, operator_version, test_script_params):
     command_install_sdp = f"cd {operator}/ && python ./scripts/run-tests --skip-tests --operator {operator.replace('-operator', '')}={operator_version}"
     log("Running the following command to install SDP for test:")
     log(command_install_sdp)
-    exit_code, output = run_command(command_install_sdp, "install sdp", retries=10, delay=60)
+    # The output is streamed to the log while the installation is running, so stalls are visible immediately
+    # (Helm, which is used by the script, keeps its cache in the chart cache, if there is one)
+    with phase_timer.phase("install-sdp"):
+        exit_code, output = run_command(
+            command_install_sdp,
+            "install sdp",
+            line_callback=log_output,
+            retry_policy=SDP_INSTALL_RETRY_POLICY,
+            logger=log,
+            env=helm_cache_env(log),
+        )
     if exit_code != 0:
-        for line in output:
-            log(line)
+        last_line = output[-1] if output else ""
+        log(f"Installing the SDP failed with exit code {exit_code}, last output line: {last_line}")
         return exit_code
 
     # Step 2: Run the actual tests
-    # (The aux. method run_command() is NOT used here because we want the output to be streamed, not captured!)
+    # (The aux. method run_command() is NOT used here because we want the whole output to be
+    # streamed to the console and the output file, not captured!)
     if test_script == "auto-retry-tests.py":
         # Use auto-retry test runner
         retry_config = catalog.get_auto_retry_config(operator)
@@ -227,60 +384,75 @@ def run_tests(operator, operator_version, test_script_params):
             f"delete_failed_namespaces={retry_config['delete_failed_namespaces']}"
         )
 
-        # Extract parallel value from test_script_params (default to 0)
+        # Take the parallel value from the test script params (--parallel N or --parallel=N,
+        # default: 0), the other params are passed on as extra args
         parallel_value = "0"
-        if "--parallel" in test_script_params:
-            try:
-                parts = test_script_params.split("--parallel")
-                if len(parts) > 1:
-                    parallel_value = parts[1].strip().split()[0]
-            except Exception:
-                pass
+        extra_params = []
+        args = iter(test_script_args)
+        for param in args:
+            if param == "--parallel":
+                parallel_value = next(args, parallel_value)
+            elif param.startswith("--parallel="):
+                parallel_value = param.removeprefix("--parallel=")
+            else:
+                extra_params.append(param)
 
         # Build command for auto-retry-tests.py
-        command_parts = [
-            f"cd {operator}/",
-            "&&",
-            "python ./scripts/auto-retry-tests.py",
-            f"--parallel {parallel_value}",
-            f"--attempts-parallel {retry_config['attempts_parallel']}",
-            f"--attempts-serial {retry_config['attempts_serial']}",
-            f"--output-dir {TARGET_FOLDER}test-results",
+        command_run_tests = [
+            "python",
+            "./scripts/auto-retry-tests.py",
+            "--parallel",
+            parallel_value,
+            "--attempts-parallel",
+            str(retry_config["attempts_parallel"]),
+            "--attempts-serial",
+            str(retry_config["attempts_serial"]),
+            "--output-dir",
+            f"{TARGET_FOLDER}test-results",
         ]
 
         if retry_config["delete_failed_namespaces"]:
-            command_parts.append("--delete-failed-namespaces")
-
-        # Add extra args from test_script_params (excluding --parallel which we already handled)
-        extra_params = []
-        skip_next = False
-        for param in test_script_params.split():
-            if skip_next:
-                skip_next = False
-                continue
-            if param == "--parallel":
-                skip_next = True
-                continue
-            extra_params.append(param)
+            command_run_tests.append("--delete-failed-namespaces")
 
         if extra_params:
-            command_parts.append("--extra-args")
-            command_parts.extend(extra_params)
-
-        command_parts.extend(["2>&1", ";", "echo $? > /test_exit_code"])
-        command_run_tests = f"({' '.join(command_parts)}) | tee {TEST_OUTPUT_LOGFILE}"
+            command_run_tests.append("--extra-args")
+            command_run_tests.extend(extra_params)
 
     else:
         # Use traditional run-tests script
-        params = " --log-level debug" if "--log-level" not in test_script_params else ""
-        command_run_tests = f"(cd {operator}/ && python ./scripts/run-tests --skip-release {params} {test_script_params} 2>&1; echo $? > /test_exit_code) | tee {TEST_OUTPUT_LOGFILE}"
+        params = ["--log-level", "debug"] if "--log-level" not in test_script_params else []
+        command_run_tests = [
+            "python",
+            "./scripts/run-tests",
+            "--skip-release",
+            *params,
+            *test_script_args,
+        ]
 
-    log("Running the following test command:")
-    log(command_run_tests)
-    os.system(command_run_tests)
-    sleep(15)
-    with open("/test_exit_code") as f:
-        return int(f.read().strip())
+    log(f"Running the following test command (in {operator}/):")
+    log(shlex.join(command_run_tests))
+    # The output is pumped to the console and the output file while the tests are running,
+    # the exit code is taken directly from the test process.
+    with phase_timer.phase("tests"):
+        return run_process(command_run_tests, operator, TEST_OUTPUT_LOGFILE)
+
+
+def write_timings(provider):
+    """
+    Writes the durations of the phases of this run (JSON report and Prometheus textfile),
+    labelled with the parameters of the run.
+
+    provider:              ID of the cloud provider / vendor
+    """
+    labels = {
+        "operator": param_operator,
+        "operator_version": param_operator_version,
+        "platform": param_platform,
+        "platform_version": param_platform_version,
+        "provider": provider,
+    }
+    phase_timer.write_json(TIMINGS_FILE, labels)
+    phase_timer.write_prometheus(TIMINGS_METRICS_FILE, labels)
 
 
 def write_logs_html(cluster_id, timestamp_start, timestamp_stop, opensearch_dashboards_url):
@@ -292,21 +464,17 @@ def write_logs_html(cluster_id, timestamp_start, timestamp_stop, opensearch_dash
     date_from = (timestamp_start - timedelta(hours=0, minutes=5)).strftime("%Y-%m-%dT%H:%M:00Z")
     date_to = (timestamp_stop + timedelta(hours=0, minutes=5)).strftime("%Y-%m-%dT%H:%M:00Z")
 
-    with open("/src/modules/.cluster_logging/logs.html.j2") as f:
-        logs_html = Template(f.read())
-
-    with open(LOG_INDEX_LINKS_FILE, "w") as f:
-        f.write(
-            logs_html.render(
-                {
-                    "cluster_id": cluster_id,
-                    "date_from": date_from,
-                    "date_to": date_to,
-                    "opensearch_dashboards_url": opensearch_dashboards_url,
-                }
-            )
-        )
-        f.close()
+    render_template(
+        "/src/modules/.cluster_logging/",
+        "logs.html.j2",
+        {
+            "cluster_id": cluster_id,
+            "date_from": date_from,
+            "date_to": date_to,
+            "opensearch_dashboards_url": opensearch_dashboards_url,
+        },
+        LOG_INDEX_LINKS_FILE,
+    )
 
 
 if __name__ == "__main__":
@@ -350,54 +518,99 @@ if __name__ == "__main__":
         f"Test running on Git Branch {param_git_branch} with the test script parameters '{param_test_script_params}'..."
     )
 
-    # random cluster ID
-    cluster_id = uuid.uuid4().hex
-
-    log("Creating cluster...")
-    cluster = create_cluster(
-        platform["provider"],
-        cluster_id,
-        cluster_spec,
-        param_platform_version,
-        CLUSTER_INFO_FILE,
-        log,
+    # Take a warm cluster from the pool if possible, otherwise create a cluster with a random ID
+    pool_entry = None
+    if param_cluster_pool_dir:
+        log("Leasing cluster from pool...")
+        with phase_timer.phase("lease-cluster"):
+            pool_entry = lease_cluster(
+                param_cluster_pool_dir,
+                platform["provider"],
+                cluster_spec,
+                param_platform_version,
+                CLUSTER_INFO_FILE,
+                log,
+            )
+    cluster_id = pool_entry["id"] if pool_entry else uuid.uuid4().hex
+    # (the lease is renewed until the teardown, so that the pool doesn't expire it during the test)
+    lease_renewal = (
+        start_lease_renewal(param_cluster_pool_dir, pool_entry, log) if pool_entry else None
     )
-    if not cluster:
-        log("Cluster could not be created.")
-        exit(EXIT_CODE_CLUSTER_FAILED)
-
-    log("Cloning git repo...")
-    clone_git_repo(param_operator)
-
-    log("Waiting 1 minute for the cluster to become ready...")
-    sleep(60)
-
-    log("Install Cluster Logging (powered by Vector)...")
-    installed_cluster_logging = install_cluster_logging(
-        cluster_id,
-        param_cluster_logging_endpoint,
-        param_cluster_logging_username,
-        param_cluster_logging_password,
+    # A cluster created by this run is marked as running (with a heartbeat) until it's handed over
+    # to the reap ledger, so that the orphan reaper only takes it if this run is killed.
+    heartbeat = None
+    if (
+        param_reap_ledger_dir
+        and not pool_entry
+        and mark_running(param_reap_ledger_dir, cluster_id, platform["provider"], log)
+    ):
+        heartbeat = start_heartbeat(param_reap_ledger_dir, cluster_id, log)
+
+    # The setup is run as a dependency graph, so that the work which doesn't need the cluster
+    # (e.g. cloning the repo) is done while the provider is still provisioning it.
+    log("Creating cluster and preparing test run...")
+    setup_start = phase_timer.elapsed()
+    setup_results, setup_timings = run_phases(
+        [
+            (
+                "create-cluster",
+                lambda: pool_entry["cluster"]
+                if pool_entry
+                else create_cluster(
+                    platform["provider"],
+                    cluster_id,
+                    cluster_spec,
+                    param_platform_version,
+                    CLUSTER_INFO_FILE,
+                    log,
+                ),
+                [],
+            ),
+            ("clone", lambda: clone_git_repo(param_operator), []),
+            ("cluster-ready", wait_for_cluster_ready, ["create-cluster"]),
+            ("cluster-logging", lambda: setup_cluster_logging(cluster_id), ["cluster-ready"]),
+        ],
         log,
     )
-    if installed_cluster_logging:
-        log("Installed Cluster Logging (powered by Vector).")
-    else:
-        log("Error installing Cluster Logging, continuing without it...")
+    phase_timer.add_phases(setup_timings, setup_start)
     set_target_folder_owner()
 
-    log("Waiting 1 minute for the cluster logging to become ready...")
-    sleep(60)
+    cluster = setup_results["create-cluster"]
+    if not cluster:
+        log("Cluster could not be created.")
+        write_timings(platform["provider"])
+        set_target_folder_owner()
+        exit(EXIT_CODE_CLUSTER_FAILED)
+    if not setup_results["clone"]:
+        log("Cloning the git repo failed, continuing anyway...")
+    installed_cluster_logging = setup_results["cluster-logging"]
 
     log("Running tests...")
     test_exit_code = run_tests(param_operator, param_operator_version, param_test_script_params)
     log(f"Test exited with code {test_exit_code}")
     log()
 
-    log("Waiting 1 minute to allow logs to be processed...")
-    sleep(60)
-
-    termination_successful = terminate_cluster(platform["provider"], cluster, log)
+    if installed_cluster_logging:
+        log(f"Waiting (max. {param_logs_drain_timeout}s) to allow logs to be processed...")
+        with phase_timer.phase("logs-drain"):
+            wait_for_logs_drained(param_logs_drain_timeout, log)
+
+    # With a reap ledger, the termination is only started here and finished by the reaper,
+    # so that the job doesn't have to wait for it.
+    with phase_timer.phase("teardown"):
+        if pool_entry:
+            lease_renewal.set()
+            termination_successful = release_cluster(param_cluster_pool_dir, pool_entry, log)
+        elif param_reap_ledger_dir:
+            termination_successful = record_for_reaping(
+                param_reap_ledger_dir, cluster_id, platform["provider"], cluster, log
+            )
+        else:
+            termination_successful = terminate_cluster(platform["provider"], cluster, log)
+        if heartbeat:
+            heartbeat.set()
+            if termination_successful:
+                unmark_running(param_reap_ledger_dir, cluster_id)
 
     job_finished_timestamp_utc = datetime.now(UTC)
 
@@ -410,6 +623,8 @@ if __name__ == "__main__":
             param_opensearch_dashboards_url,
         )
 
+    write_timings(platform["provider"])
+
     # Set output file ownership recursively
     # This is important as the test script might have added files which are not controlled
     # by this Python script and therefore most probably are owned by root
@@ -0,0 +1,45 @@
+"""
+Makes the modules of the apps importable in the tests (like in the Docker image: 'modules.xyz')
+and provides the fake CLIs of the benchmark as fixture
+"""
+
+import json
+import os
+import runpy
+import sys
+
+import pytest
+
+TESTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_FOLDER = os.path.join(TESTS_FOLDER, "..", "benchmark")
+
+sys.path.insert(0, os.path.join(TESTS_FOLDER, "..", "src"))
+sys.path.insert(0, BENCHMARK_FOLDER)
+
+import fake_cli  # noqa: E402
+
+
+@pytest.fixture
+def fake_clis(tmp_path, monkeypatch):
+    """
+    Puts the fake CLIs of the benchmark (see benchmark/fake_cli.py) on the PATH,
+    with the default scenario of the benchmark and almost no latency.
+
+    Returns the folder of the state of the fake CLIs
+    """
+    bin_folder = tmp_path / "bin"
+    bin_folder.mkdir()
+    for tool in fake_cli.TOOLS:
+        os.symlink(os.path.join(BENCHMARK_FOLDER, "fake_cli.py"), bin_folder / tool)
+    scenario = runpy.run_path(os.path.join(BENCHMARK_FOLDER, "run-benchmark.py"))[
+        "DEFAULT_SCENARIO"
+    ]
+    scenario_file = tmp_path / "scenario.json"
+    scenario_file.write_text(json.dumps(scenario))
+    state_folder = tmp_path / "fake-cli-state"
+
+    monkeypatch.setenv("PATH", f"{bin_folder}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("FAKE_CLI_STATE_DIR", str(state_folder))
+    monkeypatch.setenv("FAKE_CLI_SCENARIO", str(scenario_file))
+    monkeypatch.setenv("BENCHMARK_TIME_SCALE", "0.0001")
+    return state_folder
@@ -0,0 +1,203 @@
+"""
+Tests of the indexed catalog and its compiled cache (modules/catalog.py)
+"""
+
+import os
+import shutil
+
+import pytest
+
+import modules.catalog as catalog_module
+from modules.catalog import DEFAULT_TEST_SCRIPT, Catalog
+
+CATALOG_FOLDER = os.path.join(os.path.dirname(__file__), "..", "..", "catalog")
+
+PROVIDERS = [{"id": "replicated", "name": "Replicated"}]
+
+PLATFORMS = [
+    {
+        "id": "kind",
+        "name": "kind on replicated.com",
+        "provider": "replicated",
+        "spec": {"distribution": "kind", "instance-type": "r1.xlarge", "node-count": 1},
+    },
+    {
+        "id": "k3s",
+        "name": "k3s on replicated.com",
+        "provider": "replicated",
+        "spec": {"distribution": "k3s", "instance-type": "r1.large", "node-count": 1},
+    },
+    # duplicate ID, the first definition wins
+    {"id": "kind", "name": "duplicate", "provider": "replicated", "spec": {}},
+]
+
+OPERATOR_TESTS = [
+    {
+        "id": "airflow-operator",
+        "spec": {"node-count": 3},
+        "platforms": [
+            {"id": "kind", "spec": {"node-count": 1}},
+            {"id": "k3s", "spec": {}},
+            {"id": "unknown-platform", "spec": {}},
+        ],
+        "test_script": "run-tests",
+    },
+    {
+        "id": "zookeeper-operator",
+        "platforms": [{"id": "kind"}],
+        "auto_retry": {"attempts_parallel": 2},
+    },
+]
+
+
+@pytest.fixture
+def catalog():
+    return Catalog(PROVIDERS, PLATFORMS, OPERATOR_TESTS)
+
+
+def test_platform_is_found_by_id_and_name(catalog):
+    assert catalog.get_platform("k3s")["name"] == "k3s on replicated.com"
+    assert catalog.get_platform("k3s on replicated.com")["id"] == "k3s"
+    assert catalog.get_platform("kind")["name"] == "kind on replicated.com"
+    assert catalog.get_platform("unknown") is None
+
+
+def test_spec_combines_platform_test_and_test_platform_spec(catalog):
+    assert catalog.get_spec_for_operator_test("airflow-operator", "kind", print) == {
+        "distribution": "kind",
+        "instance-type": "r1.xlarge",
+        "node-count": 1,
+    }
+    assert catalog.get_spec_for_operator_test("airflow-operator", "k3s", print)["node-count"] == 3
+    spec = catalog.get_spec_for_operator_test("zookeeper-operator", "kind", print)
+    assert spec["node-count"] == 1
+
+
+def test_returned_spec_is_a_copy(catalog):
+    catalog.get_spec_for_operator_test("airflow-operator", "kind", print)["node-count"] = 99
+    assert catalog.get_spec_for_operator_test("airflow-operator", "kind", print)["node-count"] == 1
+
+
+@pytest.mark.parametrize(
+    "operator_test, platform, message",
+    [
+        ("airflow-operator", "unknown-platform", "The platform 'unknown-platform' does not exist."),
+        ("unknown-operator", "kind", "The operator test 'unknown-operator' does not exist."),
+        (
+            "zookeeper-operator",
+            "k3s",
+            "The test for 'zookeeper-operator' is not defined for the platform 'k3s'.",
+        ),
+    ],
+)
+def test_invalid_combination_is_logged(catalog, operator_test, platform, message):
+    log = []
+    assert catalog.get_spec_for_operator_test(operator_test, platform, log.append) is None
+    assert log == [message]
+
+
+def test_test_script_and_auto_retry_config_defaults(catalog):
+    assert catalog.get_test_script("airflow-operator") == "run-tests"
+    assert catalog.get_test_script("zookeeper-operator") == DEFAULT_TEST_SCRIPT
+    assert catalog.get_test_script("unknown-operator") == DEFAULT_TEST_SCRIPT
+    assert catalog.get_auto_retry_config("zookeeper-operator") == {
+        "attempts_parallel": 2,
+        "attempts_serial": 3,
+        "delete_failed_namespaces": True,
+    }
+    assert catalog.get_auto_retry_config("airflow-operator")["attempts_parallel"] == 0
+
+
+def test_indexes_are_read_only(catalog):
+    with pytest.raises(TypeError):
+        catalog._platforms_by_id["new"] = {}
+
+
+def test_catalog_files_of_the_repo_can_be_loaded():
+    catalog = Catalog.load(
+        print,
+        os.path.join(CATALOG_FOLDER, "platforms.yaml"),
+        os.path.join(CATALOG_FOLDER, "operator-tests.yaml"),
+    )
+    assert catalog.get_spec_for_operator_test("airflow-operator", "replicated-kind", print)
+    assert catalog.get_platform("ionos-k8s")["provider"] == "ionos"
+
+
+@pytest.fixture
+def catalog_files(tmp_path, monkeypatch):
+    """
+    Copies the catalog files of the repo and counts how often they are parsed
+
+    Returns tuple (platforms file, operator tests file, cache file, list of the parses)
+    """
+    for name in ["platforms.yaml", "operator-tests.yaml"]:
+        shutil.copy(os.path.join(CATALOG_FOLDER, name), tmp_path / name)
+    parses = []
+    load = Catalog.load.__func__
+
+    def counting_load(cls, *args):
+        parses.append(args)
+        return load(cls, *args)
+
+    monkeypatch.setattr(Catalog, "load", classmethod(counting_load))
+    return (
+        str(tmp_path / "platforms.yaml"),
+        str(tmp_path / "operator-tests.yaml"),
+        str(tmp_path / "catalog.cache"),
+        parses,
+    )
+
+
+def load_cached(catalog_files):
+    platforms_file, operator_tests_file, cache_file, _ = catalog_files
+    return Catalog.load_cached(print, platforms_file, operator_tests_file, cache_file)
+
+
+def test_cache_is_used_while_the_files_are_unchanged(catalog_files):
+    parsed = load_cached(catalog_files)
+    cached = load_cached(catalog_files)
+
+    assert len(catalog_files[3]) == 1
+    assert cached.platforms == parsed.platforms
+    assert cached.operator_tests == parsed.operator_tests
+
+
+def test_changed_file_invalidates_the_cache(catalog_files):
+    load_cached(catalog_files)
+    with open(catalog_files[1], "a") as f:
+        f.write("- id: new-operator\n  platforms: []\n")
+
+    catalog = load_cached(catalog_files)
+
+    assert len(catalog_files[3]) == 2
+    assert catalog.get_operator_test("new-operator")
+    load_cached(catalog_files)
+    assert len(catalog_files[3]) == 2
+
+
+def test_new_cache_format_invalidates_the_cache(catalog_files, monkeypatch):
+    load_cached(catalog_files)
+    new_format = catalog_module.CATALOG_CACHE_FORMAT + 1
+    monkeypatch.setattr(catalog_module, "CATALOG_CACHE_FORMAT", new_format)
+
+    load_cached(catalog_files)
+
+    assert len(catalog_files[3]) == 2
+
+
+def test_corrupt_cache_is_replaced(catalog_files):
+    with open(catalog_files[2], "wb") as f:
+        f.write(b"not a pickle")
+
+    assert load_cached(catalog_files)
+    assert load_cached(catalog_files)
+    assert len(catalog_files[3]) == 1
+
+
+def test_unwritable_cache_is_only_logged(catalog_files, tmp_path):
+    platforms_file, operator_tests_file, _, _ = catalog_files
+    log = []
+    cache_file = str(tmp_path / "missing-folder" / "catalog.cache")
+
+    assert Catalog.load_cached(log.append, platforms_file, operator_tests_file, cache_file)
+    assert log[0].startswith(f"Could not write catalog cache {cache_file}")
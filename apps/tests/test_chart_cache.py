@@ -0,0 +1,55 @@
+"""
+Tests of the Helm cache environment of modules/chart_cache.py
+"""
+
+import os
+
+from modules.chart_cache import helm_cache_env, seed_helm_repository_cache
+
+
+def write(path, text, mtime):
+    with open(path, "w") as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_seed_copies_the_repo_indexes_of_the_image(tmp_path):
+    source = tmp_path / "image"
+    source.mkdir()
+    write(source / "stackable-stable-index.yaml", "image index", 1000)
+    write(source / "stackable-stable-charts.txt", "charts", 1000)
+    write(source / "unrelated.lock", "", 1000)
+
+    target = tmp_path / "cache" / "repository"
+    seed_helm_repository_cache(str(source), str(target))
+
+    assert sorted(os.listdir(target)) == [
+        "stackable-stable-charts.txt",
+        "stackable-stable-index.yaml",
+    ]
+    assert (target / "stackable-stable-index.yaml").read_text() == "image index"
+
+
+def test_seed_keeps_newer_indexes(tmp_path):
+    source = tmp_path / "image"
+    target = tmp_path / "repository"
+    source.mkdir()
+    target.mkdir()
+    write(source / "vector-index.yaml", "old image index", 1000)
+    write(target / "vector-index.yaml", "updated by a run", 2000)
+    write(source / "stackable-dev-index.yaml", "new image index", 3000)
+    write(target / "stackable-dev-index.yaml", "outdated", 2000)
+
+    seed_helm_repository_cache(str(source), str(target))
+
+    assert (target / "vector-index.yaml").read_text() == "updated by a run"
+    assert (target / "stackable-dev-index.yaml").read_text() == "new image index"
+
+
+def test_env_points_into_the_cache(tmp_path):
+    env = helm_cache_env(print, cache_dir=str(tmp_path))
+    assert env == {
+        "HELM_CACHE_HOME": str(tmp_path / "helm"),
+        "HELM_REPOSITORY_CACHE": str(tmp_path / "helm" / "repository"),
+    }
+    assert os.path.isdir(env["HELM_REPOSITORY_CACHE"])
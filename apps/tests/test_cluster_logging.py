@@ -0,0 +1,24 @@
+"""
+Tests of the failure reporting of modules/cluster_logging.py against the fake CLIs of the benchmark
+"""
+
+import modules.cluster_logging as cluster_logging
+
+
+def test_exception_in_a_step_is_reported_as_failure(fake_clis, tmp_path, monkeypatch):
+    monkeypatch.setenv("KUBECONFIG", str(tmp_path / "kubeconfig"))
+
+    def render_template(*args):
+        raise OSError("template not found")
+
+    monkeypatch.setattr(cluster_logging, "render_template", render_template)
+    log = []
+
+    successful, _ = cluster_logging.install_cluster_logging(
+        "1234", "https://opensearch", "user", "secret", log.append
+    )
+
+    assert not successful
+    assert "- manifests: failed with an exception" in log
+    assert "    OSError: template not found" in log
+    assert "- vector-agent: skipped (a step it depends on failed)" in log
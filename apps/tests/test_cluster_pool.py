@@ -0,0 +1,120 @@
+"""
+Tests of the leases of the warm cluster pool (modules/cluster_pool.py), especially the races
+between lease renewals and expire_pool(), against the fake CLIs of the benchmark
+"""
+
+import os
+import uuid
+from time import time
+
+import pytest
+
+import modules.cluster_pool as cluster_pool
+import modules.provider_replicated as provider_replicated
+from modules.cluster_pool import (
+    LEASE_TTL,
+    expire_pool,
+    lease_cluster,
+    list_pool_entries,
+    pool_key,
+    refill_pool,
+    renew_lease,
+)
+
+SPEC = {"distribution": "kind", "instance-type": "r1.small", "disk-size": 50, "node-count": 1}
+PLATFORM_VERSION = "1.35.0"
+
+
+@pytest.fixture
+def pool_dir(fake_clis, tmp_path, monkeypatch):
+    kubeconfig = str(tmp_path / "kubeconfig")
+    monkeypatch.setenv("KUBECONFIG", kubeconfig)
+    monkeypatch.setattr(cluster_pool, "KUBECONFIG_FILE", kubeconfig)
+    monkeypatch.setattr(provider_replicated, "KUBECONFIG_FILE", kubeconfig)
+    # (no fixed wait for the kubeconfig of the fake clusters)
+    monkeypatch.setattr(provider_replicated, "sleep", lambda seconds: None)
+    return str(tmp_path / "pool")
+
+
+def refill(pool_dir, size):
+    return refill_pool(
+        pool_dir, "replicated", SPEC, PLATFORM_VERSION, size, lambda: uuid.uuid4().hex, print
+    )
+
+
+def lease(pool_dir, tmp_path):
+    return lease_cluster(
+        pool_dir, "replicated", SPEC, PLATFORM_VERSION, str(tmp_path / "cluster-info"), print
+    )
+
+
+def leased_path(pool_dir, entry):
+    return os.path.join(pool_dir, "leased", f"{entry['id']}.json")
+
+
+def set_age(path, age):
+    timestamp = time() - age
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_a_cluster_is_leased_only_once(pool_dir, tmp_path):
+    assert refill(pool_dir, 1)
+
+    assert lease(pool_dir, tmp_path)
+    assert lease(pool_dir, tmp_path) is None
+
+
+def test_refill_reports_clusters_which_could_not_be_created(pool_dir, monkeypatch):
+    monkeypatch.setattr(cluster_pool, "create_cluster", lambda *args: None)
+
+    assert not refill(pool_dir, 1)
+
+
+def test_a_cluster_which_waited_long_in_the_pool_starts_with_a_fresh_lease(pool_dir, tmp_path):
+    assert refill(pool_dir, 1)
+    key = pool_key("replicated", SPEC, PLATFORM_VERSION)
+    available_dir = os.path.join(pool_dir, "available", key)
+    set_age(os.path.join(available_dir, os.listdir(available_dir)[0]), 2 * LEASE_TTL)
+
+    entry = lease(pool_dir, tmp_path)
+
+    assert expire_pool(pool_dir, print) == 0
+    assert os.path.exists(leased_path(pool_dir, entry))
+
+
+def test_renewed_lease_is_not_expired(pool_dir, tmp_path):
+    assert refill(pool_dir, 1)
+    entry = lease(pool_dir, tmp_path)
+    set_age(leased_path(pool_dir, entry), LEASE_TTL - 60)
+
+    assert renew_lease(pool_dir, entry, print)
+    set_age(leased_path(pool_dir, entry), 120)
+
+    assert expire_pool(pool_dir, print) == 0
+    assert os.path.exists(leased_path(pool_dir, entry))
+
+
+def test_abandoned_lease_is_expired_and_lost(pool_dir, tmp_path):
+    assert refill(pool_dir, 1)
+    entry = lease(pool_dir, tmp_path)
+    set_age(leased_path(pool_dir, entry), LEASE_TTL + 60)
+
+    assert expire_pool(pool_dir, print) == 1
+
+    # a late renewal must neither succeed nor bring the entry back
+    assert not renew_lease(pool_dir, entry, print)
+    assert not os.path.exists(leased_path(pool_dir, entry))
+    assert list_pool_entries(pool_dir) == []
+
+
+def test_renewal_of_an_expiring_lease_fails(pool_dir, tmp_path):
+    assert refill(pool_dir, 1)
+    entry = lease(pool_dir, tmp_path)
+    # expire_pool() has claimed the entry but not terminated the cluster yet
+    os.makedirs(os.path.join(pool_dir, "expiring"))
+    os.rename(
+        leased_path(pool_dir, entry), os.path.join(pool_dir, "expiring", f"{entry['id']}.json")
+    )
+
+    assert not renew_lease(pool_dir, entry, print)
+    assert not os.path.exists(leased_path(pool_dir, entry))
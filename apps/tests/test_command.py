@@ -0,0 +1,142 @@
+"""
+Tests of the failure classification and the retry decisions of modules/command.py
+"""
+
+import pytest
+
+from modules.command import (
+    CLASSIFIED_OUTPUT_LINES,
+    FAILURE_CLASSES,
+    UNKNOWN_FAILURE,
+    RetryPolicy,
+    run_command,
+)
+
+
+# typical outputs of helm/kubectl/run-tests and their expected failure class
+CLASSIFICATION_CASES = [
+    (["Error: context deadline exceeded"], "timeout"),
+    (["Error: GET https://oci.stackable.tech/v2/: 429 Too Many Requests"], "rate-limit"),
+    (["Error: failed to fetch chart: 503 Service Unavailable"], "registry"),
+    (["failed to copy: httpReadSeeker: failed open: unexpected status code 502"], "registry"),
+    (["read tcp 10.0.0.1:443: connection reset by peer"], "registry"),
+    (["dial tcp: lookup oci.stackable.tech: no such host"], "dns"),
+    (
+        [
+            'Error: Internal error occurred: failed calling webhook "validate.cert-manager.io":'
+            ' no endpoints available for service "cert-manager-webhook"'
+        ],
+        "webhook-not-ready",
+    ),
+    (
+        [
+            'error: resource mapping not found for name: "simple-zk" namespace: "" from'
+            ' "zookeeper.yaml": no matches for kind "ZookeeperCluster" in version'
+            ' "zookeeper.stackable.tech/v1alpha1"',
+            "ensure CRDs are installed first",
+        ],
+        "crd-not-ready",
+    ),
+    (['Error: chart "zookeeper-operator" version "99.0.0" not found'], "permanent"),
+    (
+        ["Error: oci.stackable.tech/sdp/charts/zookeeper-operator:99.0.0: manifest unknown"],
+        "permanent",
+    ),
+    (["Error: unknown flag: --skip-relase"], "permanent"),
+    (["Error: invalid chart reference"], "permanent"),
+    (['Error: improper constraint: "latest-1"'], "permanent"),
+    (["something unexpected happened"], UNKNOWN_FAILURE),
+]
+
+
+@pytest.mark.parametrize("output, failure_class", CLASSIFICATION_CASES)
+def test_classify(output, failure_class):
+    assert RetryPolicy().classify(1, output) == failure_class
+
+
+def test_every_class_is_covered():
+    assert set(FAILURE_CLASSES) <= {name for _, name in CLASSIFICATION_CASES}
+
+
+def test_classify_killed_command_as_timeout():
+    assert RetryPolicy().classify(-1, ["install sdp timed out after 60 seconds."]) == "timeout"
+
+
+def test_classify_invalid_values_are_not_permanent():
+    # e.g. a webhook which rejects a resource while it isn't ready yet
+    assert RetryPolicy().classify(1, ["invalid response from webhook"]) == UNKNOWN_FAILURE
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        # CRDs/namespaces which are still being propagated
+        ['Error from server (NotFound): namespaces "kuttl-test-fine-sheep" not found'],
+        ['Error from server (NotFound): zookeeperclusters.zookeeper.stackable.tech "zk" not found'],
+        # registry which is still syncing
+        ["Error: failed to fetch https://repo.stackable.tech/index.yaml : 404 Not Found"],
+        ['Error: pods "test-0" does not exist'],
+        # expired tokens
+        ["error: You must be logged in to the server (Unauthorized)"],
+        ['Error from server (Forbidden): pods is forbidden: User "system:anonymous"'],
+    ],
+)
+def test_transient_errors_are_retried(output):
+    policy = RetryPolicy(max_attempts=10, max_time=900)
+    failure_class = policy.classify(1, output)
+    assert failure_class != "permanent"
+    assert policy.next_delay(failure_class, 1, 0) is not None
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        ["Installed 502 resources in 5.04s"],
+        ["test-500: ok", "test-503: ok", "3 tests failed"],
+    ],
+)
+def test_numbers_are_no_registry_errors(output):
+    assert RetryPolicy().classify(1, output) == UNKNOWN_FAILURE
+
+
+def test_classify_uses_trailing_lines_only():
+    output = ["Warning: version not found in cache"] + ["..."] * CLASSIFIED_OUTPUT_LINES
+    assert RetryPolicy().classify(1, output) == UNKNOWN_FAILURE
+
+
+def test_bad_version_is_not_retried():
+    policy = RetryPolicy(max_attempts=10, max_time=900)
+    output = [
+        "Installing zookeeper-operator=99.0.0 ...",
+        'Error: chart "zookeeper-operator" matching 99.0.0 not found in stackable-stable index.',
+    ]
+    failure_class = policy.classify(1, output)
+    assert failure_class == "permanent"
+    assert policy.next_delay(failure_class, 1, 0) is None
+
+
+def test_transient_failures_are_retried_with_backoff():
+    policy = RetryPolicy(max_attempts=10, backoff_factor=2, max_delay=300)
+    assert policy.next_delay("crd-not-ready", 1, 0) == 10
+    assert policy.next_delay("crd-not-ready", 2, 10) == 20
+    assert policy.next_delay("rate-limit", 4, 0) == 300
+    assert policy.next_delay(UNKNOWN_FAILURE, 1, 0) == 30
+
+
+def test_retries_are_bounded():
+    policy = RetryPolicy(max_attempts=3, max_time=100)
+    assert policy.next_delay("dns", 3, 0) is None
+    assert policy.next_delay("timeout", 1, 80) is None
+
+
+def test_fixed_delay_retries_every_failure():
+    policy = RetryPolicy(max_attempts=2, fixed_delay=60)
+    assert policy.next_delay("permanent", 1, 0) == 60
+
+
+def test_streaming_timeout_while_a_spawned_process_still_writes():
+    # the background loop keeps the pipe open, so the pump thread outlives the timeout
+    command = "(for i in $(seq 1 800); do echo $i; sleep 0.01; done) & sleep 30"
+    exit_code, output = run_command(command, "chatty", timeout=1, line_callback=lambda line: None)
+    assert exit_code == -1
+    assert output[-1] == "chatty timed out after 1 seconds."
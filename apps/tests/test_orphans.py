@@ -0,0 +1,119 @@
+"""
+Tests of the orphan detection (modules/orphans.py) and the running marks of the reap ledger
+against the fake CLIs of the benchmark
+"""
+
+import json
+import os
+import subprocess
+import sys
+import uuid
+from time import time
+
+import modules.provider_ionos as provider_ionos
+from modules.orphans import find_all_orphans, find_orphans, known_cluster_names, stale_marks
+from modules.reap_ledger import add_entry, mark_running, read_running_marks, unmark_running
+
+CLUSTER_REAPER = os.path.join(os.path.dirname(__file__), "..", "src", "cluster-reaper.py")
+
+
+def create_replicated_cluster(id):
+    subprocess.run(
+        ["replicated", "cluster", "create", "--name", id, "--distribution", "kind"],
+        check=True,
+        capture_output=True,
+    )
+
+
+def replicated_cluster_names():
+    output = subprocess.run(
+        ["replicated", "cluster", "ls", "--output", "json"], check=True, capture_output=True
+    ).stdout
+    return {c["name"] for c in json.loads(output)}
+
+
+def mark(ledger_dir, id, provider_id, heartbeat_age):
+    assert mark_running(str(ledger_dir), id, provider_id, print)
+    heartbeat = time() - heartbeat_age
+    os.utime(ledger_dir / "running" / f"{id}.json", (heartbeat, heartbeat))
+
+
+def test_only_marked_clusters_without_heartbeat_are_orphans(fake_clis, tmp_path):
+    ledger_dir = tmp_path / "ledger"
+    killed, live, foreign = (uuid.uuid4().hex for _ in range(3))
+    for id in [killed, live, foreign]:
+        create_replicated_cluster(id)
+    mark(ledger_dir, killed, "replicated", heartbeat_age=3600)
+    mark(ledger_dir, live, "replicated", heartbeat_age=60)
+
+    marks = stale_marks(str(ledger_dir), 1800)
+    orphans = find_orphans("replicated", marks, set(), print)
+
+    assert [m["id"] for m in marks] == [killed]
+    assert [(o["name"], o["id"]) for o in orphans] == [(killed, killed)]
+    assert orphans[0]["silent_for"] >= 3600
+
+
+def test_clusters_in_the_ledger_are_no_orphans(fake_clis, tmp_path):
+    ledger_dir = tmp_path / "ledger"
+    id = uuid.uuid4().hex
+    create_replicated_cluster(id)
+    mark(ledger_dir, id, "replicated", heartbeat_age=3600)
+    add_entry(str(ledger_dir), id, "replicated", id, print)
+
+    marks = stale_marks(str(ledger_dir), 1800)
+    known_names = known_cluster_names(str(ledger_dir), None)
+    assert find_orphans("replicated", marks, known_names, print) == []
+
+
+def test_ionos_orphans_are_found_by_the_name_of_their_resources(
+    fake_clis, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_TTL", 0)
+    ledger_dir = tmp_path / "ledger"
+    killed, foreign = uuid.uuid4().hex, uuid.uuid4().hex
+    for id in [killed, foreign]:
+        subprocess.run(
+            ["ionosctl", "datacenter", "create", "--name", id[0:10], "--location", "de/txl"],
+            check=True,
+            capture_output=True,
+        )
+    mark(ledger_dir, killed, "ionos", heartbeat_age=3600)
+
+    orphans = find_all_orphans(stale_marks(str(ledger_dir), 1800), set(), print)
+
+    assert orphans["replicated"] == []
+    assert [o["id"] for o in orphans["ionos"]] == [killed]
+    assert orphans["ionos"][0]["cluster"]["datacenter_id"]
+
+
+def test_unmarked_cluster_has_no_mark(tmp_path):
+    ledger_dir = tmp_path / "ledger"
+    assert mark_running(str(ledger_dir), "1234", "replicated", print)
+    unmark_running(str(ledger_dir), "1234")
+    unmark_running(str(ledger_dir), "1234")
+    assert read_running_marks(str(ledger_dir)) == []
+
+
+def test_reaper_terminates_orphans_only(fake_clis, tmp_path):
+    ledger_dir = tmp_path / "ledger"
+    killed, live, foreign, gone = (uuid.uuid4().hex for _ in range(4))
+    for id in [killed, live, foreign]:
+        create_replicated_cluster(id)
+    mark(ledger_dir, killed, "replicated", heartbeat_age=3600)
+    mark(ledger_dir, live, "replicated", heartbeat_age=60)
+    mark(ledger_dir, gone, "replicated", heartbeat_age=3600)
+
+    env = {
+        **os.environ,
+        "REAP_LEDGER_DIR": str(ledger_dir),
+        "REAPER_MAX_RUNTIME": "1",
+        "KUBECONFIG": str(tmp_path / "kubeconfig"),
+    }
+    result = subprocess.run(
+        [sys.executable, CLUSTER_REAPER, "orphans"], env=env, capture_output=True, text=True
+    )
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert replicated_cluster_names() == {live, foreign}
+    assert [m["id"] for m in read_running_marks(str(ledger_dir))] == [live]
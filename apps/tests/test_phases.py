@@ -0,0 +1,61 @@
+"""
+Tests of the dependency graph of the job phases (modules/phases.py)
+"""
+
+import threading
+
+from modules.phases import run_phases
+
+
+def test_phases_depending_on_a_failed_phase_are_skipped():
+    def fail():
+        raise RuntimeError("no cluster")
+
+    log = []
+    results, timings = run_phases(
+        [
+            ("create-cluster", fail, []),
+            ("clone", lambda: "repo", []),
+            ("cluster-ready", lambda: True, ["create-cluster"]),
+            ("cluster-logging", lambda: True, ["cluster-ready"]),
+            ("tests", lambda: True, ["clone", "cluster-logging"]),
+        ],
+        log.append,
+    )
+
+    assert results == {
+        "create-cluster": None,
+        "clone": "repo",
+        "cluster-ready": None,
+        "cluster-logging": None,
+        "tests": None,
+    }
+    assert set(timings) == {"create-cluster", "clone"}
+    assert "Phase 'create-cluster' raised an exception: no cluster" in log
+    assert "Phase 'tests' is skipped because a dependency failed." in log
+
+
+def test_false_result_fails_the_phase():
+    results, timings = run_phases([("a", lambda: False, []), ("b", lambda: True, ["a"])], print)
+    assert results == {"a": False, "b": None}
+    assert set(timings) == {"a"}
+
+
+def test_unresolvable_dependencies_are_skipped():
+    log = []
+    results, _ = run_phases([("a", lambda: True, []), ("b", lambda: True, ["typo"])], log.append)
+    assert results == {"a": True, "b": None}
+    assert "Phase 'b' has unresolvable dependencies and is skipped." in log
+
+
+def test_independent_phases_run_concurrently():
+    # each phase waits for the other one, so they only succeed if they run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+
+    def phase():
+        barrier.wait()
+        return True
+
+    phases = [("a", phase, []), ("b", phase, []), ("c", lambda: 1, ["a", "b"])]
+    results, _ = run_phases(phases, print)
+    assert results == {"a": True, "b": True, "c": 1}
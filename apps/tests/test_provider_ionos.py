@@ -0,0 +1,178 @@
+"""
+Tests of the IONOS provider (modules/provider_ionos.py), partly against the fake CLIs
+of the benchmark
+"""
+
+import json
+import os
+import threading
+from time import sleep
+
+import pytest
+
+import modules.poller as poller
+import modules.provider_ionos as provider_ionos
+from modules.provider_ionos import (
+    CLUSTER_LIST_COMMAND,
+    DATACENTER_LIST_COMMAND,
+    Resource,
+    invalidate_list_cache,
+    parse_resources,
+    query_list,
+)
+
+SPEC = {
+    "cores": 4,
+    "disk-size": 100,
+    "disk-type": "HDD",
+    "location": "de/txl",
+    "node-count": 3,
+    "ram": 8192,
+}
+
+
+def ionos_resource(id, name, state="AVAILABLE", created="2026-10-18T08:00:00Z"):
+    return {
+        "id": id,
+        "type": "datacenter",
+        "properties": {"name": name, "location": "de/txl", "description": "a" * 1000},
+        "metadata": {"state": state, "createdDate": created, "etag": "abc"},
+    }
+
+
+def test_parse_collection():
+    output = json.dumps(
+        {
+            "type": "collection",
+            "items": [ionos_resource("1", "0123456789"), ionos_resource("2", "abcdefabcd", "BUSY")],
+        }
+    )
+    assert parse_resources(output) == [
+        Resource("1", "0123456789", "AVAILABLE", "2026-10-18T08:00:00Z"),
+        Resource("2", "abcdefabcd", "BUSY", "2026-10-18T08:00:00Z"),
+    ]
+
+
+def test_parse_single_resource_and_list():
+    assert parse_resources(json.dumps(ionos_resource("1", "dc"))) == [
+        Resource("1", "dc", "AVAILABLE", "2026-10-18T08:00:00Z")
+    ]
+    assert [r.id for r in parse_resources(json.dumps([ionos_resource("1", "dc")]))] == ["1"]
+
+
+def test_parse_empty_output_and_collection():
+    assert parse_resources("") == []
+    assert parse_resources("  \n") == []
+    assert parse_resources(json.dumps({"type": "collection"})) == []
+
+
+def test_parse_missing_fields():
+    assert parse_resources(json.dumps({"items": [{"id": "1"}]})) == [Resource("1", None, None)]
+
+
+def test_parse_invalid_output():
+    with pytest.raises(ValueError):
+        parse_resources("ID  Name  State")
+
+
+@pytest.fixture
+def list_calls(monkeypatch):
+    """
+    Replaces the ionosctl list calls by a fake which counts them (per command)
+    and starts every test with an empty list cache
+    """
+    calls = {}
+
+    def query_command_for_resources(command, description):
+        calls[command] = calls.get(command, 0) + 1
+        sleep(0.05)
+        return (0, [Resource(command, "0123456789", "AVAILABLE")])
+
+    monkeypatch.setattr(provider_ionos, "query_command_for_resources", query_command_for_resources)
+    monkeypatch.setattr(provider_ionos, "_list_cache", {})
+    monkeypatch.setattr(provider_ionos, "list_cache_stats", {"hits": 0, "misses": 0})
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_TTL", 60)
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_DIR", None)
+    return calls
+
+
+def test_list_result_is_shared_within_the_ttl(list_calls):
+    first = query_list(DATACENTER_LIST_COMMAND, "list datacenters")
+    assert query_list(DATACENTER_LIST_COMMAND, "list datacenters") == first
+    assert list_calls == {DATACENTER_LIST_COMMAND: 1}
+    assert provider_ionos.list_cache_stats == {"hits": 1, "misses": 1}
+
+
+def test_list_result_expires_after_the_ttl(list_calls, monkeypatch):
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_TTL", 0)
+    query_list(DATACENTER_LIST_COMMAND, "list datacenters")
+    query_list(DATACENTER_LIST_COMMAND, "list datacenters")
+    assert list_calls == {DATACENTER_LIST_COMMAND: 2}
+
+
+def test_failed_list_is_not_cached(list_calls, monkeypatch):
+    monkeypatch.setattr(
+        provider_ionos, "query_command_for_resources", lambda command, description: (1, ["error"])
+    )
+    assert query_list(DATACENTER_LIST_COMMAND, "list datacenters") == (1, ["error"])
+    assert provider_ionos._list_cache == {}
+
+
+def test_concurrent_waiters_share_one_list_call(list_calls):
+    threads = [
+        threading.Thread(target=query_list, args=(CLUSTER_LIST_COMMAND, "list clusters"))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert list_calls == {CLUSTER_LIST_COMMAND: 1}
+
+
+def test_list_result_is_shared_between_processes(list_calls, tmp_path, monkeypatch):
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_DIR", str(tmp_path / "list-cache"))
+    first = query_list(DATACENTER_LIST_COMMAND, "list datacenters")
+    # (another process doesn't have the in-process cache)
+    monkeypatch.setattr(provider_ionos, "_list_cache", {})
+
+    assert query_list(DATACENTER_LIST_COMMAND, "list datacenters") == first
+    assert list_calls == {DATACENTER_LIST_COMMAND: 1}
+    assert not [name for name in os.listdir(tmp_path / "list-cache") if name.endswith(".tmp")]
+
+
+def test_invalidation_drops_only_the_affected_command(list_calls, tmp_path, monkeypatch):
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_DIR", str(tmp_path / "list-cache"))
+    for command in [DATACENTER_LIST_COMMAND, CLUSTER_LIST_COMMAND]:
+        query_list(command, "list")
+
+    invalidate_list_cache(DATACENTER_LIST_COMMAND)
+    for command in [DATACENTER_LIST_COMMAND, CLUSTER_LIST_COMMAND]:
+        query_list(command, "list")
+
+    assert list_calls == {DATACENTER_LIST_COMMAND: 2, CLUSTER_LIST_COMMAND: 1}
+
+
+@pytest.fixture
+def ionos(fake_clis, tmp_path, monkeypatch):
+    kubeconfig = str(tmp_path / "kubeconfig")
+    monkeypatch.setenv("KUBECONFIG", kubeconfig)
+    monkeypatch.setattr(provider_ionos, "KUBECONFIG_FILE", kubeconfig)
+    monkeypatch.setattr(provider_ionos, "LIST_CACHE_TTL", 0)
+    # (the fake resources change their state almost instantly)
+    monkeypatch.setattr(poller, "sleep", lambda seconds: None)
+    return provider_ionos
+
+
+def test_failed_creation_deletes_the_created_resources(ionos, tmp_path, monkeypatch):
+    wait_for_nodepool_state = ionos.wait_for_nodepool_state
+    monkeypatch.setattr(
+        ionos,
+        "wait_for_nodepool_state",
+        lambda nodepool_id, cluster_id, target_state, logger: target_state != "ACTIVE"
+        and wait_for_nodepool_state(nodepool_id, cluster_id, target_state, logger),
+    )
+
+    info_file = str(tmp_path / "cluster-info")
+    assert ionos.create_cluster("0123456789abcdef", SPEC, "1.33.3", info_file, print) is None
+    assert ionos.list_test_clusters(print) == []
@@ -0,0 +1,111 @@
+"""
+Tests of the locking and the stuck-entry handling of the reap ledger (modules/reap_ledger.py)
+"""
+
+import fcntl
+import json
+import os
+from time import time
+
+import pytest
+
+import modules.reap_ledger as reap_ledger
+from modules.reap_ledger import add_entry, list_entries, read_entries, reap_entry, run_reaper
+
+
+@pytest.fixture
+def terminations(monkeypatch):
+    """
+    Replaces the termination of the clusters by a fake which needs 2 steps per cluster
+
+    Returns list of the IDs of the clusters whose termination was advanced (one per step)
+    """
+    steps = []
+
+    def advance_termination(provider_id, cluster, progress, logger):
+        steps.append(cluster)
+        if cluster == "broken":
+            raise RuntimeError("API unavailable")
+        if cluster == "stuck" or "cluster" not in progress:
+            progress["cluster"] = time()
+            return False
+        return True
+
+    monkeypatch.setattr(reap_ledger, "advance_termination", advance_termination)
+    return steps
+
+
+def test_termination_is_advanced_step_by_step(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "1234", print)
+
+    assert not reap_entry(path, print)
+    entry = read_entries(str(tmp_path))[0]
+    assert entry["passes"] == 1
+    assert "cluster" in entry["progress"]
+
+    assert reap_entry(path, print)
+    assert os.listdir(tmp_path) == []
+    assert terminations == ["1234", "1234"]
+
+
+def test_locked_entry_is_skipped(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "1234", print)
+
+    with open(f"{path}.lock", "w") as lock:
+        # another reaper is working on it
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        assert not reap_entry(path, print)
+
+    assert terminations == []
+    assert read_entries(str(tmp_path))[0]["passes"] == 0
+
+
+def test_removed_entry_counts_as_terminated(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "1234", print)
+    os.remove(path)
+
+    assert reap_entry(path, print)
+    assert terminations == []
+
+
+def test_failing_termination_keeps_the_entry(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "broken", print)
+    log = []
+
+    assert not reap_entry(path, log.append)
+
+    assert log == ["Advancing the termination of cluster 1234 failed: API unavailable"]
+    assert read_entries(str(tmp_path))[0]["passes"] == 1
+
+
+def test_reaper_stops_when_the_ledger_is_empty(tmp_path, terminations):
+    for id in ["1", "2"]:
+        add_entry(str(tmp_path), id, "replicated", id, print)
+
+    assert run_reaper(str(tmp_path), print, max_runtime=60, interval=0) == 0
+    assert list_entries(str(tmp_path)) == []
+
+
+def test_old_entries_are_reported_as_stuck(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "stuck", print)
+    with open(path) as f:
+        entry = json.load(f)
+    entry["recorded_at"] = time() - reap_ledger.STUCK_AGE - 60
+    with open(path, "w") as f:
+        json.dump(entry, f)
+    add_entry(str(tmp_path), "5678", "replicated", "stuck", print)
+    log = []
+
+    assert run_reaper(str(tmp_path), log.append, max_runtime=0) == 1
+
+    assert [line for line in log if "is stuck" in line] == [
+        "Cluster 1234 (replicated) is stuck: recorded 2.0h ago, 1 passes."
+    ]
+
+
+def test_entries_are_written_without_leftovers(tmp_path, terminations):
+    path = add_entry(str(tmp_path), "1234", "replicated", "stuck", print)
+    for _ in range(3):
+        reap_entry(path, print)
+
+    assert sorted(os.listdir(tmp_path)) == ["1234.json", "1234.json.lock"]
@@ -45,6 +45,7 @@ pipeline {
                 withCredentials([usernamePassword(credentialsId: 'JENKINS_BOT_CREDENTIALS', passwordVariable: 'JENKINS_BOT_PASSWORD', usernameVariable: 'JENKINS_BOT_USERNAME')]) {
                     sh '''
                         docker run --rm \
+                            --volume jenkins-job-builder-state:/jjb-state \
                             --env JENKINS_URL=https://testing.stackable.tech \
                             --env JENKINS_USERNAME=$JENKINS_BOT_USERNAME \
                             --env JENKINS_PASSWORD=$JENKINS_BOT_PASSWORD \